@@ -7,6 +7,8 @@ import pandas as pd
 from pathlib import Path
 from datetime import datetime
 
+import mesh_aggregation
+
 # ==================== 設定 ====================
 BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / 'data'
@@ -43,6 +45,14 @@ FOOD_LAT_MAX = 34.0
 FOOD_LON_MIN = 130.0
 FOOD_LON_MAX = 131.0
 
+# メモリ節約モード（config.py の MEMORY_SAVE_MODE に従う）
+# 用途をカテゴリ型に、件数を uint16/uint32 にし、不要な列・コピーを持たない
+try:
+    from config import MEMORY_SAVE_MODE
+except ImportError:
+    MEMORY_SAVE_MODE = False
+
+
 # ==================== 出力ディレクトリ作成 ====================
 OUTPUT_DIR.mkdir(exist_ok=True)
 REPORT_DIR.mkdir(exist_ok=True)
@@ -91,7 +101,23 @@ print("🏢 [2/6] 建物データ読み込み")
 if not INPUT_BUILDING_FILE.exists():
     raise FileNotFoundError(f"❌ {INPUT_BUILDING_FILE} が見つかりません")
 
-building_gdf = gpd.read_file(INPUT_BUILDING_FILE)
+building_gdf = None
+if MEMORY_SAVE_MODE:
+    # 集計に使う列だけ読み込む（cx, cy がある場合は点ジオメトリの読み込みも省く）
+    try:
+        import pyogrio
+        fields = set(pyogrio.read_info(INPUT_BUILDING_FILE)['fields'])
+        keep = [c for c in ['usage', 'usage_ja', 'cx', 'cy'] if c in fields]
+        building_gdf = gpd.read_file(INPUT_BUILDING_FILE, engine='pyogrio', columns=keep,
+                                     read_geometry=not {'cx', 'cy'} <= fields)
+    except ImportError:
+        pass
+
+if building_gdf is None:
+    building_gdf = gpd.read_file(INPUT_BUILDING_FILE)
+    if MEMORY_SAVE_MODE:
+        keep = [c for c in ['usage', 'usage_ja', 'cx', 'cy', 'geometry'] if c in building_gdf.columns]
+        building_gdf = building_gdf[keep]
 print(f"総建物数: {len(building_gdf):,}")
 
 # usage_ja フィールドがない場合は usage コードから生成
@@ -106,8 +132,15 @@ else:
         print(f"usage_ja が空のレコード {mask.sum():,} 件を補完します")
         building_gdf.loc[mask, 'usage_ja'] = building_gdf.loc[mask, 'usage'].map(TARGET_USAGES)
 
-# 対象用途のみ抽出
-building_gdf = building_gdf[building_gdf['usage'].isin(TARGET_USAGES.keys())].copy()
+if MEMORY_SAVE_MODE:
+    # 用途はカテゴリ型（整数コード + 辞書）で持つ
+    building_gdf['usage'] = building_gdf['usage'].astype('category')
+    building_gdf['usage_ja'] = building_gdf['usage_ja'].astype('category')
+
+# 対象用途のみ抽出（メモリ節約モードではフレームのコピーを作らない）
+building_gdf = building_gdf[building_gdf['usage'].isin(TARGET_USAGES.keys())]
+if not MEMORY_SAVE_MODE:
+    building_gdf = building_gdf.copy()
 print(f"対象建物数: {len(building_gdf):,}")
 
 # 座標取得
@@ -123,16 +156,12 @@ print("🍽️  [3/6] 飲食店データ読み込み")
 if not INPUT_FOOD_FILE.exists():
     raise FileNotFoundError(f"❌ {INPUT_FOOD_FILE} が見つかりません")
 
-food = pd.read_csv(INPUT_FOOD_FILE, encoding='utf-8-sig')
-print(f"   総飲食店数: {len(food):,}")
-
-# 緯度経度の有効性確認
-food = food.dropna(subset=['緯度', '経度'])
-food = food[
-    (food['緯度'] >= FOOD_LAT_MIN) & (food['緯度'] <= FOOD_LAT_MAX) &
-    (food['経度'] >= FOOD_LON_MIN) & (food['経度'] <= FOOD_LON_MAX)
-]
-print(f"   有効飲食店数: {len(food):,}")
+# 必要な列だけを型付きで読み込み（2回目以降はキャッシュ）、緯度経度の有効性確認・重複登録の除去
+food, food_stats = mesh_aggregation.load_food(
+    INPUT_FOOD_FILE, bounds=(FOOD_LAT_MIN, FOOD_LAT_MAX, FOOD_LON_MIN, FOOD_LON_MAX)
+)
+for line in mesh_aggregation.food_stats_lines(food_stats):
+    print(f"   {line}")
 
 # GeoDataFrame化
 food_gdf = gpd.GeoDataFrame(
@@ -150,7 +179,7 @@ building_gdf_in_mesh = gpd.sjoin(building_gdf, mesh, how='inner', predicate='wit
 print(f"   結合レコード数: {len(building_gdf_in_mesh):,}")
 
 # 用途別集計
-building_counts = building_gdf_in_mesh.groupby(['mesh_code', 'usage_ja']).size().reset_index(name='count')
+building_counts = building_gdf_in_mesh.groupby(['mesh_code', 'usage_ja'], observed=True).size().reset_index(name='count')
 building_pivot = building_counts.pivot(index='mesh_code', columns='usage_ja', values='count').fillna(0)
 
 # カラム名に接頭辞を追加
@@ -172,9 +201,8 @@ print(f"✅ 飲食店集計完了: {len(food_counts):,} メッシュ\n")
 # ==================== 6. 結果統合 ====================
 print("📊 [6/6] 結果統合")
 
-# メッシュに集計結果を結合
-result = mesh.copy()
-result = result.merge(building_pivot, on='mesh_code', how='left')
+# メッシュに集計結果を結合（merge は新しいフレームを返すので mesh のコピーは不要）
+result = mesh.merge(building_pivot, on='mesh_code', how='left')
 result = result.merge(food_counts, on='mesh_code', how='left')
 
 # 欠損値を0埋め
@@ -185,9 +213,13 @@ for col in result.columns:
 # 建物総数計算
 building_cols = [col for col in result.columns if col.startswith('建物_')]
 result['建物総数'] = result[building_cols].sum(axis=1)
+if MEMORY_SAVE_MODE:
+    result = mesh_aggregation.compact_counts(result, building_cols + ['飲食店数', '建物総数'])
 
 # 建物または飲食店があるメッシュのみ保存
-result_filtered = result[(result['建物総数'] > 0) | (result['飲食店数'] > 0)].copy()
+result_filtered = result[(result['建物総数'] > 0) | (result['飲食店数'] > 0)]
+if not MEMORY_SAVE_MODE:
+    result_filtered = result_filtered.copy()
 
 # 中心座標追加
 result_filtered['中心_経度'] = result_filtered.geometry.centroid.x
@@ -9,8 +9,11 @@ k=4,5,6,7 で同条件で繰り返し実行
 # ===============================
 K_LIST = [4, 5, 6, 7, 8, 9]
 
+import argparse
+import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import pandas as pd
@@ -19,6 +22,8 @@ import geopandas as gpd
 import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
+from matplotlib.colors import to_rgb
+from matplotlib.patches import Patch
 
 # japanize_matplotlib（日本語表示）
 try:
@@ -31,6 +36,12 @@ except ImportError:
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 
+import cluster_model
+import cluster_naming
+import mesh_aggregation
+import mesh_grid
+import regionalization
+
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -43,6 +54,12 @@ except ImportError:
 
 plt.rcParams['figure.figsize'] = config.FIGURE_SIZE
 
+# クラスタリング手法（config.CLUSTER_METHOD）
+CLUSTER_METHODS = {
+    'kmeans': 'K-means',
+    'ward_contiguous': '連続地域区分（連結制約付き Ward 法）',
+}
+
 
 def print_section(title):
     """セクションタイトルを表示"""
@@ -67,6 +84,11 @@ def load_data():
     print(f"  GeoJSONを読み込み中: {config.OUTPUT_MESH_RESULT_GEOJSON}")
     result_gdf = gpd.read_file(config.OUTPUT_MESH_RESULT_GEOJSON)
 
+    if config.MEMORY_SAVE_MODE:
+        result_df = mesh_aggregation.compact_counts(result_df)
+        print(f"  ✓ メモリ節約モード: 件数列を符号なし整数型に変換 "
+              f"({result_df.memory_usage(deep=True).sum() / 1024 / 1024:.1f} MB)")
+
     print(f"\n  ✓ メッシュ数: {len(result_df):,}")
     print(f"  ✓ カラム数: {len(result_df.columns)}")
 
@@ -84,52 +106,164 @@ def create_features(result_df: pd.DataFrame):
     """
     print_section("2. 特徴量エンジニアリング")
 
+    print("  建物用途比率・飲食店密度を計算中...")
+    feature_cols = add_count_features(result_df)
+
+    # 追加特徴量（別ステージの出力CSV）
+    result_df, optional_cols = attach_optional_features(result_df)
+    feature_cols += optional_cols
+
+    # 空間ラグ（近傍メッシュの平均・距離減衰和）
+    if config.SPATIAL_LAG_ENABLED:
+        print("  空間ラグ特徴量を計算中...")
+        feature_cols += add_spatial_lag_features(result_df)
+
+    if config.MEMORY_SAVE_MODE:
+        result_df[feature_cols] = result_df[feature_cols].astype(np.float32)
+
+    print(f"\n  ✓ 作成された特徴量: {len(feature_cols)}個")
+    for feat in feature_cols:
+        print(f"    - {feat}")
+
+    return result_df, feature_cols
+
+
+def add_count_features(result_df: pd.DataFrame):
+    """
+    件数列から求める特徴量を追加（各用途の比率、飲食店密度、建物総数の対数）
+    メッシュごとに閉じた計算なので、シナリオ分析（scenario.py）で一部のメッシュだけ再計算するのにも使う
+    """
     feature_cols = []
 
     # 各用途の比率を計算（9用途対応）
-    print("  建物用途比率を計算中...")
-    for col in result_df.columns:
-        if col.startswith('建物_'):
-            ratio_col = col + '_比率'
-            result_df[ratio_col] = result_df[col] / (result_df['建物総数'] + 1e-6)
-            feature_cols.append(ratio_col)
+    for col in [c for c in result_df.columns if c.startswith('建物_') and not c.endswith('_比率')]:
+        ratio_col = col + '_比率'
+        result_df[ratio_col] = result_df[col] / (result_df['建物総数'] + 1e-6)
+        feature_cols.append(ratio_col)
 
     # 飲食店密度
-    print("  飲食店密度を計算中...")
     result_df['飲食店密度'] = result_df['飲食店数'] / (result_df['建物総数'] + 1e-6)
     feature_cols.append('飲食店密度')
 
     # 建物総数（対数変換）
     result_df['建物総数_log'] = np.log1p(result_df['建物総数'])
     feature_cols.append('建物総数_log')
+    return feature_cols
 
-    print(f"\n  ✓ 作成された特徴量: {len(feature_cols)}個")
-    for feat in feature_cols:
-        print(f"    - {feat}")
+
+def attach_optional_features(result_df: pd.DataFrame, names=None):
+    """
+    config.OPTIONAL_FEATURE_SETS のうち有効なメッシュ別属性CSVを mesh_code で結合
+    log1p=True のセットは対数変換した列を特徴量にする。prefix を指定したセットはその接頭辞の列のみ使う
+    names を渡すと enabled に関係なくそのセットだけを結合する（特徴量セットの比較用）
+    """
+    feature_cols = []
+    for name, spec in config.OPTIONAL_FEATURE_SETS.items():
+        selected = spec.get('enabled') if names is None else name in names
+        if not selected:
+            continue
+        path = Path(spec['path'])
+        if not path.exists():
+            print(f"  ⚠️ 追加特徴量 {name} のファイルが見つかりません: {path}")
+            continue
+
+        print(f"  追加特徴量を結合中: {name}")
+        attr = pd.read_csv(path, encoding='utf-8-sig')
+        attr['mesh_code'] = attr['mesh_code'].astype(result_df['mesh_code'].dtype)
+        value_cols = [c for c in attr.columns if c != 'mesh_code' and c not in result_df.columns
+                      and c.startswith(spec.get('prefix', ''))]
+        result_df = result_df.merge(attr[['mesh_code'] + value_cols], on='mesh_code', how='left')
+
+        for col in value_cols:
+            if not pd.api.types.is_numeric_dtype(result_df[col]):
+                continue
+            result_df[col] = result_df[col].fillna(0)
+            if spec.get('log1p'):
+                result_df[col + '_log'] = np.log1p(result_df[col])
+                feature_cols.append(col + '_log')
+            else:
+                feature_cols.append(col)
 
     return result_df, feature_cols
 
 
-def perform_clustering(result_df: pd.DataFrame, feature_cols, n_clusters: int):
-    """K-meansクラスタリングを実行"""
+def add_spatial_lag_features(result_df: pd.DataFrame):
+    """空間ラグ特徴量を追加（進捗表示付き）"""
+    start_time = time.time()
+    lag_cols = compute_spatial_lags(result_df)
+    elapsed = time.time() - start_time
+    print(f"  ✓ 空間ラグ特徴量: {len(lag_cols)}個 ({elapsed:.1f}秒)")
+    return lag_cols
+
+
+def compute_spatial_lags(result_df: pd.DataFrame, lat0: float = None):
+    """
+    メッシュコードの行・列から疎な隣接行列を作り、空間ラグ特徴量を追加
+    - {列}_近傍平均3x3 / 5x5: 自メッシュを含む近傍メッシュの平均
+    - {列}_減衰和_log: exp(-距離/帯域幅) で重み付けした近傍合計（対数変換）
+    lat0 は距離減衰の m 換算に使う基準緯度（省略時は全メッシュ中心の平均）
+    """
+    row, col = mesh_grid.decode_mesh_code(result_df['mesh_code'].values)
+    index = mesh_grid.MeshGridIndex(row, col)
+
+    lag_cols = []
+    for radius in config.SPATIAL_LAG_RADII:
+        W = mesh_grid.build_adjacency(row, col, radius=radius, include_self=True, index=index)
+        W = mesh_grid.row_standardize(W)
+        size = 2 * radius + 1
+        for src in config.SPATIAL_LAG_SOURCES:
+            if src not in result_df.columns:
+                continue
+            lag_col = f'{src}_近傍平均{size}x{size}'
+            result_df[lag_col] = W @ result_df[src].fillna(0).values
+            lag_cols.append(lag_col)
+
+    W_decay = mesh_grid.build_adjacency(
+        row, col, radius=config.SPATIAL_DECAY_RADIUS, include_self=True,
+        decay_m=config.SPATIAL_DECAY_BANDWIDTH_M, lat0=lat0, index=index
+    )
+    for src in config.SPATIAL_DECAY_SOURCES:
+        if src not in result_df.columns:
+            continue
+        lag_col = f'{src}_減衰和_log'
+        result_df[lag_col] = np.log1p(W_decay @ result_df[src].fillna(0).values)
+        lag_cols.append(lag_col)
+    return lag_cols
+
+
+def perform_clustering(result_df: pd.DataFrame, feature_cols, n_clusters: int,
+                       region_tree: regionalization.RegionTree = None):
+    """
+    クラスタリングを実行
+    region_tree を渡すと K-means の代わりに連続地域区分（連結制約付き Ward 法の併合木の切断）を使う
+    """
     print_section(f"3. クラスタリング実行（k={n_clusters}）")
 
-    X = result_df[feature_cols].fillna(0).values
+    # メモリ節約モードでは float32 のまま標準化・K-means を行う
+    dtype = np.float32 if config.MEMORY_SAVE_MODE else np.float64
+    X = result_df[feature_cols].fillna(0).to_numpy(dtype=dtype)
 
     print("  特徴量を標準化中...")
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
 
-    print(f"  K-means実行中（k={n_clusters}）...")
     start_time = time.time()
-
-    kmeans = KMeans(
-        n_clusters=n_clusters,
-        random_state=config.RANDOM_STATE,
-        n_init=config.KMEANS_N_INIT
-    )
-    result_df = result_df.copy()
-    result_df['cluster'] = kmeans.fit_predict(X_scaled)
+    if region_tree is None:
+        print(f"  K-means実行中（k={n_clusters}）...")
+        kmeans = KMeans(
+            n_clusters=n_clusters,
+            random_state=config.RANDOM_STATE,
+            n_init=config.KMEANS_N_INIT
+        )
+        labels = kmeans.fit_predict(X_scaled)
+    else:
+        print(f"  連続地域区分を切り出し中（k={n_clusters}）...")
+        kmeans = None
+        labels = region_tree.labels(n_clusters)
+    # メモリ節約モードではフレームをコピーせず列の代入で上書きする（k ごとに置き換わる）
+    if not config.MEMORY_SAVE_MODE:
+        result_df = result_df.copy()
+    result_df['cluster'] = labels.astype(np.int16) if config.MEMORY_SAVE_MODE else labels
 
     elapsed = time.time() - start_time
     print(f"  ✓ クラスタリング完了 ({elapsed:.1f}秒)")
@@ -140,7 +274,7 @@ def perform_clustering(result_df: pd.DataFrame, feature_cols, n_clusters: int):
         pct = (count / len(result_df)) * 100
         print(f"    クラスタ{cluster_id}: {count:,}メッシュ ({pct:.1f}%)")
 
-    return result_df, kmeans
+    return result_df, kmeans, scaler, X_scaled
 
 
 def analyze_clusters(result_df: pd.DataFrame, n_clusters: int):
@@ -175,95 +309,24 @@ def analyze_clusters(result_df: pd.DataFrame, n_clusters: int):
     return cluster_df
 
 
-# 命名ロジック（追加用途対応）
-def self_assign_name(row, ratio_cols):
+def assign_cluster_names(result_df: pd.DataFrame, cluster_df: pd.DataFrame, n_clusters: int):
     """
-    改良版：用途支配 + 住宅合算 + 低建物数の例外処理
-    row: cluster_df の1行（Series）
-    ratio_cols: '平均◯◯比率' の列名リスト
+    クラスタに名前を付ける（cluster_naming のルール表を使用）
+    用途比率の集計方法は config.NAMING_RATIO_METHOD（prepare_web_data.py と共通）
+    各メッシュにも同じ規則でメッシュ類型を付ける
     """
-
-    # 平均建物総数が極端に小さいクラスタは先に隔離（例：クラスタ6対策）
-    if '平均建物総数' in row and row['平均建物総数'] < 1:
-        # 飲食が極端に大きい等の異常も拾える
-        if '平均飲食店数' in row and row['平均飲食店数'] > 50:
-            return '要確認（建物0/飲食突出）'
-        return '低密度地域'
-
-    # 比率を辞書化（例：平均住宅比率 → 住宅）
-    ratios = {}
-    for col in ratio_cols:
-        usage = col.replace('平均', '').replace('比率', '')
-        ratios[usage] = float(row[col])
-
-    # まずは単独支配（優先順位は用途解釈として自然な順に）
-    if ratios.get('商業系複合施設', 0) >= 0.6:
-        return '複合商業地域'
-    if ratios.get('宿泊施設', 0) >= 0.5:
-        return '宿泊施設地域'
-    if ratios.get('文教厚生施設', 0) >= 0.5:
-        return '文教施設地域'
-    if ratios.get('官公庁施設', 0) >= 0.5:
-        return '官公庁施設地域'
-    if ratios.get('業務施設', 0) >= 0.4:
-        return '業務地域'
-    if ratios.get('商業施設', 0) >= 0.5:
-        # 商業は上位関数でも見るが、ここでも安全弁
-        return '商業集積地域'
-
-    # 住宅系：合算で拾う（クラスタ5対策）
-    res_sum = ratios.get('住宅', 0) + ratios.get('共同住宅', 0)
-    if res_sum >= 0.6:
-        # 戸建寄り／集合寄りを分ける
-        if ratios.get('住宅', 0) >= 0.6:
-            return '戸建住宅地域'
-        if ratios.get('共同住宅', 0) >= 0.4:
-            return '集合住宅地域'
-        return '住宅混合地域（戸建＋集合）'
-
-    # 併用住宅
-    if ratios.get('店舗等併用共同住宅', 0) >= 0.2:
-        return '店舗併用集合住宅地域'
-    if ratios.get('店舗等併用住宅', 0) >= 0.2:
-        return '店舗併用住宅地域'
-
-    # 商業混在（商業比率が中程度）
-    if ratios.get('商業施設', 0) >= 0.1:
-        return '商業混在地域'
-
-    return '混合地域'
-
-
-def assign_cluster_names(result_df: pd.DataFrame, cluster_df: pd.DataFrame, n_clusters: int):
-    """クラスタに名前を付ける（元のロジックを維持、追加用途対応）"""
     print_section("5. クラスタ命名")
 
-    cluster_names = {}
-
-    for _, row in cluster_df.iterrows():
-        cluster_id = int(row['クラスタID'])
-
-        ratio_cols = [c for c in row.index if c.endswith('比率')]
-
-        # 商業施設の比率チェック
-        if any('商業施設' in c for c in ratio_cols):
-            com_ratio = row[[c for c in ratio_cols if '商業施設' in c][0]]
-            if com_ratio > 0.5:
-                if row['平均飲食店数'] > 100:
-                    name = '超高密度商業地域'
-                else:
-                    name = '商業集積地域'
-            elif com_ratio > 0.1:
-                name = '商業混在地域'
-            else:
-                name = self_assign_name(row, ratio_cols)
-        else:
-            name = self_assign_name(row, ratio_cols)
+    named = cluster_naming.name_clusters(result_df, 'cluster', config.NAMING_RATIO_METHOD)
+    cluster_names = {cid: name for cid, (name, _) in named.items()}
 
-        cluster_names[cluster_id] = name
-
-    result_df = result_df.copy()
+    if not config.MEMORY_SAVE_MODE:
+        result_df = result_df.copy()
     result_df['cluster_name'] = result_df['cluster'].map(cluster_names)
+    result_df['メッシュ類型'], _ = cluster_naming.label_meshes(result_df)
+    if config.MEMORY_SAVE_MODE:
+        result_df['cluster_name'] = result_df['cluster_name'].astype('category')
+        result_df['メッシュ類型'] = result_df['メッシュ類型'].astype('category')
 
     print("\n  クラスタ名:")
     for cid, cname in cluster_names.items():
@@ -273,38 +336,87 @@ def assign_cluster_names(result_df: pd.DataFrame, cluster_df: pd.DataFrame, n_cl
     return result_df, cluster_names
 
 
+SCATTER_FEATURES = [
+    ('建物総数', '飲食店数'),
+    ('建物_住宅_比率', '建物_共同住宅_比率'),
+    ('建物_商業施設_比率', '飲食店密度'),
+    ('建物_文教厚生施設_比率', '建物_官公庁施設_比率')
+]
+
+
+def density_image(x: np.ndarray, y: np.ndarray, labels: np.ndarray, colors, bins: int,
+                  x_range, y_range) -> np.ndarray:
+    """
+    点をクラスタ別の2次元ヒストグラムに集計し、画素ごとにクラスタ色を件数で加重平均した RGBA 画像を作る
+    不透明度は件数の対数で付ける（計算量は点数に比例し、描画は画素数のみに依存）
+    """
+    n_clusters = len(colors)
+    x0, x1 = x_range
+    y0, y1 = y_range
+    ix = np.clip(((x - x0) / max(x1 - x0, 1e-12) * bins).astype(np.int64), 0, bins - 1)
+    iy = np.clip(((y - y0) / max(y1 - y0, 1e-12) * bins).astype(np.int64), 0, bins - 1)
+
+    counts = np.bincount(labels.astype(np.int64) * bins * bins + iy * bins + ix,
+                         minlength=n_clusters * bins * bins).reshape(n_clusters, bins, bins)
+    total = counts.sum(axis=0)
+
+    rgb = np.tensordot(np.asarray(colors, dtype=np.float64), counts, axes=([0], [0]))  # (3, bins, bins)
+    rgb = np.divide(rgb, total, out=np.ones_like(rgb), where=total > 0)
+
+    alpha = np.log1p(total) / np.log1p(max(total.max(), 1))
+    alpha = np.where(total > 0, 0.25 + 0.75 * alpha, 0.0)
+    return np.dstack([rgb[0], rgb[1], rgb[2], alpha])
+
+
+def scatter_mode(n_points: int) -> str:
+    """config.SCATTER_MODE に従い 'points' / 'density' を決める（'auto' はメッシュ数で切り替え）"""
+    if config.SCATTER_MODE == 'auto':
+        return 'density' if n_points > config.SCATTER_DENSITY_THRESHOLD else 'points'
+    return config.SCATTER_MODE
+
+
 def create_scatter_plots(result_df: pd.DataFrame, cluster_names: dict, n_clusters: int, out_dir: Path):
-    """散布図マトリックスを作成"""
+    """散布図マトリックスを作成（メッシュ数が多い場合は密度画像で描画）"""
     fig, axes = plt.subplots(2, 2, figsize=config.FIGURE_SIZE)
+    mode = scatter_mode(len(result_df))
+    colors = [config.SCATTER_COLORS[i % len(config.SCATTER_COLORS)] for i in range(n_clusters)]
+    labels = result_df['cluster'].to_numpy()
 
-    scatter_features = [
-        ('建物総数', '飲食店数'),
-        ('建物_住宅_比率', '建物_共同住宅_比率'),
-        ('建物_商業施設_比率', '飲食店密度'),
-        ('建物_文教厚生施設_比率', '建物_官公庁施設_比率')
-    ]
-
-    for idx, (feat1, feat2) in enumerate(scatter_features):
+    for idx, (feat1, feat2) in enumerate(SCATTER_FEATURES):
         if feat1 not in result_df.columns or feat2 not in result_df.columns:
             continue
 
         ax = axes[idx // 2, idx % 2]
 
-        for cluster_id in range(n_clusters):
-            cluster_data = result_df[result_df['cluster'] == cluster_id]
-            ax.scatter(
-                cluster_data[feat1],
-                cluster_data[feat2],
-                alpha=0.5,
-                s=20,
-                c=config.SCATTER_COLORS[cluster_id % len(config.SCATTER_COLORS)],
-                label=f'C{cluster_id}: {cluster_names.get(cluster_id, "")}'
-            )
+        if mode == 'density':
+            x = result_df[feat1].to_numpy(dtype=np.float64)
+            y = result_df[feat2].to_numpy(dtype=np.float64)
+            x_range = (np.nanmin(x), np.nanmax(x))
+            y_range = (np.nanmin(y), np.nanmax(y))
+            valid = np.isfinite(x) & np.isfinite(y)
+            image = density_image(x[valid], y[valid], labels[valid], [to_rgb(c) for c in colors],
+                                  config.SCATTER_BINS, x_range, y_range)
+            ax.imshow(image, origin='lower', aspect='auto', interpolation='nearest',
+                      extent=(x_range[0], x_range[1], y_range[0], y_range[1]))
+            handles = [Patch(color=colors[cid], label=f'C{cid}: {cluster_names.get(cid, "")}')
+                       for cid in range(n_clusters)]
+            ax.legend(handles=handles, fontsize=7, loc='best')
+        else:
+            for cluster_id in range(n_clusters):
+                cluster_data = result_df[result_df['cluster'] == cluster_id]
+                ax.scatter(
+                    cluster_data[feat1],
+                    cluster_data[feat2],
+                    alpha=0.5,
+                    s=20,
+                    c=colors[cluster_id],
+                    label=f'C{cluster_id}: {cluster_names.get(cluster_id, "")}'
+                )
+            ax.legend(fontsize=7, loc='best')
 
         ax.set_xlabel(feat1.replace('建物_', '').replace('_', ' '))
         ax.set_ylabel(feat2.replace('建物_', '').replace('_', ' '))
         ax.set_title(f'{feat1} vs {feat2}', fontsize=12, fontweight='bold')
-        ax.legend(fontsize=7, loc='best')
         if config.SHOW_GRID:
             ax.grid(alpha=config.GRID_ALPHA)
 
@@ -312,7 +424,7 @@ def create_scatter_plots(result_df: pd.DataFrame, cluster_names: dict, n_cluster
     output_path = out_dir / 'cluster_scatter.png'
     plt.savefig(output_path, dpi=config.FIGURE_DPI, bbox_inches='tight')
     plt.close()
-    print(f"  ✓ {output_path}")
+    print(f"  ✓ {output_path}（{'密度' if mode == 'density' else '散布'}表示）")
 
 
 def create_maps(result_df: pd.DataFrame, n_clusters: int, out_dir: Path):
@@ -440,7 +552,8 @@ def create_cluster_report(result_df: pd.DataFrame, cluster_df: pd.DataFrame, clu
     report.append(f"- 分析メッシュ数: {len(result_df):,}")
     report.append(f"- 総建物数: {result_df['建物総数'].sum():,.0f}")
     report.append(f"- 総飲食店数: {result_df['飲食店数'].sum():,.0f}")
-    report.append(f"- クラスタ数: {n_clusters}\n")
+    report.append(f"- クラスタ数: {n_clusters}")
+    report.append(f"- 手法: {CLUSTER_METHODS.get(config.CLUSTER_METHOD, config.CLUSTER_METHOD)}\n")
 
     report.append("## 2. クラスタ別特徴\n")
 
@@ -518,9 +631,10 @@ def save_results(result_df: pd.DataFrame, base_gdf: gpd.GeoDataFrame, cluster_df
     report_dir.mkdir(parents=True, exist_ok=True)
 
     # GeoDataFrameにクラスタ情報を追加
-    result_gdf = base_gdf.copy()
+    result_gdf = base_gdf if config.MEMORY_SAVE_MODE else base_gdf.copy()
     result_gdf['cluster'] = result_df['cluster'].values
     result_gdf['cluster_name'] = result_df['cluster_name'].values
+    result_gdf['メッシュ類型'] = result_df['メッシュ類型'].values
 
     geojson_path = out_dir / 'mesh_with_clusters.geojson'
     csv_path = out_dir / 'mesh_with_clusters.csv'
@@ -537,19 +651,62 @@ def save_results(result_df: pd.DataFrame, base_gdf: gpd.GeoDataFrame, cluster_df
     create_cluster_report(result_df, cluster_df, cluster_names, n_clusters, report_dir)
 
 
-def run_for_k(base_df: pd.DataFrame, base_gdf: gpd.GeoDataFrame, feature_cols, n_clusters: int):
-    """kを固定して一連の処理を実行"""
-    df_k, _ = perform_clustering(base_df, feature_cols, n_clusters)
+def _plot_frame(df_k: pd.DataFrame) -> pd.DataFrame:
+    """可視化に必要な列だけを取り出したコピー（別プロセスへ渡す用）"""
+    needed = {'cluster', '飲食店数'} | {c for pair in SCATTER_FEATURES for c in pair}
+    return df_k[[c for c in df_k.columns if c in needed]].copy()
+
+
+def build_region_tree(result_df: pd.DataFrame, feature_cols) -> regionalization.RegionTree:
+    """連続地域区分の併合木を作成（全 k で共有する）"""
+    print_section("3. 連続地域区分の併合木（連結制約付き Ward 法）")
+    dtype = np.float32 if config.MEMORY_SAVE_MODE else np.float64
+    X_scaled = StandardScaler().fit_transform(result_df[feature_cols].fillna(0).to_numpy(dtype=dtype))
+    return regionalization.build_region_tree(X_scaled, result_df['mesh_code'].values)
+
+
+def run_for_k(base_df: pd.DataFrame, base_gdf: gpd.GeoDataFrame, feature_cols, n_clusters: int,
+              executor: ProcessPoolExecutor = None, region_tree: regionalization.RegionTree = None):
+    """
+    kを固定して一連の処理を実行
+    executor を渡すと可視化を別プロセスに投入し、その Future を返す
+    region_tree を渡すと K-means の代わりに連続地域区分を使う
+    """
+    df_k, kmeans, scaler, X_scaled = perform_clustering(base_df, feature_cols, n_clusters, region_tree)
     cluster_df = analyze_clusters(df_k, n_clusters)
     df_k, cluster_names = assign_cluster_names(df_k, cluster_df, n_clusters)
 
     out_dir = Path(config.OUTPUT_DIR) / f'k{n_clusters:02d}'
 
-    create_visualizations(df_k, cluster_df, cluster_names, n_clusters, out_dir)
+    # 類似メッシュ検索・再予測用にモデルと標準化済み特徴量を保存
+    centroids = None
+    if kmeans is None:
+        centroids = regionalization.region_centroids(X_scaled, df_k['cluster'].to_numpy(np.int64), n_clusters)
+    model_path, matrix_path = cluster_model.save_model(
+        out_dir, scaler, kmeans, feature_cols, df_k['mesh_code'].values, X_scaled, df_k['cluster'].values,
+        method=config.CLUSTER_METHOD, centroids=centroids
+    )
+    print(f"  ✓ {model_path}")
+    print(f"  ✓ {matrix_path}")
+
+    future = None
+    if executor is not None:
+        # メモリ節約モードでは df_k が次の k で上書きされるため、必要な列のコピーを渡す
+        future = executor.submit(create_visualizations, _plot_frame(df_k), cluster_df,
+                                 cluster_names, n_clusters, out_dir)
+    else:
+        create_visualizations(df_k, cluster_df, cluster_names, n_clusters, out_dir)
     save_results(df_k, base_gdf, cluster_df, cluster_names, n_clusters, out_dir)
+    return future
 
 
 def main():
+    parser = argparse.ArgumentParser(description='ステップ2: クラスタリング分析')
+    parser.add_argument('--preview', action='store_true',
+                        help='層化抽出したメッシュだけを集計・学習する近似プレビュー（ステップ1不要。図・GeoJSON は作らない）')
+    parser.add_argument('--fraction', type=float, default=None, help='プレビューの抽出率（config.PREVIEW_SAMPLE_FRACTION）')
+    args = parser.parse_args()
+
     start_time = time.time()
 
     k_list = K_LIST
@@ -557,14 +714,37 @@ def main():
     print("=" * 60)
     print("福岡市・北九州市 クラスタリング分析（追加用途対応版）")
     print(f"対象k: {k_list}")
+    print(f"手法: {CLUSTER_METHODS.get(config.CLUSTER_METHOD, config.CLUSTER_METHOD)}")
     print("=" * 60)
 
     try:
+        if config.CLUSTER_METHOD not in CLUSTER_METHODS:
+            raise ValueError(f"CLUSTER_METHOD は {list(CLUSTER_METHODS)} のいずれかを指定してください: {config.CLUSTER_METHOD}")
+
+        if args.preview:
+            import preview
+            preview.run_preview(k_list, args.fraction)
+            print_section("処理完了")
+            print(f"  総処理時間: {time.time() - start_time:.1f}秒")
+            print(f"  プレビュー結果: {config.PREVIEW_DIR}")
+            return
+
         result_df, result_gdf = load_data()
         result_df, feature_cols = create_features(result_df)
-
-        for k in k_list:
-            run_for_k(result_df, result_gdf, feature_cols, k)
+        region_tree = None
+        if config.CLUSTER_METHOD == 'ward_contiguous':
+            region_tree = build_region_tree(result_df, feature_cols)
+
+        # 可視化（図の描画）は k ごとに別プロセスで並列実行する
+        plot_workers = config.PLOT_WORKERS or min(len(k_list), os.cpu_count() or 1)
+        if plot_workers > 1:
+            with ProcessPoolExecutor(max_workers=plot_workers) as executor:
+                futures = [run_for_k(result_df, result_gdf, feature_cols, k, executor, region_tree) for k in k_list]
+                for future in futures:
+                    future.result()
+        else:
+            for k in k_list:
+                run_for_k(result_df, result_gdf, feature_cols, k, region_tree=region_tree)
 
         elapsed = time.time() - start_time
         print_section("処理完了")
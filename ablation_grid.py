@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+特徴量セットの比較（アブレーション）グリッド
+config.ABLATION_* の 特徴量セット × 標準化方法 × k × 手法 の組み合わせでクラスタリングし、
+品質指標（シルエット係数・Calinski-Harabasz・Davies-Bouldin・隣接一致率）と実行時間を1つの表にまとめる
+- 特徴量行列は (特徴量セット, 標準化方法) ごとに1回だけ作り、float32 の .npy として保存する
+  （キーは列構成・標準化方法・入力ファイルのサイズと更新時刻から作るので、入力が変わらなければ次回も再利用する）
+- 各組み合わせはプロセスプールで実行し、ワーカーからは読み取り専用のメモリマップで行列を共有する
+- 結果表（results.csv）に同じキーの行がある組み合わせは計算しない
+
+使い方:
+    python ablation_grid.py [--workers 4] [--force]
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_score
+from sklearn.preprocessing import MinMaxScaler, RobustScaler, StandardScaler
+from threadpoolctl import threadpool_limits
+
+import mesh_grid
+import regionalization
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+# 標準化方法（None は標準化しない）
+SCALERS = {
+    'standard': StandardScaler,
+    'robust': RobustScaler,
+    'minmax': MinMaxScaler,
+    'none': None,
+}
+
+# ステップ2の特徴量のまとまり（OPTIONAL_FEATURE_SETS の名前もそのまま指定できる）
+BASE_GROUPS = ('ratios', 'density', 'size', 'lags')
+
+RESULT_COLUMNS = ['feature_set', 'scaler', 'method', 'k', '特徴量数', 'メッシュ数', 'シルエット係数',
+                  'Calinski_Harabasz', 'Davies_Bouldin', '隣接一致率', '最小クラスタ比率', '実行秒', 'matrix_key',
+                  '実行日時']
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+def file_signature(path) -> dict:
+    """入力ファイルの同一性（パス・サイズ・更新時刻）"""
+    path = Path(path)
+    if not path.exists():
+        return {'path': str(path), 'missing': True}
+    stat = path.stat()
+    return {'path': path.name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# ==================== 特徴量行列 ====================
+
+def needed_groups() -> set:
+    """config.ABLATION_FEATURE_SETS で使われている特徴量のまとまり"""
+    return {g for groups in config.ABLATION_FEATURE_SETS.values() for g in groups}
+
+
+def build_feature_groups(stage2) -> tuple:
+    """
+    ステップ2と同じ関数で全ての特徴量を作り、まとまりごとの列名を返す
+    戻り値: (特徴量の表, {まとまり名: [列名]})
+    """
+    df = pd.read_csv(config.OUTPUT_MESH_RESULT_CSV, encoding='utf-8-sig')
+    count_cols = stage2.add_count_features(df)
+    groups = {
+        'ratios': [c for c in count_cols if c.endswith('_比率')],
+        'density': ['飲食店密度'],
+        'size': ['建物総数_log'],
+    }
+
+    needed = needed_groups()
+    for name in config.OPTIONAL_FEATURE_SETS:
+        if name in needed:
+            df, groups[name] = stage2.attach_optional_features(df, names=[name])
+    if 'lags' in needed:
+        groups['lags'] = stage2.compute_spatial_lags(df)
+    return df.reset_index(drop=True), groups
+
+
+def set_columns(feature_set: str, groups: dict):
+    """
+    特徴量セット → 列名（まとまりの順）
+    列が1つも無いまとまりを含むセットは None（他のセットと同じ列構成になり結果が重複するため）
+    """
+    cols = []
+    empty = []
+    for group in config.ABLATION_FEATURE_SETS[feature_set]:
+        if group not in groups:
+            raise ValueError(f"特徴量セット {feature_set} のまとまり {group} を作成できません"
+                             f"（{list(BASE_GROUPS)} または OPTIONAL_FEATURE_SETS の名前を指定してください）")
+        if not groups[group]:
+            empty.append(group)
+        cols += [c for c in groups[group] if c not in cols]
+    if empty:
+        print(f"  ⚠️ {feature_set}: {', '.join(empty)} の列が無いためスキップ（入力ファイルを確認してください）")
+        return None
+    return cols
+
+
+def matrix_key(columns: list, scaler: str, inputs: list) -> str:
+    """列構成・標準化方法・入力ファイルから行列のキーを作る"""
+    spec = {'columns': columns, 'scaler': scaler, 'inputs': inputs,
+            'lag': [config.SPATIAL_LAG_SOURCES, config.SPATIAL_LAG_RADII, config.SPATIAL_DECAY_SOURCES,
+                    config.SPATIAL_DECAY_RADIUS, config.SPATIAL_DECAY_BANDWIDTH_M]}
+    return hashlib.sha256(json.dumps(spec, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def save_matrix(df: pd.DataFrame, columns: list, scaler: str, path: Path):
+    """特徴量行列を標準化して float32 の .npy に保存（一時ファイル経由で置き換え）"""
+    X = df[columns].fillna(0).to_numpy(dtype=np.float64)
+    if SCALERS[scaler] is not None:
+        X = SCALERS[scaler]().fit_transform(X)
+    tmp_path = path.with_name(path.stem + '.tmp.npy')
+    np.save(tmp_path, np.ascontiguousarray(X, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+# ==================== ワーカー ====================
+
+def quality_metrics(X: np.ndarray, labels: np.ndarray, rook_pairs: tuple, n_clusters: int) -> dict:
+    """クラスタリング品質指標（シルエット係数は標本抽出）"""
+    n = len(labels)
+    metrics = {'シルエット係数': np.nan, 'Calinski_Harabasz': np.nan, 'Davies_Bouldin': np.nan}
+    if len(np.unique(labels)) > 1:
+        sample = min(config.ABLATION_SILHOUETTE_SAMPLE, n)
+        metrics['シルエット係数'] = float(silhouette_score(X, labels, sample_size=sample,
+                                                     random_state=config.RANDOM_STATE))
+        metrics['Calinski_Harabasz'] = float(calinski_harabasz_score(X, labels))
+        metrics['Davies_Bouldin'] = float(davies_bouldin_score(X, labels))
+    src, dst = rook_pairs
+    metrics['隣接一致率'] = float((labels[src] == labels[dst]).mean()) if len(src) else np.nan
+    metrics['最小クラスタ比率'] = float(np.bincount(labels, minlength=n_clusters).min() / n)
+    return metrics
+
+
+def run_combination(matrix_path: str, mesh_codes_path: str, method: str, k_list: list) -> list:
+    """
+    1つの行列・手法について k ごとにクラスタリングして指標を返す（ワーカープロセスで実行）
+    連続地域区分は併合木を1回だけ作り、k ごとに切断する
+    """
+    X = np.load(matrix_path, mmap_mode='r')
+    mesh_codes = np.load(mesh_codes_path)
+    row, col = mesh_grid.decode_mesh_code(mesh_codes)
+    W = mesh_grid.build_adjacency(row, col, radius=1, kind='rook').tocoo()
+    upper = W.row < W.col
+    rook_pairs = (W.row[upper], W.col[upper])
+
+    results = []
+    # プロセス並列と BLAS/OpenMP のスレッド並列が重ならないように1スレッドに制限
+    with threadpool_limits(limits=1):
+        tree, tree_seconds = None, 0.0
+        if method == 'ward_contiguous':
+            start_time = time.time()
+            connectivity, _ = regionalization.contiguity_graph(mesh_codes)
+            tree = regionalization.RegionTree.fit(np.asarray(X), connectivity)
+            tree_seconds = time.time() - start_time
+
+        for k in k_list:
+            start_time = time.time()
+            if tree is None:
+                labels = KMeans(n_clusters=k, random_state=config.RANDOM_STATE,
+                                n_init=config.KMEANS_N_INIT).fit_predict(X)
+            else:
+                labels = tree.labels(k)
+            # 併合木の計算時間は k の数で按分する
+            elapsed = time.time() - start_time + tree_seconds / len(k_list)
+            metrics = quality_metrics(X, np.asarray(labels, dtype=np.int64), rook_pairs, k)
+            results.append({'k': k, '実行秒': elapsed, **metrics})
+    return results
+
+
+# ==================== 実行 ====================
+
+def load_results(path: Path) -> pd.DataFrame:
+    if path.exists():
+        return pd.read_csv(path, encoding='utf-8-sig', dtype={'matrix_key': str})
+    return pd.DataFrame(columns=RESULT_COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='特徴量セット × 標準化 × k × 手法 の比較グリッド')
+    parser.add_argument('--workers', type=int, default=config.ABLATION_WORKERS, help='ワーカープロセス数')
+    parser.add_argument('--force', action='store_true', help='計算済みの組み合わせもやり直す')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    workers = args.workers or os.cpu_count() or 1
+    out_dir = Path(config.ABLATION_DIR)
+    matrix_dir = out_dir / 'matrices'
+    results_path = out_dir / 'results.csv'
+
+    print("=" * 60)
+    print("特徴量セットの比較グリッド")
+    print(f"特徴量セット: {list(config.ABLATION_FEATURE_SETS)}")
+    print(f"標準化: {config.ABLATION_SCALERS}, k: {config.ABLATION_K}, 手法: {config.ABLATION_METHODS}")
+    print("=" * 60)
+
+    try:
+        unknown = [s for s in config.ABLATION_SCALERS if s not in SCALERS]
+        unknown += [m for m in config.ABLATION_METHODS if m not in ('kmeans', 'ward_contiguous')]
+        if unknown:
+            raise ValueError(f"未対応の標準化方法・手法: {unknown}")
+        if not Path(config.OUTPUT_MESH_RESULT_CSV).exists():
+            raise FileNotFoundError(
+                f"集計結果が見つかりません: {config.OUTPUT_MESH_RESULT_CSV}\n"
+                "先に 1_mesh_analysis.py を実行してください"
+            )
+
+        print_section("1. 特徴量行列の作成（キャッシュ済みは再利用）")
+        matrix_dir.mkdir(parents=True, exist_ok=True)
+        inputs = [file_signature(config.OUTPUT_MESH_RESULT_CSV)] + \
+                 [file_signature(spec['path']) for spec in config.OPTIONAL_FEATURE_SETS.values()]
+
+        # 列構成（まとまり → 列名）とメッシュコードも入力ごとに保存し、行列が揃っていれば特徴量を作り直さない
+        stage2 = importlib.import_module('2_cluster_analysis_multi')
+        inputs_key = matrix_key([], 'groups', inputs)
+        groups_path = matrix_dir / f'groups_{inputs_key}.json'
+        mesh_codes_path = matrix_dir / f'mesh_code_{inputs_key}.npy'
+        needed = needed_groups()
+        df, groups = None, None
+        if groups_path.exists() and mesh_codes_path.exists():
+            groups = json.loads(groups_path.read_text(encoding='utf-8'))
+            if not needed <= set(groups):
+                groups = None
+        if groups is None:
+            df, groups = build_feature_groups(stage2)
+            groups_path.write_text(json.dumps(groups, ensure_ascii=False), encoding='utf-8')
+            np.save(mesh_codes_path, df['mesh_code'].to_numpy(dtype=np.int64))
+
+        matrices = {}  # (feature_set, scaler) → (キー, 特徴量数)
+        for feature_set in config.ABLATION_FEATURE_SETS:
+            columns = set_columns(feature_set, groups)
+            if columns is None:
+                continue
+            for scaler in config.ABLATION_SCALERS:
+                key = matrix_key(columns, scaler, inputs)
+                path = matrix_dir / f'{key}.npy'
+                if path.exists():
+                    print(f"  ✓ {feature_set} × {scaler}: 再利用 {path.name}（{len(columns)}列）")
+                else:
+                    if df is None:
+                        df, _ = build_feature_groups(stage2)
+                    save_matrix(df, columns, scaler, path)
+                    print(f"  ✓ {feature_set} × {scaler}: 作成 {path.name}（{len(columns)}列）")
+                matrices[(feature_set, scaler)] = (key, len(columns))
+        if not matrices:
+            raise ValueError("比較できる特徴量セットがありません（config.ABLATION_FEATURE_SETS を確認してください）")
+        n_meshes = len(np.load(mesh_codes_path, mmap_mode='r'))
+        del df
+
+        print_section("2. クラスタリング")
+        results = load_results(results_path)
+        done = set() if args.force else set(zip(results['matrix_key'], results['method'], results['k'].astype(int)))
+        tasks = []
+        for (feature_set, scaler), (key, n_features) in matrices.items():
+            for method in config.ABLATION_METHODS:
+                pending = [k for k in config.ABLATION_K if (key, method, k) not in done]
+                if not pending:
+                    continue
+                # K-means は k ごと、連続地域区分は併合木を共有するため k をまとめて1タスク
+                chunks = [[k] for k in pending] if method == 'kmeans' else [pending]
+                for chunk in chunks:
+                    tasks.append(((feature_set, scaler, key, n_features, method), chunk))
+        n_skipped = len(matrices) * len(config.ABLATION_METHODS) * len(config.ABLATION_K) \
+            - sum(len(chunk) for _, chunk in tasks)
+        print(f"  実行: {sum(len(c) for _, c in tasks):,}組み合わせ（計算済み {n_skipped:,} はスキップ）, ワーカー {workers}")
+
+        new_rows = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_combination, str(matrix_dir / f'{info[2]}.npy'), str(mesh_codes_path),
+                                       info[4], chunk): info for info, chunk in tasks}
+            for future in as_completed(futures):
+                feature_set, scaler, key, n_features, method = futures[future]
+                for rec in future.result():
+                    new_rows.append({'feature_set': feature_set, 'scaler': scaler, 'method': method,
+                                     '特徴量数': n_features, 'メッシュ数': n_meshes, 'matrix_key': key,
+                                     '実行日時': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), **rec})
+                    print(f"  ✓ {feature_set} × {scaler} × {method} × k={rec['k']}: "
+                          f"シルエット {rec['シルエット係数']:.3f}, 隣接一致率 {rec['隣接一致率']:.3f} "
+                          f"({rec['実行秒']:.1f}秒)")
+
+        print_section("3. 結果表")
+        if new_rows:
+            new_df = pd.DataFrame(new_rows)
+            replaced = set(zip(new_df['matrix_key'], new_df['method'], new_df['k']))
+            keep = [(key, m, int(k)) not in replaced for key, m, k in zip(results['matrix_key'], results['method'],
+                                                                         results['k'])]
+            results = pd.concat([results[keep], new_df], ignore_index=True)
+        results = results[RESULT_COLUMNS].sort_values(['feature_set', 'scaler', 'method', 'k']).reset_index(drop=True)
+        results.to_csv(results_path, index=False, encoding='utf-8-sig', float_format='%.4f')
+        print(f"  ✓ {results_path}（{len(results):,}行）")
+
+        # 今回の設定に含まれる組み合わせだけを表示
+        current_sets = {(feature_set, scaler, key) for (feature_set, scaler), (key, _) in matrices.items()}
+        current = results[pd.MultiIndex.from_frame(results[['feature_set', 'scaler', 'matrix_key']]).isin(current_sets)
+                          & results['method'].isin(config.ABLATION_METHODS)
+                          & results['k'].isin(config.ABLATION_K)]
+        print(current[['feature_set', 'scaler', 'method', 'k', 'シルエット係数', 'Calinski_Harabasz',
+                       'Davies_Bouldin', '隣接一致率', '実行秒']].to_string(index=False, float_format=lambda v: f'{v:.3f}'))
+
+        elapsed = time.time() - start_time
+        print_section("処理完了")
+        print(f"  総処理時間: {elapsed:.1f}秒")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+メモリ節約モードのベンチマーク
+合成データを作業ディレクトリに生成し、ステップ1・2を MEMORY_SAVE_MODE=False / True で
+それぞれ別プロセスとして実行して、ピーク RSS（ru_maxrss）と処理時間を比較する。
+両モードのステップ1の集計結果が一致することも確認する
+
+使い方:
+    python benchmark_memory.py [--buildings 200000] [--keep]
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import synthetic_data
+
+BASE_DIR = Path(__file__).parent
+STAGES = ['1_mesh_analysis.py', '2_cluster_analysis_multi.py']
+
+# 子プロセスで実行するコード: config を書き換えてからスクリプトを実行し、終了時にピーク RSS を出力
+# （ワーカープロセスを使うスクリプトもあるため、子プロセスのピークとの大きい方）
+CHILD_CODE = """
+import resource, runpy, sys
+import config
+for name, value in {overrides!r}.items():
+    setattr(config, name, value)
+try:
+    runpy.run_path({script!r}, run_name='__main__')
+finally:
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print('PEAK_RSS', peak, file=sys.stderr)
+"""
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+def prepare_sandbox(sandbox: Path, data_dir: Path):
+    """スクリプト一式をコピーし、合成データを参照させる"""
+    sandbox.mkdir(parents=True)
+    for path in BASE_DIR.glob('*.py'):
+        shutil.copy2(path, sandbox / path.name)
+    (sandbox / 'data').symlink_to(data_dir, target_is_directory=True)
+
+
+def run_script(sandbox: Path, script: str, overrides: dict) -> dict:
+    """config を overrides で上書きしてスクリプトを別プロセスで実行し、ピーク RSS（MB）と処理時間を返す"""
+    start_time = time.time()
+    proc = subprocess.run(
+        [sys.executable, '-c', CHILD_CODE.format(overrides=overrides, script=script)],
+        cwd=sandbox, capture_output=True, text=True
+    )
+    elapsed = time.time() - start_time
+    if proc.returncode != 0:
+        raise RuntimeError(f"{script} が失敗しました（{overrides}）\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}")
+
+    peak = [line for line in proc.stderr.splitlines() if line.startswith('PEAK_RSS')][-1]
+    peak_kb = int(peak.split()[1])
+    if sys.platform == 'darwin':  # macOS はバイト単位
+        peak_kb //= 1024
+    return {'peak_mb': peak_kb / 1024, 'seconds': elapsed}
+
+
+def run_stage(sandbox: Path, script: str, memory_save: bool) -> dict:
+    """1ステップを MEMORY_SAVE_MODE を指定して実行"""
+    return run_script(sandbox, script, {'MEMORY_SAVE_MODE': memory_save})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='メモリ節約モードのピーク RSS 比較')
+    parser.add_argument('--buildings', type=int, default=200000, help='合成する建物数')
+    parser.add_argument('--rows', type=int, default=60, help='メッシュ格子の行数')
+    parser.add_argument('--cols', type=int, default=80, help='メッシュ格子の列数')
+    parser.add_argument('--workdir', help='作業ディレクトリ（省略時は一時ディレクトリ）')
+    parser.add_argument('--keep', action='store_true', help='作業ディレクトリを削除しない')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("メモリ節約モード ベンチマーク")
+    print("=" * 60)
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='mesh_bench_'))
+    try:
+        print_section("1. 合成データ生成")
+        counts = synthetic_data.generate(workdir, args.buildings, args.rows, args.cols)
+        print(f"  ✓ メッシュ: {counts['meshes']:,}, 建物: {counts['buildings']:,}, 飲食店: {counts['food']:,}")
+        print(f"  作業ディレクトリ: {workdir}")
+
+        print_section("2. 実行")
+        records = []
+        for memory_save in (False, True):
+            sandbox = workdir / ('lean' if memory_save else 'default')
+            prepare_sandbox(sandbox, workdir / 'data')
+            for script in STAGES:
+                result = run_stage(sandbox, script, memory_save)
+                records.append({'ステップ': script, 'MEMORY_SAVE_MODE': memory_save, **result})
+                print(f"  ✓ {script} (MEMORY_SAVE_MODE={memory_save}): "
+                      f"ピーク {result['peak_mb']:,.1f} MB, {result['seconds']:.1f}秒")
+
+        print_section("3. 結果")
+        table = pd.DataFrame(records).pivot(index='ステップ', columns='MEMORY_SAVE_MODE')
+        for script in STAGES:
+            before = table.loc[script, ('peak_mb', False)]
+            after = table.loc[script, ('peak_mb', True)]
+            print(f"  {script}")
+            print(f"    ピーク RSS: {before:,.1f} MB → {after:,.1f} MB ({(after - before) / before * 100:+.1f}%)")
+            print(f"    処理時間  : {table.loc[script, ('seconds', False)]:.1f}秒 → "
+                  f"{table.loc[script, ('seconds', True)]:.1f}秒")
+
+        # ステップ1の集計値は両モードで一致するはず（型のみ異なる）
+        csv_name = Path('output') / 'mesh_analysis_result.csv'
+        default_df = pd.read_csv(workdir / 'default' / csv_name, encoding='utf-8-sig')
+        lean_df = pd.read_csv(workdir / 'lean' / csv_name, encoding='utf-8-sig')
+        same = default_df.shape == lean_df.shape and default_df.equals(lean_df[default_df.columns])
+        print(f"\n  {'✓' if same else '❌'} ステップ1の集計結果の一致: {same}")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+クラスタリングモデルの保存・読み込み
+ステップ2で学習した標準化（StandardScaler）と K-means、特徴量の列名を k ごとに保存し、
+標準化済み特徴量（float32）とクラスタ番号を類似メッシュ検索などの後段から再利用できるようにする
+
+保存先（output/kXX/）:
+    model.joblib          : {'scaler', 'kmeans', 'centroids', 'method', 'feature_cols', 'n_clusters'}
+                            （連続地域区分では kmeans は None で、予測は最寄りの重心）
+    feature_matrix.npz    : mesh_code, X（標準化済み float32）, sq_norm, cluster
+"""
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+MODEL_FILE = 'model.joblib'
+FEATURE_MATRIX_FILE = 'feature_matrix.npz'
+
+
+def model_dir(k: int) -> Path:
+    return Path(config.OUTPUT_DIR) / f'k{k:02d}'
+
+
+def save_model(out_dir: Path, scaler, kmeans, feature_cols, mesh_codes, X_scaled, labels,
+               method: str = 'kmeans', centroids=None):
+    """モデルと標準化済み特徴量行列を保存（kmeans=None の場合は centroids を渡す）"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    if centroids is None:
+        centroids = kmeans.cluster_centers_
+    joblib.dump({
+        'scaler': scaler,
+        'kmeans': kmeans,
+        'centroids': np.asarray(centroids),
+        'method': method,
+        'feature_cols': list(feature_cols),
+        'n_clusters': int(len(centroids)),
+    }, out_dir / MODEL_FILE)
+
+    X = np.ascontiguousarray(X_scaled, dtype=np.float32)
+    np.savez(
+        out_dir / FEATURE_MATRIX_FILE,
+        mesh_code=np.asarray(mesh_codes, dtype=np.int64),
+        X=X,
+        sq_norm=np.einsum('ij,ij->i', X, X),
+        cluster=np.asarray(labels, dtype=np.int16),
+        feature_cols=np.array(list(feature_cols)),
+    )
+    return out_dir / MODEL_FILE, out_dir / FEATURE_MATRIX_FILE
+
+
+def load_model(k: int = None, path=None) -> dict:
+    """保存済みモデルを読み込む"""
+    path = Path(path) if path else model_dir(k) / MODEL_FILE
+    if not path.exists():
+        raise FileNotFoundError(f"モデルが見つかりません: {path}\n先に 2_cluster_analysis_multi.py を実行してください")
+    return joblib.load(path)
+
+
+def load_feature_matrix(k: int = None, path=None) -> dict:
+    """標準化済み特徴量行列を読み込む"""
+    path = Path(path) if path else model_dir(k) / FEATURE_MATRIX_FILE
+    if not path.exists():
+        raise FileNotFoundError(f"特徴量行列が見つかりません: {path}\n先に 2_cluster_analysis_multi.py を実行してください")
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def predict(model: dict, X: np.ndarray) -> np.ndarray:
+    """
+    未標準化の特徴量からクラスタを予測
+    K-means はそのモデルで、連続地域区分は最寄りの重心で割り当てる（新しいデータには連続性の制約はかからない）
+    """
+    centroids = model.get('centroids')
+    if centroids is None:  # centroids を保存する前の形式
+        centroids = model['kmeans'].cluster_centers_
+    X_scaled = model['scaler'].transform(X).astype(centroids.dtype)
+    if model.get('kmeans') is not None:
+        return model['kmeans'].predict(X_scaled)
+    sq_dist = (np.einsum('ij,ij->i', X_scaled, X_scaled)[:, None] - 2 * X_scaled @ centroids.T
+               + np.einsum('ij,ij->i', centroids, centroids)[None, :])
+    return np.argmin(sq_dist, axis=1)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+クラスタ命名エンジン（ステップ2・Web用データ準備で共通）
+命名規則を宣言的なルール表で持ち、NumPy のマスク演算で一括評価する。
+クラスタ単位（平均・比率）だけでなく、個々のメッシュにも同じ規則で名前を付けられる
+"""
+import numpy as np
+import pandas as pd
+
+# 命名規則で参照する建物用途
+RULE_USAGES = [
+    '官公庁施設', '共同住宅', '住宅', '商業施設', '文教厚生施設',
+    '業務施設', '商業系複合施設', '店舗等併用住宅', '店舗等併用共同住宅', '宿泊施設'
+]
+
+# ルール表: 上から順に評価し、最初に全条件を満たしたものを採用する
+# 条件は (指標, 演算子, 閾値)。指標は用途名（比率）または下記の集計指標
+#   平均建物数 / 平均飲食店数: クラスタ平均（メッシュ単位では当該メッシュの値）
+#   住宅合算: 住宅比率 + 共同住宅比率
+NAMING_RULES = [
+    ('要確認（建物0/飲食突出）', '#c0392b', [('平均建物数', '<', 1), ('平均飲食店数', '>', 50)]),
+    ('低密度地域', '#95a5a6', [('平均建物数', '<', 1)]),
+
+    # 単独支配（用途が明確なものを優先）
+    ('複合商業地域', '#ffd54f', [('商業系複合施設', '>=', 0.6)]),
+    ('宿泊施設地域', '#e91e63', [('宿泊施設', '>=', 0.5)]),
+    ('文教施設地域', '#3498db', [('文教厚生施設', '>=', 0.5)]),
+    ('官公庁施設地域', '#9b59b6', [('官公庁施設', '>=', 0.5)]),
+    ('業務地域', '#e74c3c', [('業務施設', '>=', 0.4)]),
+
+    # 商業（飲食の強さで分ける）
+    ('超高密度商業地域', '#f39c12', [('商業施設', '>', 0.5), ('平均飲食店数', '>', 100)]),
+    ('商業集積地域', '#f1c40f', [('商業施設', '>', 0.5)]),
+    ('商業混在地域', '#f4d03f', [('商業施設', '>', 0.1)]),
+
+    # 住宅系: 住宅+共同住宅の合算で拾い、戸建寄り／集合寄りを分ける
+    ('戸建住宅地域', '#27ae60', [('住宅合算', '>=', 0.6), ('住宅', '>=', 0.6)]),
+    ('集合住宅地域', '#7dcea0', [('住宅合算', '>=', 0.6), ('共同住宅', '>=', 0.4)]),
+    ('住宅混合地域（戸建＋集合）', '#58d68d', [('住宅合算', '>=', 0.6)]),
+
+    # 併用住宅
+    ('店舗併用集合住宅地域', '#aed581', [('店舗等併用共同住宅', '>=', 0.2)]),
+    ('店舗併用住宅地域', '#c5e1a5', [('店舗等併用住宅', '>=', 0.2)]),
+
+    # 低密度
+    ('低密度地域', '#95a5a6', [('平均建物数', '<', 50)]),
+]
+
+DEFAULT_NAME = '混合地域'
+DEFAULT_COLOR = '#e67e22'
+
+_OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+}
+
+
+def _add_derived(ind: pd.DataFrame) -> pd.DataFrame:
+    """ルールで使う派生指標を追加"""
+    ind['住宅合算'] = ind['住宅'] + ind['共同住宅']
+    return ind
+
+
+def mesh_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    """メッシュ単位の指標（用途比率・建物数・飲食店数）"""
+    total = df['建物総数'].to_numpy(dtype=np.float64)
+    ind = pd.DataFrame(index=df.index)
+    for u in RULE_USAGES:
+        col = f'建物_{u}'
+        counts = df[col].to_numpy(dtype=np.float64) if col in df.columns else np.zeros(len(df))
+        ind[u] = np.divide(counts, total, out=np.zeros(len(df)), where=total > 0)
+    ind['平均建物数'] = total
+    ind['平均飲食店数'] = df['飲食店数'].to_numpy(dtype=np.float64)
+    return _add_derived(ind)
+
+
+def cluster_indicators(df: pd.DataFrame, cluster_col: str = 'cluster', method: str = 'sum') -> pd.DataFrame:
+    """
+    クラスタ単位の指標
+    method='sum' : 用途比率 = Σ用途別棟数 / Σ建物総数（棟数合計ベース）
+    method='mean': 用途比率 = メッシュ別比率の平均
+    """
+    groups = df.groupby(cluster_col)
+    ind = pd.DataFrame(index=groups.size().index)
+
+    if method == 'sum':
+        usage_cols = [f'建物_{u}' for u in RULE_USAGES if f'建物_{u}' in df.columns]
+        sums = groups[usage_cols + ['建物総数']].sum()
+        total = sums['建物総数'].to_numpy(dtype=np.float64)
+        for u in RULE_USAGES:
+            col = f'建物_{u}'
+            counts = sums[col].to_numpy(dtype=np.float64) if col in sums.columns else np.zeros(len(sums))
+            ind[u] = np.divide(counts, total, out=np.zeros(len(sums)), where=total > 0)
+    elif method == 'mean':
+        per_mesh = mesh_indicators(df)[RULE_USAGES]
+        ind = ind.join(per_mesh.groupby(df[cluster_col].values).mean())
+    else:
+        raise ValueError(f"method は 'sum' または 'mean' です: {method}")
+
+    ind['平均建物数'] = groups['建物総数'].mean()
+    ind['平均飲食店数'] = groups['飲食店数'].mean()
+    return _add_derived(ind)
+
+
+def apply_rules(ind: pd.DataFrame, rules=None):
+    """指標表の各行にルール表を適用し、(名前配列, 色配列) を返す"""
+    rules = rules or NAMING_RULES
+    conditions = []
+    for _, _, terms in rules:
+        mask = np.ones(len(ind), dtype=bool)
+        for indicator, op, threshold in terms:
+            mask &= _OPERATORS[op](ind[indicator].to_numpy(), threshold)
+        conditions.append(mask)
+
+    # np.select は最初に True となった条件を採用する（= ルール表の優先順位）
+    choice = np.select(conditions, list(range(len(rules))), default=len(rules))
+    names = np.array([r[0] for r in rules] + [DEFAULT_NAME], dtype=object)
+    colors = np.array([r[1] for r in rules] + [DEFAULT_COLOR], dtype=object)
+    return names[choice], colors[choice]
+
+
+def name_clusters(df: pd.DataFrame, cluster_col: str = 'cluster', method: str = 'sum') -> dict:
+    """クラスタID → (名前, 色)"""
+    ind = cluster_indicators(df, cluster_col, method)
+    names, colors = apply_rules(ind)
+    return {int(cid): (name, color) for cid, name, color in zip(ind.index, names, colors)}
+
+
+def label_meshes(df: pd.DataFrame):
+    """全メッシュに1パスで名前と色を付ける"""
+    return apply_rules(mesh_indicators(df))
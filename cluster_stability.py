@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+クラスタ安定性分析スクリプト
+ステップ2で保存した標準化済み特徴量を使い、k ごとに B 回のブートストラップ（または乱数シード変更）で
+K-means をやり直して、元のクラスタリングとの一致度を調べる。
+- クラスタ別: ハンガリアン法で対応付けた後の Jaccard 係数
+- メッシュ別: 一致率（対応付け後に同じクラスタに入った割合）と
+              共割当率（元の同じクラスタのメッシュと引き続き同じクラスタに入った割合）
+特徴量行列は一時ファイルに書き出し、ワーカープロセスからは読み取り専用のメモリマップで共有する
+
+使い方:
+    python cluster_stability.py [--k 4,6] [--replicates 100] [--mode bootstrap|seed] [--workers 8]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import KMeans
+from threadpoolctl import threadpool_limits
+
+import cluster_model
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+# ワーカープロセス内で共有する特徴量行列（読み取り専用メモリマップ）
+_MATRIX = None
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+def _init_worker(matrix_path: str):
+    global _MATRIX
+    _MATRIX = np.load(matrix_path, mmap_mode='r')
+
+
+def run_replicate(n_clusters: int, seed: int, mode: str, n_init: int) -> np.ndarray:
+    """
+    1回分の再クラスタリング（ワーカープロセスで実行）
+    bootstrap: 復元抽出したメッシュで学習し、全メッシュを予測
+    seed     : 全メッシュで乱数シードだけ変えて学習
+    """
+    X = _MATRIX
+    # プロセス並列と BLAS/OpenMP のスレッド並列が重ならないように1スレッドに制限
+    with threadpool_limits(limits=1):
+        if mode == 'bootstrap':
+            rng = np.random.default_rng(seed)
+            X_fit = X[np.sort(rng.integers(0, len(X), len(X)))]
+        else:
+            X_fit = X
+        kmeans = KMeans(n_clusters=n_clusters, random_state=seed, n_init=n_init).fit(X_fit)
+        return kmeans.predict(X).astype(np.int16)
+
+
+def match_labels(reference: np.ndarray, labels: np.ndarray, n_clusters: int):
+    """
+    再クラスタリングのラベルを元のラベルにハンガリアン法で対応付ける
+    戻り値: (対応付け後のラベル, 元クラスタ別 Jaccard, 分割表[元, 再])
+    """
+    contingency = np.bincount(reference.astype(np.int64) * n_clusters + labels,
+                              minlength=n_clusters * n_clusters).reshape(n_clusters, n_clusters)
+    ref_size = contingency.sum(axis=1)
+    new_size = contingency.sum(axis=0)
+    union = ref_size[:, None] + new_size[None, :] - contingency
+    jaccard = np.divide(contingency, union, out=np.zeros(contingency.shape), where=union > 0)
+
+    ref_ids, new_ids = linear_sum_assignment(-jaccard)
+    mapping = np.empty(n_clusters, dtype=np.int64)
+    mapping[new_ids] = ref_ids
+    return mapping[labels], jaccard[ref_ids, new_ids], contingency
+
+
+def analyze_k(n_clusters: int, replicates: int, mode: str, workers: int, tmp_dir: Path):
+    """k 1つ分の安定性分析"""
+    print_section(f"k={n_clusters}: {replicates}回の再クラスタリング（{mode}）")
+    data = cluster_model.load_feature_matrix(n_clusters)
+    mesh_code, reference = data['mesh_code'], data['cluster'].astype(np.int64)
+    n = len(mesh_code)
+
+    matrix_path = tmp_dir / f'X_k{n_clusters:02d}.npy'
+    np.save(matrix_path, np.ascontiguousarray(data['X'], dtype=np.float32))
+    del data
+
+    ref_size = np.bincount(reference, minlength=n_clusters)
+    agree = np.zeros(n)
+    coassign = np.zeros(n)
+    jaccards = np.zeros((replicates, n_clusters))
+
+    start_time = time.time()
+    seeds = config.RANDOM_STATE + 1 + np.arange(replicates)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(str(matrix_path),)) as executor:
+        futures = [executor.submit(run_replicate, n_clusters, int(s), mode, config.STABILITY_N_INIT)
+                   for s in seeds]
+        for i, future in enumerate(as_completed(futures)):
+            labels = future.result().astype(np.int64)
+            matched, jaccards[i], contingency = match_labels(reference, labels, n_clusters)
+            agree += matched == reference
+            # 同じ元クラスタのうち、今回も同じクラスタに入った他メッシュの割合
+            mates = contingency[reference, labels] - 1
+            coassign += np.divide(mates, ref_size[reference] - 1, out=np.ones(n),
+                                  where=ref_size[reference] > 1)
+            if (i + 1) % max(1, replicates // 10) == 0:
+                print(f"  {i + 1}/{replicates} ({time.time() - start_time:.1f}秒)")
+
+    mesh_df = pd.DataFrame({
+        'mesh_code': mesh_code,
+        'クラスタ一致率': agree / replicates,
+        'クラスタ信頼度': coassign / replicates,
+    })
+
+    summary = pd.DataFrame({
+        'cluster': np.arange(n_clusters),
+        'メッシュ数': ref_size,
+        'Jaccard平均': jaccards.mean(axis=0),
+        'Jaccard中央値': np.median(jaccards, axis=0),
+        'Jaccard最小': jaccards.min(axis=0),
+        '平均信頼度': np.bincount(reference, weights=mesh_df['クラスタ信頼度'], minlength=n_clusters)
+                      / np.maximum(ref_size, 1),
+    })
+    names = _cluster_names(n_clusters)
+    if names is not None:
+        summary.insert(1, 'cluster_name', summary['cluster'].map(names))
+
+    print(f"  ✓ 完了 ({time.time() - start_time:.1f}秒)")
+    print(summary.to_string(index=False, float_format=lambda v: f'{v:.3f}'))
+    return mesh_df, summary
+
+
+def _cluster_names(n_clusters: int):
+    """ステップ2の出力からクラスタ名を取得（無ければ None）"""
+    csv_path = cluster_model.model_dir(n_clusters) / 'mesh_with_clusters.csv'
+    if not csv_path.exists():
+        return None
+    df = pd.read_csv(csv_path, encoding='utf-8-sig', usecols=['cluster', 'cluster_name'])
+    return dict(df.drop_duplicates('cluster').itertuples(index=False))
+
+
+def available_k():
+    """特徴量行列が保存されている k の一覧"""
+    return sorted(int(p.parent.name[1:])
+                  for p in Path(config.OUTPUT_DIR).glob(f'k[0-9][0-9]/{cluster_model.FEATURE_MATRIX_FILE}'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='クラスタ安定性分析（ブートストラップ）')
+    parser.add_argument('--k', help='対象の k（カンマ区切り。省略時は保存済みの全 k）')
+    parser.add_argument('--replicates', type=int, default=config.STABILITY_REPLICATES, help='再クラスタリング回数 B')
+    parser.add_argument('--mode', choices=['bootstrap', 'seed'], default=config.STABILITY_MODE)
+    parser.add_argument('--workers', type=int, default=config.STABILITY_WORKERS, help='ワーカープロセス数')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    workers = args.workers or os.cpu_count()
+
+    print("=" * 60)
+    print("クラスタ安定性分析")
+    print(f"B={args.replicates}, モード={args.mode}, ワーカー数={workers}")
+    print("=" * 60)
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix='cluster_stability_'))
+    try:
+        k_list = [int(k) for k in args.k.split(',')] if args.k else available_k()
+        if not k_list:
+            raise FileNotFoundError("特徴量行列が見つかりません。先に 2_cluster_analysis_multi.py を実行してください")
+
+        for k in k_list:
+            method = cluster_model.load_model(k).get('method', 'kmeans')
+            if method != 'kmeans':
+                print(f"\n  ⚠️ k={k} は {method} の結果のためスキップします（安定性分析は K-means が対象）")
+                continue
+            mesh_df, summary = analyze_k(k, args.replicates, args.mode, workers, tmp_dir)
+            out_dir = cluster_model.model_dir(k)
+            mesh_path = out_dir / 'cluster_stability.csv'
+            summary_path = out_dir / 'cluster_stability_summary.csv'
+            mesh_df.to_csv(mesh_path, index=False, encoding='utf-8-sig', float_format='%.3f')
+            summary.to_csv(summary_path, index=False, encoding='utf-8-sig', float_format='%.4f')
+            print(f"  ✓ {mesh_path}")
+            print(f"  ✓ {summary_path}")
+
+        elapsed = time.time() - start_time
+        print_section("処理完了")
+        print(f"  総処理時間: {elapsed:.1f}秒")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -28,6 +28,9 @@ OUTPUT_MESH_RESULT_GEOJSON = os.path.join(OUTPUT_DIR, 'mesh_analysis_result.geoj
 OUTPUT_MESH_CLUSTER_CSV = os.path.join(OUTPUT_DIR, 'mesh_with_clusters.csv')
 OUTPUT_MESH_CLUSTER_GEOJSON = os.path.join(OUTPUT_DIR, 'mesh_with_clusters.geojson')
 
+# Web用データ出力先
+WEB_DATA_DIR = os.path.join(ROOT_DIR, 'web_data')
+
 # ============================================================
 # 分析パラメータ（追加用途対応）
 # ============================================================
@@ -42,7 +45,8 @@ TARGET_USAGES = {
     '401': '業務施設',                # 追加
     '404': '商業系複合施設',          # 追加
     '413': '店舗等併用住宅',          # 追加
-    '414': '店舗等併用共同住宅'      # 追加
+    '414': '店舗等併用共同住宅',     # 追加
+    '403': '宿泊施設'                 # 追加（1_mesh_analysis.py と揃える）
 }
 
 # クラスタリングパラメータ
@@ -50,12 +54,175 @@ N_CLUSTERS = 6  # デフォルトクラスタ数
 RANDOM_STATE = 42  # 再現性のための乱数シード
 KMEANS_N_INIT = 10  # K-meansの初期化回数
 
+# クラスタリング手法
+# 'kmeans': K-means（地理的な位置は考慮しない）
+# 'ward_contiguous': 連続地域区分。隣接メッシュ同士だけを併合する連結制約付き Ward 法（regionalization.py）
+CLUSTER_METHOD = 'kmeans'
+CLUSTER_CONTIGUITY = 'rook'  # 隣接の定義（'rook': 上下左右, 'queen': 斜めを含む8近傍）
+
+# クラスタ命名で使う用途比率の集計方法（cluster_naming.py）
+# 'sum': Σ用途別棟数 / Σ建物総数, 'mean': メッシュ別比率の平均
+NAMING_RATIO_METHOD = 'sum'
+
+# 空間ラグ特徴量（メッシュコードから求めた近傍の平均・距離減衰和）
+SPATIAL_LAG_ENABLED = False  # True にすると特徴量が増え、既存のクラスタ結果とは一致しなくなる
+SPATIAL_LAG_SOURCES = ['飲食店密度', '建物総数_log', '建物_商業施設_比率', '建物_住宅_比率', '建物_共同住宅_比率']
+SPATIAL_LAG_RADII = [1, 2]  # 1 → 3×3近傍, 2 → 5×5近傍
+SPATIAL_DECAY_SOURCES = ['飲食店数', '建物総数']
+SPATIAL_DECAY_RADIUS = 4  # 距離減衰和を取る範囲（セル数）
+SPATIAL_DECAY_BANDWIDTH_M = 500  # 重み exp(-距離/帯域幅)
+
+# 空間的自己相関（Moran's I / LISA）
+LISA_VARIABLES = ['飲食店数', '飲食店密度']
+LISA_PERMUTATIONS = 999  # 条件付き並べ替えの回数
+LISA_SIGNIFICANCE = 0.05  # ホット/コールドスポット判定の有意水準
+LISA_OUTPUT_DIR = os.path.join(OUTPUT_DIR, 'spatial_autocorrelation')
+
+# 飲食店カーネル密度（ビニング + FFT畳み込み）
+KDE_BANDWIDTHS_M = [250, 500, 1000]  # ガウスカーネルの標準偏差（m）
+KDE_TRUNCATE = 3.0  # カーネルを何σで打ち切るか
+RESTAURANT_KDE_CSV = os.path.join(OUTPUT_DIR, 'restaurant_kde.csv')
+RESTAURANT_KDE_RASTER = os.path.join(OUTPUT_DIR, 'restaurant_kde.npz')
+
+# 駅アクセシビリティ（最寄駅距離・乗降客数重み付きの重力モデル指標）
+STATIONS_GEOJSON = os.path.join(WEB_DATA_DIR, 'stations.geojson')
+STATION_RIDERSHIP_COLUMN = '乗降客数2023'
+STATION_MERGE_DISTANCE_M = 150  # 同名駅をこの距離未満なら1点にまとめる（m。js/app.js の MERGE_DISTANCE_METERS と同じ）
+STATION_NEAREST_K = 3  # 距離を出力する最寄駅の数
+STATION_GRAVITY_K = 20  # 重力モデルで合算する近傍駅の数
+STATION_GRAVITY_DECAY_M = 800  # 重み exp(-距離/減衰距離)
+STATION_ACCESSIBILITY_CSV = os.path.join(OUTPUT_DIR, 'station_accessibility.csv')
+
+# 飲食店の業種別集計（restaurant_categories.py）
+RESTAURANT_CATEGORY_COLUMNS = ['業種', '業態', '営業の種類']  # 業種列の候補（先頭から探す）
+CATEGORY_MIN_COUNT = 5  # 出現件数がこれ未満の業種は「その他」にまとめる
+CATEGORY_NMF_COMPONENTS = 6  # 業種構成（NMF）の成分数
+CATEGORY_TOP_N = 10  # 件数を地図属性に出す上位業種の数
+RESTAURANT_CATEGORY_CSV = os.path.join(OUTPUT_DIR, 'restaurant_categories.csv')
+RESTAURANT_CATEGORY_MATRIX = os.path.join(OUTPUT_DIR, 'restaurant_categories.npz')
+
+# 追加特徴量（別ステージで作成したメッシュ別属性CSVを mesh_code で結合）
+# enabled=True のものだけ create_features で特徴量に加える（prefix があればその接頭辞の列のみ）
+OPTIONAL_FEATURE_SETS = {
+    'restaurant_kde': {'enabled': False, 'path': RESTAURANT_KDE_CSV, 'log1p': True},
+    'station_accessibility': {'enabled': False, 'path': STATION_ACCESSIBILITY_CSV, 'log1p': True},
+    'restaurant_categories': {'enabled': False, 'path': RESTAURANT_CATEGORY_CSV, 'log1p': False,
+                              'prefix': '業種構成_'},
+}
+
 # 飲食店データのフィルタリング範囲（緯度経度）
 FOOD_LAT_MIN = 30.0
 FOOD_LAT_MAX = 35.0
 FOOD_LON_MIN = 129.0
 FOOD_LON_MAX = 132.0
 
+# 飲食店CSVの読み込み（mesh_aggregation.load_food。pyarrow があれば Arrow の並列 CSV リーダーを使う）
+FOOD_DEDUP_COLUMNS = ['営業者名', '住所', '業種', '緯度', '経度']  # 値がすべて同じ行は重複登録として1件にする（CSV に無い列は使わない。[] で無効）
+FOOD_STACK_WARN = 20  # 同一座標にこの件数以上が重なる地点を警告（ジオコーディングの代表点の疑い）
+FOOD_CACHE_DIR = os.path.join(OUTPUT_DIR, 'cache', 'food')  # 型付きバイナリのキャッシュ（CSV の SHA-256 がキー）
+
+# 分割実行（自治体ファイル × 1次メッシュ単位の map-reduce 集計）
+# 入力はファイルパスまたは glob パターンのリスト（例: os.path.join(DATA_DIR, 'buildings', '*.geojson')）
+PARTITION_BUILDING_FILES = [INPUT_BUILDING_FILE]
+PARTITION_FOOD_FILES = [INPUT_FOOD_FILE]
+PARTITION_CHUNK_ROWS = 200000  # 1ワーカーが一度に読む行数（メモリ上限の目安）
+PARTITION_WORKERS = None  # None の場合は CPU コア数
+PARTITION_SPILL_DIR = os.path.join(OUTPUT_DIR, 'partitions')
+
+# 年次スナップショット（snapshots.py）
+# ヴィンテージ名 → 入力ファイル（パスまたは glob パターン）と駅乗降客数の列名
+# 例: '2022': {'buildings': [os.path.join(DATA_DIR, '2022', 'building_centroid_all.geojson')],
+#              'food': [os.path.join(DATA_DIR, '2022', 'fukuoka_40100_food_business_all.csv')],
+#              'ridership_column': '乗降客数2022'},
+SNAPSHOT_DIR = os.path.join(OUTPUT_DIR, 'snapshots')
+SNAPSHOTS = {
+    '2023': {'buildings': [INPUT_BUILDING_FILE], 'food': [INPUT_FOOD_FILE], 'ridership_column': '乗降客数2023'},
+}
+
+# 高速経路の等価性検証（equivalence_harness.py）
+EQUIVALENCE_GEOMETRY_TOL = 1e-7  # 形状・中心座標の許容誤差（度、約1cm）
+EQUIVALENCE_FLOAT_RTOL = 1e-6  # JSON・GeoJSON 属性の数値の相対許容誤差
+EQUIVALENCE_FLOAT_ATOL = 1e-9  # 同 絶対許容誤差
+EQUIVALENCE_DIR = os.path.join(OUTPUT_DIR, 'equivalence')
+
+# プレビュー（preview.py / 2_cluster_analysis_multi.py --preview。層化抽出した標本で学習）
+PREVIEW_SAMPLE_FRACTION = 0.1  # 抽出率
+PREVIEW_DENSITY_BINS = 4  # 密度（建物総数 + 飲食店数）の分位階級数。層 = 1次メッシュ × 密度階級
+PREVIEW_MIN_PER_STRATUM = 2  # 各層から抽出する最少メッシュ数
+PREVIEW_N_INIT = 3  # K-means の初期化回数
+PREVIEW_DIR = os.path.join(OUTPUT_DIR, 'preview')
+
+# 特徴量セットの比較グリッド（ablation_grid.py）
+# 特徴量セット名 → 特徴量のまとまり
+#   'ratios': 建物用途比率, 'density': 飲食店密度, 'size': 建物総数_log, 'lags': 空間ラグ,
+#   OPTIONAL_FEATURE_SETS の名前（'restaurant_kde' など。enabled に関係なく結合する）
+ABLATION_FEATURE_SETS = {
+    'base': ['ratios', 'density', 'size'],
+    'base+lags': ['ratios', 'density', 'size', 'lags'],
+    'base+kde': ['ratios', 'density', 'size', 'restaurant_kde'],
+    'base+station': ['ratios', 'density', 'size', 'station_accessibility'],
+}
+ABLATION_SCALERS = ['standard', 'robust']  # 'standard', 'robust', 'minmax', 'none'
+ABLATION_K = [4, 6, 8]
+ABLATION_METHODS = ['kmeans', 'ward_contiguous']  # CLUSTER_METHOD と同じ名前
+ABLATION_SILHOUETTE_SAMPLE = 10000  # シルエット係数を計算するメッシュ数（標本抽出）
+ABLATION_WORKERS = None  # None の場合は CPU コア数
+ABLATION_DIR = os.path.join(OUTPUT_DIR, 'ablation')
+
+# What-if シナリオ分析（scenario.py。差分CSVの出力先）
+SCENARIO_DIR = os.path.join(OUTPUT_DIR, 'scenarios')
+
+# 出店候補地の選定（site_selection.py。商圏内の需要のカバー − 競合飲食店）
+SITE_COUNT = 20  # 選ぶ箇所数 K
+SITE_RADIUS_M = 500  # メッシュ候補の商圏半径（m）
+SITE_RADIUS_RULES = [(30000, 300), (50000, 500), (float('inf'), 1000)]  # 駅候補: (乗降客数の上限, 半径m)。js/app.js の RADIUS_RULES と同じ
+SITE_DEMAND_WEIGHTS = {  # 需要の重み（列 → 1件あたりの点数）
+    '建物_住宅': 1.0,
+    '建物_共同住宅': 3.0,
+    '建物_店舗等併用住宅': 1.0,
+    '建物_店舗等併用共同住宅': 3.0,
+    '建物_業務施設': 3.0,
+    '建物_官公庁施設': 2.0,
+    '建物_文教厚生施設': 2.0,
+    '建物_商業施設': 1.0,
+    '建物_商業系複合施設': 2.0,
+    '建物_宿泊施設': 2.0,
+}
+SITE_RIDERSHIP_WEIGHT = 0.01  # 乗降客数1人あたりの点数（駅のあるメッシュの需要に加算）
+SITE_COMPETITION_WEIGHT = 2.0  # 商圏内の既存飲食店1件あたりの減点 λ
+SITE_OUTPUT_DIR = os.path.join(OUTPUT_DIR, 'site_selection')
+
+# GeoPackage エクスポート（export_geopackage.py）
+GEOPACKAGE_PATH = os.path.join(OUTPUT_DIR, 'mesh_analysis.gpkg')
+
+# クラスタ安定性分析（cluster_stability.py）
+STABILITY_REPLICATES = 100  # 再クラスタリング回数 B
+STABILITY_MODE = 'bootstrap'  # 'bootstrap': 復元抽出で学習, 'seed': 乱数シードのみ変更
+STABILITY_N_INIT = 1  # 1回あたりの K-means 初期化回数
+STABILITY_WORKERS = None  # None の場合は CPU コア数
+
+# 類似メッシュ検索（similar_meshes.py。標準化特徴量空間の厳密な最近傍）
+SIMILAR_TOP_N = 10  # 返す件数
+SIMILAR_QUERY_BLOCK = 256  # 一度に処理する問い合わせ数
+SIMILAR_CANDIDATE_BLOCK = 8192  # 一度に距離を計算する候補数
+# 検索中のメモリ ≒ 問い合わせ数×候補数×16byte（float32 の距離・argpartition の作業用コピー・int64 の位置）。既定値で約35MB
+
+# ローカル問い合わせサービス（query_service.py）
+QUERY_HOST = '127.0.0.1'
+QUERY_PORT = 8001
+QUERY_CACHE_SIZE = 1024  # LRUキャッシュに保持する応答数
+QUERY_MAX_MESHES = 5000  # 応答に含めるメッシュ一覧の上限
+
+# Web用データの事前圧縮（prepare_web_data.py）と静的ファイルサーバー（serve_web.py）
+WEB_PRECOMPRESS_SUFFIXES = ['.geojson', '.json']  # 圧縮版（.gz / .br）を作る拡張子
+WEB_GZIP_LEVEL = 9
+WEB_BROTLI_QUALITY = 11  # brotli パッケージが無い場合は .br を作らない
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8000
+# web_data/ の Cache-Control max-age（秒）。0 は HTML/JS/CSS と同じく毎回 ETag で再検証（未変更なら 304 で本文は送らない）
+# 正にすると再検証の往復が減るが、prepare_web_data.py の再実行後も最長その秒数だけ古いデータが新しい app.js と混在する
+SERVE_DATA_MAX_AGE = 0
+
 # ============================================================
 # 可視化設定
 # ============================================================
@@ -73,6 +240,14 @@ SCATTER_COLORS = ['#e41a1c', '#377eb8', '#4daf4a', '#984ea3', '#ff7f00', '#ffff3
 SHOW_GRID = True
 GRID_ALPHA = 0.3
 
+# 散布図の描画方式（'points': 点を個別に描画, 'density': クラスタ別2次元ヒストグラムの色合成, 'auto': メッシュ数で切替）
+SCATTER_MODE = 'auto'
+SCATTER_DENSITY_THRESHOLD = 50000  # auto でこのメッシュ数を超えたら density
+SCATTER_BINS = 200  # density の画素数（1辺）
+
+# k ごとの可視化を並列に描画するプロセス数（None の場合は min(k の数, CPU コア数)、1 で逐次）
+PLOT_WORKERS = None
+
 # ============================================================
 # 処理設定
 # ============================================================
@@ -81,6 +256,8 @@ GRID_ALPHA = 0.3
 PROGRESS_INTERVAL = 50000
 
 # メモリ節約モード（大規模データ用）
+# 用途・クラスタ名をカテゴリ型、件数を uint16/uint32、特徴量を float32 で持ち、
+# フレーム全体のコピーを避けて列の代入で結果を追加する（benchmark_memory.py で比較可能）
 MEMORY_SAVE_MODE = False
 
 # ============================================================
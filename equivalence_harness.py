@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高速経路の等価性検証ハーネス
+同じ入力（合成データまたは実データ）に対して、基準のパイプライン
+（1_mesh_analysis.py → 2_cluster_analysis_multi.py → prepare_web_data.py）と
+高速経路（ENGINES）をそれぞれ作業ディレクトリで別プロセスとして実行し、出力を突き合わせる。
+- ステップ1: メッシュ別の件数は完全一致、中心座標・メッシュ形状は許容誤差内
+- ステップ2: k ごとのクラスタ割り当てはラベルの付け替えを除いて一致
+- Web データ: JSON の数値・GeoJSON の属性と形状が許容誤差内（クラスタ ID は対応付けて比較）
+あわせてステップごとの処理時間とピーク RSS を並べて出力する
+
+使い方:
+    python equivalence_harness.py [--engine partitioned,memory_save] [--buildings 50000]
+    python equivalence_harness.py --data data    # 実データで検証
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from sklearn.metrics import adjusted_rand_score
+
+import synthetic_data
+from benchmark_memory import prepare_sandbox, run_script
+from cluster_stability import match_labels
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+STAGE_LABELS = ['ステップ1 集計', 'ステップ2 クラスタリング', 'Web データ準備']
+REFERENCE_STEPS = ['1_mesh_analysis.py', '2_cluster_analysis_multi.py', 'prepare_web_data.py']
+
+# 高速経路: 名前 → 説明・実行するスクリプト（STAGE_LABELS と同じ順）・config の上書き
+ENGINES = {
+    'partitioned': {
+        'description': 'ステップ1を空間結合の代わりにメッシュコード演算の分割集計で実行（mesh_aggregation.py）',
+        'steps': ['mesh_aggregation.py', '2_cluster_analysis_multi.py', 'prepare_web_data.py'],
+        'config': {},
+    },
+    'memory_save': {
+        'description': 'MEMORY_SAVE_MODE=True（カテゴリ型・小さい整数型・float32・コピー削減）',
+        'steps': REFERENCE_STEPS,
+        'config': {'MEMORY_SAVE_MODE': True},
+    },
+}
+
+MESH_RESULT_CSV = Path('output') / 'mesh_analysis_result.csv'
+MESH_RESULT_GEOJSON = Path('output') / 'mesh_analysis_result.geojson'
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+def _row(kind: str, target: str, equal: bool, detail: str = '') -> dict:
+    return {'比較': kind, '対象': target, '一致': bool(equal), '詳細': detail}
+
+
+# ==================== 比較 ====================
+
+def compare_counts(ref_csv: Path, fast_csv: Path) -> dict:
+    """メッシュ別の件数（建物_*, 建物総数, 飲食店数）の完全一致と中心座標の誤差"""
+    ref = pd.read_csv(ref_csv, encoding='utf-8-sig').set_index('mesh_code')
+    fast = pd.read_csv(fast_csv, encoding='utf-8-sig').set_index('mesh_code')
+    count_cols = sorted(c for c in ref.columns if c.startswith('建物_')) + ['建物総数', '飲食店数']
+
+    problems = []
+    missing, extra = ref.index.difference(fast.index), fast.index.difference(ref.index)
+    if len(missing) or len(extra):
+        problems.append(f"メッシュ 欠落 {len(missing):,} / 余分 {len(extra):,}")
+    absent = [c for c in count_cols if c not in fast.columns]
+    if absent:
+        problems.append(f"列なし {absent}")
+
+    common = ref.index.intersection(fast.index)
+    for col in count_cols:
+        if col in absent:
+            continue
+        diff = int((ref.loc[common, col].to_numpy() != fast.loc[common, col].to_numpy()).sum())
+        if diff:
+            problems.append(f"{col} 不一致 {diff:,}メッシュ")
+
+    coord_err = max(float(np.abs(ref.loc[common, col].to_numpy() - fast.loc[common, col].to_numpy()).max(initial=0))
+                    for col in ['中心_経度', '中心_緯度'])
+    if coord_err > config.EQUIVALENCE_GEOMETRY_TOL:
+        problems.append(f"中心座標の最大誤差 {coord_err:.2e}°")
+
+    detail = '; '.join(problems) or f"{len(common):,}メッシュ × {len(count_cols)}列 一致（中心座標誤差 {coord_err:.1e}°）"
+    return _row('メッシュ別件数', str(MESH_RESULT_CSV), not problems, detail)
+
+
+def compare_labels(ref_csv: Path, fast_csv: Path, n_clusters: int):
+    """
+    クラスタ割り当てをラベルの付け替えを除いて比較
+    戻り値: (比較結果, 高速経路のラベル → 基準のラベル の対応表)
+    """
+    ref = pd.read_csv(ref_csv, encoding='utf-8-sig', usecols=['mesh_code', 'cluster'])
+    fast = pd.read_csv(fast_csv, encoding='utf-8-sig', usecols=['mesh_code', 'cluster'])
+    merged = ref.merge(fast, on='mesh_code', how='inner', suffixes=('_ref', '_fast'))
+    reference = merged['cluster_ref'].to_numpy(dtype=np.int64)
+    labels = merged['cluster_fast'].to_numpy(dtype=np.int64)
+
+    matched, _, _ = match_labels(reference, labels, n_clusters)
+    mapping = np.arange(n_clusters)
+    mapping[labels] = matched
+    agreement = float((matched == reference).mean()) if len(merged) else 0.0
+    ari = float(adjusted_rand_score(reference, labels)) if len(merged) else 0.0
+    unmatched = len(ref) + len(fast) - 2 * len(merged)
+
+    equal = agreement == 1.0 and unmatched == 0
+    detail = f"一致率 {agreement:.2%}, ARI {ari:.4f}, 対応 {dict(enumerate(mapping.tolist()))}"
+    if unmatched:
+        detail += f", 片方のみのメッシュ {unmatched:,}"
+    return _row('クラスタ割り当て', f'k{n_clusters:02d}', equal, detail), dict(enumerate(mapping.tolist()))
+
+
+def _values_close(a, b) -> bool:
+    """数値は許容誤差内、それ以外は完全一致"""
+    if isinstance(a, bool) or isinstance(b, bool) or not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+        return a == b
+    return bool(np.isclose(a, b, rtol=config.EQUIVALENCE_FLOAT_RTOL, atol=config.EQUIVALENCE_FLOAT_ATOL))
+
+
+def _diff_json(ref, fast, path='$') -> list:
+    """JSON 値の差分（パスの一覧）"""
+    if isinstance(ref, dict) and isinstance(fast, dict):
+        diffs = [f"{path}.{key}" for key in ref.keys() ^ fast.keys()]
+        for key in ref.keys() & fast.keys():
+            diffs += _diff_json(ref[key], fast[key], f"{path}.{key}")
+        return diffs
+    if isinstance(ref, list) and isinstance(fast, list):
+        if len(ref) != len(fast):
+            return [f"{path}（要素数 {len(ref)} ≠ {len(fast)}）"]
+        return [d for i, (r, f) in enumerate(zip(ref, fast)) for d in _diff_json(r, f, f"{path}[{i}]")]
+    return [] if _values_close(ref, fast) else [path]
+
+
+def compare_cluster_config(ref_json: Path, fast_json: Path, mapping: dict) -> dict:
+    """cluster_config_k*.json をクラスタ ID を対応付けてから比較"""
+    ref = json.loads(ref_json.read_text(encoding='utf-8'))
+    fast = json.loads(fast_json.read_text(encoding='utf-8'))
+    for cluster in fast.get('clusters', []):
+        cluster['id'] = mapping.get(cluster['id'], cluster['id'])
+    for doc in (ref, fast):
+        doc['clusters'] = sorted(doc.get('clusters', []), key=lambda c: c['id'])
+
+    diffs = _diff_json(ref, fast)
+    detail = f"差分 {len(diffs)}件: {', '.join(sorted(diffs)[:5])}" if diffs else 'JSON 一致'
+    return _row('Web JSON', ref_json.name, not diffs, detail)
+
+
+def compare_geojson(ref_path: Path, fast_path: Path, key: str, mapping: dict = None) -> dict:
+    """
+    GeoJSON を key 列で対応付け、共通の属性（数値は許容誤差内）と形状（Hausdorff 距離）を比較
+    mapping を渡すと高速経路側の cluster 列をその対応表で付け替える
+    """
+    ref = gpd.read_file(ref_path)
+    fast = gpd.read_file(fast_path)
+    if mapping is not None:
+        fast['cluster'] = fast['cluster'].map(mapping)
+    for gdf in (ref, fast):
+        gdf[key] = gdf[key].astype(str)
+    ref, fast = ref.set_index(key), fast.set_index(key)
+
+    problems = []
+    missing, extra = ref.index.difference(fast.index), fast.index.difference(ref.index)
+    if len(missing) or len(extra):
+        problems.append(f"地物 欠落 {len(missing):,} / 余分 {len(extra):,}")
+    common = ref.index.intersection(fast.index)
+    ref, fast = ref.loc[common], fast.loc[common]
+
+    for col in sorted((set(ref.columns) & set(fast.columns)) - {'geometry'}):
+        a, b = ref[col], fast[col]
+        if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            same = np.isclose(a.to_numpy(dtype=np.float64), b.to_numpy(dtype=np.float64),
+                              rtol=config.EQUIVALENCE_FLOAT_RTOL, atol=config.EQUIVALENCE_FLOAT_ATOL, equal_nan=True)
+        else:
+            same = (a.astype(str) == b.astype(str)).to_numpy()
+        if not same.all():
+            problems.append(f"{col} 不一致 {int((~same).sum()):,}件")
+
+    distance = shapely.hausdorff_distance(ref.geometry.values, fast.geometry.values)
+    max_distance = float(np.nanmax(distance, initial=0))
+    if max_distance > config.EQUIVALENCE_GEOMETRY_TOL:
+        n_far = int((distance > config.EQUIVALENCE_GEOMETRY_TOL).sum())
+        problems.append(f"形状の誤差超過 {n_far:,}件（最大 {max_distance:.2e}°）")
+
+    detail = '; '.join(problems) or f"{len(common):,}地物 一致（形状誤差 {max_distance:.1e}°）"
+    return _row('GeoJSON', ref_path.name, not problems, detail)
+
+
+def compare_outputs(ref_dir: Path, fast_dir: Path) -> pd.DataFrame:
+    """基準と高速経路の作業ディレクトリの出力を比較"""
+    rows = [compare_counts(ref_dir / MESH_RESULT_CSV, fast_dir / MESH_RESULT_CSV),
+            compare_geojson(ref_dir / MESH_RESULT_GEOJSON, fast_dir / MESH_RESULT_GEOJSON, 'mesh_code')]
+
+    for k_dir in sorted((ref_dir / 'output').glob('k[0-9][0-9]')):
+        k = int(k_dir.name[1:])
+        label_row, mapping = compare_labels(k_dir / 'mesh_with_clusters.csv',
+                                            fast_dir / 'output' / k_dir.name / 'mesh_with_clusters.csv', k)
+        rows.append(label_row)
+
+        web_ref, web_fast = ref_dir / 'web_data', fast_dir / 'web_data'
+        rows.append(compare_cluster_config(web_ref / f'cluster_config_k{k}.json',
+                                           web_fast / f'cluster_config_k{k}.json', mapping))
+        rows.append(compare_geojson(web_ref / f'mesh_clusters_k{k}.geojson',
+                                    web_fast / f'mesh_clusters_k{k}.geojson', 'mesh_code', mapping))
+        rows.append(compare_geojson(web_ref / f'cluster_outlines_k{k}.geojson',
+                                    web_fast / f'cluster_outlines_k{k}.geojson', 'cluster', mapping))
+    return pd.DataFrame(rows)
+
+
+# ==================== 実行 ====================
+
+def run_pipeline(sandbox: Path, steps, overrides: dict, name: str) -> list:
+    """パイプラインを順に実行し、ステップごとの処理時間・ピーク RSS を返す"""
+    records = []
+    for label, script in zip(STAGE_LABELS, steps):
+        result = run_script(sandbox, script, overrides)
+        records.append({'ステップ': label, '経路': name, 'スクリプト': script, **result})
+        print(f"  ✓ [{name}] {script}: {result['seconds']:.1f}秒, ピーク {result['peak_mb']:,.1f} MB")
+    return records
+
+
+def performance_table(ref_records: list, fast_records: list) -> pd.DataFrame:
+    """基準と高速経路の処理時間・ピーク RSS を並べる"""
+    rows = []
+    for ref, fast in zip(ref_records, fast_records):
+        rows.append({
+            'ステップ': ref['ステップ'],
+            '基準_秒': ref['seconds'], '高速_秒': fast['seconds'],
+            '高速化': ref['seconds'] / fast['seconds'] if fast['seconds'] > 0 else np.nan,
+            '基準_ピークMB': ref['peak_mb'], '高速_ピークMB': fast['peak_mb'],
+            'メモリ比': fast['peak_mb'] / ref['peak_mb'] if ref['peak_mb'] > 0 else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='高速経路と基準パイプラインの等価性検証')
+    parser.add_argument('--engine', default=','.join(ENGINES),
+                        help=f'検証する高速経路（カンマ区切り: {", ".join(ENGINES)}）')
+    parser.add_argument('--data', help='実データのディレクトリ（data/ と同じ構成。省略時は合成データ）')
+    parser.add_argument('--buildings', type=int, default=50000, help='合成する建物数')
+    parser.add_argument('--rows', type=int, default=40, help='メッシュ格子の行数')
+    parser.add_argument('--cols', type=int, default=60, help='メッシュ格子の列数')
+    parser.add_argument('--workdir', help='作業ディレクトリ（省略時は一時ディレクトリ）')
+    parser.add_argument('--keep', action='store_true', help='作業ディレクトリを削除しない')
+    args = parser.parse_args()
+
+    engines = [e.strip() for e in args.engine.split(',') if e.strip()]
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        parser.error(f"未知の高速経路: {unknown}（{list(ENGINES)} のいずれか）")
+
+    print("=" * 60)
+    print("高速経路の等価性検証")
+    print("=" * 60)
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='mesh_equivalence_'))
+    all_equal = True
+    try:
+        print_section("1. 入力データ")
+        if args.data:
+            data_dir = Path(args.data).resolve()
+            print(f"  ✓ 実データ: {data_dir}")
+        else:
+            counts = synthetic_data.generate(workdir, args.buildings, args.rows, args.cols)
+            data_dir = workdir / 'data'
+            print(f"  ✓ 合成データ メッシュ: {counts['meshes']:,}, 建物: {counts['buildings']:,}, "
+                  f"飲食店: {counts['food']:,}")
+        print(f"  作業ディレクトリ: {workdir}")
+
+        print_section("2. 基準パイプライン")
+        ref_dir = workdir / 'reference'
+        prepare_sandbox(ref_dir, data_dir)
+        ref_records = run_pipeline(ref_dir, REFERENCE_STEPS, {}, 'reference')
+
+        out_dir = Path(config.EQUIVALENCE_DIR)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for i, name in enumerate(engines, start=3):
+            engine = ENGINES[name]
+            print_section(f"{i}. 高速経路: {name}")
+            print(f"  {engine['description']}")
+            fast_dir = workdir / name
+            prepare_sandbox(fast_dir, data_dir)
+            fast_records = run_pipeline(fast_dir, engine['steps'], engine['config'], name)
+
+            report = compare_outputs(ref_dir, fast_dir)
+            performance = performance_table(ref_records, fast_records)
+            report.to_csv(out_dir / f'{name}_report.csv', index=False, encoding='utf-8-sig')
+            performance.to_csv(out_dir / f'{name}_performance.csv', index=False, encoding='utf-8-sig',
+                               float_format='%.3f')
+
+            print("\n  出力の比較:")
+            for rec in report.to_dict('records'):
+                print(f"    {'✓' if rec['一致'] else '❌'} {rec['比較']} {rec['対象']}: {rec['詳細']}")
+            print("\n  処理時間・ピーク RSS（基準 → 高速）:")
+            for rec in performance.to_dict('records'):
+                print(f"    {rec['ステップ']}: {rec['基準_秒']:.1f}秒 → {rec['高速_秒']:.1f}秒 "
+                      f"(×{rec['高速化']:.2f}), {rec['基準_ピークMB']:,.1f} MB → {rec['高速_ピークMB']:,.1f} MB")
+
+            equal = bool(report['一致'].all())
+            all_equal &= equal
+            print(f"\n  {'✅' if equal else '❌'} {name}: {int(report['一致'].sum())}/{len(report)} 項目が一致")
+            print(f"  ✓ {out_dir / f'{name}_report.csv'}")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if not all_equal:
+        print("\n❌ 一致しない出力があります（詳細は上の比較結果）")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析結果の GeoPackage（SQLite）エクスポート
+メッシュ集計・k別クラスタラベル・クラスタプロファイル・駅データを1つの .gpkg にまとめる。
+空間テーブルには R-tree 空間インデックス、mesh_code・cluster には B-tree インデックスを作成し、
+すべて1トランザクションの一括挿入で書き込む。QGIS でそのまま開ける
+
+使い方:
+    python export_geopackage.py [--output output/mesh_analysis.gpkg]
+"""
+import argparse
+import json
+import sqlite3
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import mesh_grid
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+GPKG_APPLICATION_ID = 0x47504B47  # 'GPKG'
+GPKG_USER_VERSION = 10300         # GeoPackage 1.3
+SRS_ID = 4326
+
+WGS84_WKT = (
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],'
+    'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433],AUTHORITY["EPSG","4326"]]'
+)
+
+# R-tree を更新するトリガ（GeoPackage 1.2 仕様。ST_* 関数は GDAL/QGIS 側が提供する）
+RTREE_TRIGGERS = """
+CREATE TRIGGER "rtree_{t}_{c}_insert" AFTER INSERT ON "{t}"
+WHEN (new."{c}" NOT NULL AND NOT ST_IsEmpty(NEW."{c}"))
+BEGIN
+  INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (
+    NEW."{i}", ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}"));
+END;
+CREATE TRIGGER "rtree_{t}_{c}_update1" AFTER UPDATE OF "{c}" ON "{t}"
+WHEN OLD."{i}" = NEW."{i}" AND (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}"))
+BEGIN
+  INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (
+    NEW."{i}", ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}"));
+END;
+CREATE TRIGGER "rtree_{t}_{c}_update2" AFTER UPDATE OF "{c}" ON "{t}"
+WHEN OLD."{i}" = NEW."{i}" AND (NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}"))
+BEGIN
+  DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}";
+END;
+CREATE TRIGGER "rtree_{t}_{c}_update3" AFTER UPDATE ON "{t}"
+WHEN OLD."{i}" != NEW."{i}" AND (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}"))
+BEGIN
+  DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}";
+  INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (
+    NEW."{i}", ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}"));
+END;
+CREATE TRIGGER "rtree_{t}_{c}_update4" AFTER UPDATE ON "{t}"
+WHEN OLD."{i}" != NEW."{i}" AND (NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}"))
+BEGIN
+  DELETE FROM "rtree_{t}_{c}" WHERE id IN (OLD."{i}", NEW."{i}");
+END;
+CREATE TRIGGER "rtree_{t}_{c}_delete" AFTER DELETE ON "{t}"
+WHEN old."{c}" NOT NULL
+BEGIN
+  DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}";
+END;
+"""
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+# ==================== ジオメトリ（GeoPackage バイナリ） ====================
+
+def _gpkg_header(min_x, max_x, min_y, max_y) -> bytes:
+    """GeoPackage ジオメトリヘッダ（リトルエンディアン, XY エンベロープ付き）"""
+    return b'GP' + struct.pack('<BBi4d', 0, 0b00000011, SRS_ID, min_x, max_x, min_y, max_y)
+
+
+def gpkg_polygon_rect(min_x, min_y, max_x, max_y) -> bytes:
+    """矩形ポリゴン（メッシュ）の GeoPackage ジオメトリ"""
+    ring = (min_x, min_y, max_x, min_y, max_x, max_y, min_x, max_y, min_x, min_y)
+    wkb = struct.pack('<BIII10d', 1, 3, 1, 5, *ring)
+    return _gpkg_header(min_x, max_x, min_y, max_y) + wkb
+
+
+def gpkg_point(x, y) -> bytes:
+    """点の GeoPackage ジオメトリ"""
+    return _gpkg_header(x, x, y, y) + struct.pack('<BI2d', 1, 1, x, y)
+
+
+# ==================== GeoPackage の骨組み ====================
+
+def _execute_script(conn: sqlite3.Connection, script: str):
+    """
+    複数の SQL 文を1文ずつ実行する
+    （executescript は実行前に COMMIT するため、トランザクション内では使わない）
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        conn.execute(statement)
+
+
+def _sql_type(series: pd.Series) -> str:
+    if pd.api.types.is_integer_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(series):
+        return 'DOUBLE'
+    return 'TEXT'
+
+
+def _py_values(df: pd.DataFrame):
+    """sqlite3 に渡せる Python 値の行タプル（NaN → NULL）"""
+    obj = df.astype(object).where(df.notna(), None)
+    for row in obj.itertuples(index=False, name=None):
+        yield tuple(v.item() if isinstance(v, np.generic) else v for v in row)
+
+
+def init_geopackage(conn: sqlite3.Connection):
+    """必須メタデータテーブルを作成"""
+    conn.execute(f'PRAGMA application_id = {GPKG_APPLICATION_ID}')
+    conn.execute(f'PRAGMA user_version = {GPKG_USER_VERSION}')
+    _execute_script(conn, """
+    CREATE TABLE gpkg_spatial_ref_sys (
+        srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL,
+        organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT);
+    CREATE TABLE gpkg_contents (
+        table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+        description TEXT DEFAULT '', last_change DATETIME NOT NULL,
+        min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+        srs_id INTEGER, CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id));
+    CREATE TABLE gpkg_geometry_columns (
+        table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL,
+        srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+        CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name));
+    CREATE TABLE gpkg_extensions (
+        table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL,
+        definition TEXT NOT NULL, scope TEXT NOT NULL,
+        CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name));
+    """)
+    conn.executemany(
+        'INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)',
+        [
+            ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+            ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+            ('WGS 84 geodetic', SRS_ID, 'EPSG', 4326, WGS84_WKT, None),
+        ]
+    )
+
+
+def _register(conn, table, data_type, bounds=None, geometry_type=None):
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    min_x, min_y, max_x, max_y = bounds if bounds is not None else (None, None, None, None)
+    conn.execute(
+        'INSERT INTO gpkg_contents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (table, data_type, table, '', now, min_x, min_y, max_x, max_y,
+         SRS_ID if data_type == 'features' else None)
+    )
+    if geometry_type:
+        conn.execute('INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, 0, 0)',
+                     (table, 'geom', geometry_type, SRS_ID))
+
+
+def write_table(conn, table: str, df: pd.DataFrame, geoms=None, geometry_type=None,
+                envelopes=None):
+    """
+    属性表（geoms=None）または地物テーブルを作成して一括挿入
+    地物テーブルの場合は R-tree を作成し、エンベロープ (minx, maxx, miny, maxy) を一括投入する
+    """
+    cols = ', '.join(f'"{c}" {_sql_type(df[c])}' for c in df.columns)
+    geom_col = '"geom" ' + geometry_type + ', ' if geoms is not None else ''
+    conn.execute(f'CREATE TABLE "{table}" (fid INTEGER PRIMARY KEY AUTOINCREMENT, {geom_col}{cols})')
+
+    names = (['geom'] if geoms is not None else []) + list(df.columns)
+    placeholders = ', '.join(['?'] * (len(names) + 1))
+    quoted = ', '.join(f'"{c}"' for c in names)
+    rows = _py_values(df)
+    if geoms is not None:
+        rows = ((g,) + r for g, r in zip(geoms, rows))
+    conn.executemany(
+        f'INSERT INTO "{table}" (fid, {quoted}) VALUES ({placeholders})',
+        ((i + 1,) + r for i, r in enumerate(rows))
+    )
+
+    if geoms is None:
+        _register(conn, table, 'attributes')
+        return
+
+    env = np.asarray(envelopes, dtype=np.float64)
+    bounds = (env[:, 0].min(), env[:, 2].min(), env[:, 1].max(), env[:, 3].max()) if len(env) else None
+    _register(conn, table, 'features', bounds, geometry_type)
+
+    conn.execute(f'CREATE VIRTUAL TABLE "rtree_{table}_geom" USING rtree(id, minx, maxx, miny, maxy)')
+    conn.executemany(
+        f'INSERT INTO "rtree_{table}_geom" VALUES (?, ?, ?, ?, ?)',
+        ((i + 1, *map(float, e)) for i, e in enumerate(env))
+    )
+    conn.execute(
+        'INSERT INTO gpkg_extensions VALUES (?, ?, ?, ?, ?)',
+        (table, 'geom', 'gpkg_rtree_index', 'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')
+    )
+    # トリガは一括挿入の後に作成（挿入時に ST_* 関数を呼ばないようにする）
+    _execute_script(conn, RTREE_TRIGGERS.format(t=table, c='geom', i='fid'))
+
+
+def register_feature_view(conn, view: str, select_sql: str, geometry_type: str, bounds):
+    """地物ビューを作成して GeoPackage に登録（QGIS でレイヤーとして開ける）"""
+    conn.execute(f'CREATE VIEW "{view}" AS {select_sql}')
+    _register(conn, view, 'features', bounds, geometry_type)
+
+
+# ==================== 入力の読み込み ====================
+
+def load_mesh_table() -> pd.DataFrame:
+    if not Path(config.OUTPUT_MESH_RESULT_CSV).exists():
+        raise FileNotFoundError(
+            f"集計結果が見つかりません: {config.OUTPUT_MESH_RESULT_CSV}\n"
+            "先に 1_mesh_analysis.py を実行してください"
+        )
+    df = pd.read_csv(config.OUTPUT_MESH_RESULT_CSV, encoding='utf-8-sig')
+    keep = ['mesh_code'] + [c for c in df.columns if c.startswith('建物_')] + \
+           ['飲食店数', '建物総数', '中心_経度', '中心_緯度']
+    df = df[[c for c in keep if c in df.columns]].copy()
+    df['mesh_code'] = df['mesh_code'].astype(np.int64)
+    return df
+
+
+def load_cluster_labels() -> pd.DataFrame:
+    frames = []
+    for csv_path in sorted(Path(config.OUTPUT_DIR).glob('k[0-9][0-9]/mesh_with_clusters.csv')):
+        k = int(csv_path.parent.name[1:])
+        kdf = pd.read_csv(csv_path, encoding='utf-8-sig', usecols=['mesh_code', 'cluster', 'cluster_name'])
+        kdf.insert(1, 'k', k)
+        frames.append(kdf)
+    if not frames:
+        return pd.DataFrame(columns=['mesh_code', 'k', 'cluster', 'cluster_name'])
+    labels = pd.concat(frames, ignore_index=True)
+    labels['mesh_code'] = labels['mesh_code'].astype(np.int64)
+    return labels
+
+
+def load_cluster_profiles() -> pd.DataFrame:
+    records = []
+    for json_path in sorted(Path(config.WEB_DATA_DIR).glob('cluster_config_k*.json')):
+        with open(json_path, encoding='utf-8') as f:
+            cfg = json.load(f)
+        for c in cfg['clusters']:
+            rec = {'k': cfg['cluster_count'], 'cluster': c['id'], 'name': c['name'], 'color': c['color'],
+                   'count': c['count'], 'avg_buildings': c['avg_buildings'],
+                   'avg_restaurants': c['avg_restaurants'], 'sum_buildings': c['sum_buildings'],
+                   'sum_restaurants': c['sum_restaurants']}
+            rec.update({f'建物_{u}': n for u, n in c.get('building_types', {}).items()})
+            rec.update({f'{u}_比率': r for u, r in c.get('ratios', {}).items()})
+            records.append(rec)
+    return pd.DataFrame(records)
+
+
+def load_station_features() -> pd.DataFrame:
+    with open(config.STATIONS_GEOJSON, encoding='utf-8') as f:
+        features = json.load(f)['features']
+    records = []
+    for feat in features:
+        coords = feat['geometry']['coordinates']
+        if feat['geometry']['type'] == 'MultiLineString':
+            coords = [pt for line in coords for pt in line]
+        xy = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        rec = dict(feat['properties'])
+        rec['経度'], rec['緯度'] = float(xy[:, 0].mean()), float(xy[:, 1].mean())
+        records.append(rec)
+    return pd.DataFrame(records)
+
+
+# ==================== エクスポート本体 ====================
+
+def export(output_path: Path):
+    output_path = Path(output_path)
+    if output_path.exists():
+        output_path.unlink()
+
+    print_section("1. データ読み込み")
+    mesh_df = load_mesh_table()
+    labels = load_cluster_labels()
+    profiles = load_cluster_profiles()
+    stations = load_station_features() if Path(config.STATIONS_GEOJSON).exists() else None
+    print(f"  ✓ メッシュ: {len(mesh_df):,}, クラスタラベル: {len(labels):,} 行 "
+          f"(k={sorted(labels['k'].unique().tolist())}), プロファイル: {len(profiles):,}")
+
+    print_section("2. GeoPackage 書き込み（1トランザクション）")
+    start_time = time.time()
+    conn = sqlite3.connect(output_path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    try:
+        conn.execute('BEGIN')
+        init_geopackage(conn)
+
+        # メッシュ（ポリゴン）: 形状はメッシュコードから生成
+        row, col = mesh_grid.decode_mesh_code(mesh_df['mesh_code'].values)
+        min_x = 100.0 + col * mesh_grid.CELL_LON_DEG
+        min_y = row * mesh_grid.CELL_LAT_DEG
+        max_x = min_x + mesh_grid.CELL_LON_DEG
+        max_y = min_y + mesh_grid.CELL_LAT_DEG
+        geoms = (gpkg_polygon_rect(*b) for b in zip(min_x, min_y, max_x, max_y))
+        write_table(conn, 'mesh', mesh_df, geoms, 'POLYGON',
+                    np.column_stack([min_x, max_x, min_y, max_y]))
+        conn.execute('CREATE UNIQUE INDEX idx_mesh_code ON mesh (mesh_code)')
+        print(f"  ✓ mesh: {len(mesh_df):,}")
+
+        if len(labels):
+            write_table(conn, 'mesh_cluster', labels)
+            conn.execute('CREATE INDEX idx_mesh_cluster_k_cluster ON mesh_cluster (k, cluster)')
+            conn.execute('CREATE INDEX idx_mesh_cluster_mesh_code ON mesh_cluster (mesh_code, k)')
+            print(f"  ✓ mesh_cluster: {len(labels):,}")
+
+            # k ごとのクラスタ付きメッシュ（QGIS 用ビュー）
+            bounds = (min_x.min(), min_y.min(), max_x.max(), max_y.max()) if len(mesh_df) else None
+            for k in sorted(labels['k'].unique()):
+                register_feature_view(
+                    conn, f'mesh_k{int(k)}',
+                    'SELECT m.fid AS fid, m.geom AS geom, m.mesh_code AS mesh_code, '
+                    'c.cluster AS cluster, c.cluster_name AS cluster_name, '
+                    'm."建物総数" AS "建物総数", m."飲食店数" AS "飲食店数" '
+                    f'FROM mesh m JOIN mesh_cluster c ON c.mesh_code = m.mesh_code AND c.k = {int(k)}',
+                    'POLYGON', bounds
+                )
+
+        if len(profiles):
+            write_table(conn, 'cluster_profile', profiles)
+            conn.execute('CREATE UNIQUE INDEX idx_cluster_profile ON cluster_profile (k, cluster)')
+            print(f"  ✓ cluster_profile: {len(profiles):,}")
+
+        if stations is not None:
+            geoms = (gpkg_point(x, y) for x, y in zip(stations['経度'], stations['緯度']))
+            env = np.column_stack([stations['経度'], stations['経度'], stations['緯度'], stations['緯度']])
+            write_table(conn, 'station', stations, geoms, 'POINT', env)
+            conn.execute('CREATE INDEX idx_station_name ON station ("駅名")')
+            print(f"  ✓ station: {len(stations):,}")
+
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.time() - start_time
+    size_mb = output_path.stat().st_size / 1024 / 1024
+    print(f"\n  ✓ {output_path} ({size_mb:.2f} MB, {elapsed:.1f}秒)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分析結果の GeoPackage エクスポート')
+    parser.add_argument('--output', default=config.GEOPACKAGE_PATH, help='出力先 .gpkg')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("GeoPackage エクスポート")
+    print("=" * 60)
+
+    try:
+        export(Path(args.output))
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,7 @@ let currentClusterCount = 6;        // 初期クラスター数
 let currentDisplayMode = 'cluster';  // 表示モード（cluster/density/buildings/用途別）
 let meshData = null;                 // メッシュ GeoJSON
 let clusterConfig = null;            // クラスター設定情報
+let outlineData = null;              // クラスター輪郭 GeoJSON（低ズーム用、無い場合は null）
 let visibleClusters = new Set();     // 可視クラスター ID 集合
 let stationData = null;              // 駅データ GeoJSON
 
@@ -25,6 +26,9 @@ let currentMode = 'passengers';       // 'mesh' または 'passengers'（初期
 let passengerShowStations = true;    // 駅表示フラグ
 let passengerShowStoreAreas = true;  // 出店エリア表示フラグ
 
+// このズーム未満ではメッシュ境界線の代わりにクラスター輪郭を表示
+const OUTLINE_MAX_ZOOM = 12;
+
 // バッファー生成用の閾値
 const MERGE_DISTANCE_METERS = 150;   // 駅間距離がこの値未満なら統合（m）
 const RADIUS_RULES = [               // 乗降客数に応じたバッファー半径（km）
@@ -91,6 +95,8 @@ function setupControls() {
       if (map.getLayer('mesh-fill')) map.removeLayer('mesh-fill');
       if (map.getLayer('mesh-outline')) map.removeLayer('mesh-outline');
       if (map.getSource('mesh-data')) map.removeSource('mesh-data');
+      if (map.getLayer('cluster-outline')) map.removeLayer('cluster-outline');
+      if (map.getSource('cluster-outlines')) map.removeSource('cluster-outlines');
       loadClusterData(currentClusterCount);
     });
   }
@@ -190,6 +196,9 @@ async function loadClusterData(k) {
     ]);
     meshData = await geojsonResponse.json();
     clusterConfig = await configResponse.json();
+    // クラスター輪郭（prepare_web_data.py の出力がある場合）
+    const outlineResponse = await fetch(`web_data/cluster_outlines_k${k}.geojson`).catch(() => null);
+    outlineData = outlineResponse && outlineResponse.ok ? await outlineResponse.json() : null;
     console.log(`メッシュデータ読み込み完了: ${meshData.features.length} メッシュ`);
     visibleClusters = new Set(clusterConfig.clusters.map(c => c.id));
     // 地図が既にスタイル読み込み済みかを確認
@@ -218,6 +227,8 @@ function updateMap() {
   if (map.getLayer('mesh-fill')) map.removeLayer('mesh-fill');
   if (map.getLayer('mesh-outline')) map.removeLayer('mesh-outline');
   if (map.getSource('mesh-data')) map.removeSource('mesh-data');
+  if (map.getLayer('cluster-outline')) map.removeLayer('cluster-outline');
+  if (map.getSource('cluster-outlines')) map.removeSource('cluster-outlines');
   // 新しいソースを追加
   map.addSource('mesh-data', { type: 'geojson', data: meshData });
   // メッシュ塗りつぶしレイヤー
@@ -233,11 +244,12 @@ function updateMap() {
       'visibility': currentMode === 'mesh' ? 'visible' : 'none'
     }
   });
-  // メッシュ境界線レイヤー
+  // メッシュ境界線レイヤー（輪郭データがある場合は高ズームのみ）
   map.addLayer({
     id: 'mesh-outline',
     type: 'line',
     source: 'mesh-data',
+    minzoom: outlineData ? OUTLINE_MAX_ZOOM : 0,
     paint: {
       'line-color': '#666',
       'line-width': 0.5,
@@ -247,6 +259,24 @@ function updateMap() {
       'visibility': currentMode === 'mesh' ? 'visible' : 'none'
     }
   });
+  // クラスター輪郭レイヤー（同じクラスターのメッシュを融合した境界、低ズーム用）
+  if (outlineData) {
+    map.addSource('cluster-outlines', { type: 'geojson', data: outlineData });
+    map.addLayer({
+      id: 'cluster-outline',
+      type: 'line',
+      source: 'cluster-outlines',
+      maxzoom: OUTLINE_MAX_ZOOM,
+      paint: {
+        'line-color': '#333',
+        'line-width': 1,
+        'line-opacity': 0.6
+      },
+      layout: {
+        'visibility': currentMode === 'mesh' ? 'visible' : 'none'
+      }
+    });
+  }
   // メッシュレイヤーのポップアップイベント（クラスター情報表示）
   if (!map._clusterEventListenersAdded) {
     map.on('click', 'mesh-fill', (e) => {
@@ -260,8 +290,16 @@ function updateMap() {
           html += `<p><strong>クラスター名:</strong> ${cluster.name}</p>`;
         }
       }
+      // クラスタ安定性（cluster_stability.py の出力がある場合）
+      if (properties['クラスタ信頼度'] !== undefined && properties['クラスタ信頼度'] !== null) {
+        html += `<p><strong>クラスター信頼度:</strong> ${(properties['クラスタ信頼度'] * 100).toFixed(0)}%</p>`;
+      }
       html += `<p><strong>建物総数:</strong> ${properties['建物総数']}</p>`;
       html += `<p><strong>飲食店数:</strong> ${properties['飲食店数']}</p>`;
+      // 主要業種（restaurant_categories.py の出力がある場合）
+      if (properties['主要業種'] && properties['主要業種_件数'] > 0) {
+        html += `<p><strong>主要業種:</strong> ${properties['主要業種']} (${properties['主要業種_件数']}件 / ${properties['業種数']}業種)</p>`;
+      }
       // 用途別建物数を割合付きで表示
       const usages = ['官公庁施設', '共同住宅', '住宅', '商業施設', '文教厚生施設',
                       '業務施設', '商業系複合施設', '店舗等併用住宅', '店舗等併用共同住宅', '宿泊施設'];
@@ -512,6 +550,7 @@ function switchMode(mode) {
     // メッシュレイヤーを非表示
     if (map.getLayer('mesh-fill')) map.setLayoutProperty('mesh-fill', 'visibility', 'none');
     if (map.getLayer('mesh-outline')) map.setLayoutProperty('mesh-outline', 'visibility', 'none');
+    if (map.getLayer('cluster-outline')) map.setLayoutProperty('cluster-outline', 'visibility', 'none');
     // 駅・バッファーを更新
     updateStationDisplay();
     updateStoreAreas();
@@ -532,6 +571,7 @@ function switchMode(mode) {
     // メッシュレイヤーを表示
     if (map.getLayer('mesh-fill')) map.setLayoutProperty('mesh-fill', 'visibility', 'visible');
     if (map.getLayer('mesh-outline')) map.setLayoutProperty('mesh-outline', 'visibility', 'visible');
+    if (map.getLayer('cluster-outline')) map.setLayoutProperty('cluster-outline', 'visibility', 'visible');
     // 駅とバッファーを非表示
     if (map.getLayer('stations')) map.setLayoutProperty('stations', 'visibility', 'none');
     if (map.getLayer('station-labels')) map.setLayoutProperty('station-labels', 'visibility', 'none');
@@ -550,6 +590,7 @@ function updateMapStyle() {
   const filter = ['in', ['get', 'cluster'], ['literal', Array.from(visibleClusters)]];
   map.setFilter('mesh-fill', filter);
   map.setFilter('mesh-outline', filter);
+  if (map.getLayer('cluster-outline')) map.setFilter('cluster-outline', filter);
   // 色設定
   let colorExpression;
   if (currentDisplayMode === 'cluster') {
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+メッシュ集計の分割実行（map-reduce）
+建物・飲食店ファイルを行チャンク単位でワーカープロセスに割り当て（map）、
+メッシュコード演算で250mメッシュに集計した部分結果を1次メッシュごとに書き出し、
+1次メッシュ単位で合算（reduce）して 1_mesh_analysis.py と同じ形式の結果を作る
+
+使い方:
+    python mesh_aggregation.py [--workers N] [--chunk-rows N] [--all-meshes]
+"""
+import argparse
+import glob
+import hashlib
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely import box
+
+import mesh_grid
+
+# pyarrow は任意（無い場合は pandas の read_csv で読み込む）
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+# ==================== 共通処理 ====================
+
+def points_to_mesh_codes(lon, lat) -> np.ndarray:
+    """経度・緯度を250mメッシュコードに変換（空間結合の代わり）"""
+    return mesh_grid.encode_mesh_code(*mesh_grid.lonlat_to_cell(lon, lat))
+
+
+def prepare_buildings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    建物表の usage_ja を補完して対象用途に絞り込み、経度・緯度を付ける
+    （1_mesh_analysis.py のステップ2と同じ規則）
+    """
+    df['usage'] = df['usage'].astype(str)
+    if 'usage_ja' not in df.columns:
+        df['usage_ja'] = df['usage'].map(config.TARGET_USAGES)
+    else:
+        mask = df['usage_ja'].isna() | (df['usage_ja'] == '')
+        if mask.any():
+            df.loc[mask, 'usage_ja'] = df.loc[mask, 'usage'].map(config.TARGET_USAGES)
+
+    df = df[df['usage'].isin(config.TARGET_USAGES.keys())]
+
+    if 'cx' in df.columns and 'cy' in df.columns:
+        lon, lat = df['cx'].values, df['cy'].values
+    else:
+        points = df.geometry.representative_point()
+        lon, lat = points.x.values, points.y.values
+
+    return pd.DataFrame({'経度': lon, '緯度': lat, 'usage_ja': df['usage_ja'].values})
+
+
+def read_building_points(path) -> pd.DataFrame:
+    """
+    建物ファイルを読み込み prepare_buildings の表（経度, 緯度, usage_ja）にする
+    pyogrio があれば集計に使う列だけ読む（cx, cy がある場合は点ジオメトリの読み込みも省く）
+    """
+    try:
+        import pyogrio
+    except ImportError:
+        return prepare_buildings(gpd.read_file(path))
+    fields = set(pyogrio.read_info(path)['fields'])
+    keep = [c for c in ['usage', 'usage_ja', 'cx', 'cy'] if c in fields]
+    return prepare_buildings(gpd.read_file(path, engine='pyogrio', columns=keep,
+                                           read_geometry=not {'cx', 'cy'} <= fields))
+
+
+def food_bounds_mask(food: pd.DataFrame, bounds=None) -> np.ndarray:
+    """
+    緯度経度が有効な行のマスク（欠損・非有限値・範囲外は False）
+    bounds: (緯度最小, 緯度最大, 経度最小, 経度最大)。省略時は config.FOOD_*
+    """
+    lat_min, lat_max, lon_min, lon_max = bounds or (config.FOOD_LAT_MIN, config.FOOD_LAT_MAX,
+                                                    config.FOOD_LON_MIN, config.FOOD_LON_MAX)
+    lat = food['緯度'].to_numpy(dtype=np.float64, na_value=np.nan)
+    lon = food['経度'].to_numpy(dtype=np.float64, na_value=np.nan)
+    # NaN との比較は False になるため、欠損もここで除外される
+    return (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+
+
+def filter_food_bounds(food: pd.DataFrame, bounds=None) -> pd.DataFrame:
+    """緯度経度の欠損・範囲外を除外"""
+    return food[food_bounds_mask(food, bounds)]
+
+
+# ==================== 飲食店CSVの読み込み ====================
+
+# 欠損として扱う値（pyarrow.csv.ConvertOptions の既定値。pandas で読む場合も同じ値を使う）
+FOOD_NULL_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                    'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null']
+
+
+def file_sha256(path) -> str:
+    """ファイル内容の SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def food_ingest_columns(path):
+    """
+    飲食店CSVから読む列（ヘッダのみ読んで決める）
+    戻り値: (読む列, 業種列 or None)。緯度・経度・最初に見つかった業種列・重複判定に使う列
+    """
+    header = pd.read_csv(path, encoding='utf-8-sig', nrows=0).columns
+    if '緯度' not in header or '経度' not in header:
+        raise ValueError(f"緯度・経度の列がありません: {path}（列: {list(header)}）")
+    category_col = next((c for c in config.RESTAURANT_CATEGORY_COLUMNS if c in header), None)
+    wanted = ['緯度', '経度', category_col] + list(config.FOOD_DEDUP_COLUMNS)
+    return [c for c in dict.fromkeys(wanted) if c in header], category_col
+
+
+def food_reader() -> str:
+    """飲食店CSVの読み込みに使うリーダー名（キャッシュキーに含める）"""
+    return 'arrow' if pa_csv is not None else 'pandas'
+
+
+def _read_food_table(path, columns, category_col) -> pd.DataFrame:
+    """
+    必要な列だけを型を指定して読み込む（座標は float64、業種は category、他は文字列）
+    空欄・FOOD_NULL_VALUES は文字列列でも欠損にし、Arrow と pandas で同じ表になるようにする
+    """
+    if pa_csv is not None:
+        column_types = {c: pa.string() for c in columns}
+        column_types.update({'緯度': pa.float64(), '経度': pa.float64()})
+        if category_col:
+            column_types[category_col] = pa.dictionary(pa.int32(), pa.string())
+        table = pa_csv.read_csv(
+            path,
+            read_options=pa_csv.ReadOptions(use_threads=True),
+            convert_options=pa_csv.ConvertOptions(include_columns=columns, column_types=column_types,
+                                                  null_values=FOOD_NULL_VALUES, strings_can_be_null=True),
+        )
+        food = table.to_pandas()
+    else:
+        dtype = {c: str for c in columns}
+        dtype.update({'緯度': np.float64, '経度': np.float64})
+        if category_col:
+            dtype[category_col] = 'category'
+        food = pd.read_csv(path, encoding='utf-8-sig', usecols=columns, dtype=dtype,
+                           keep_default_na=False, na_values=FOOD_NULL_VALUES)[columns]
+
+    # カテゴリの並びは出現順（Arrow）と辞書順（pandas）で異なるため辞書順に揃える
+    if category_col:
+        food[category_col] = food[category_col].cat.reorder_categories(
+            sorted(food[category_col].cat.categories))
+    return food
+
+
+def read_food_csv(path, use_cache: bool = True) -> pd.DataFrame:
+    """
+    飲食店CSVを必要な列だけ型付きで読み込む（除外・重複処理の前の全行）
+    読み込んだ表は CSV の SHA-256・リーダー・列構成をキーに config.FOOD_CACHE_DIR にバイナリで保存し、
+    次回からは CSV を解析せずにそれを読む（parquet。pyarrow が無い場合は pickle）
+    """
+    columns, category_col = food_ingest_columns(path)
+    if not use_cache:
+        return _read_food_table(path, columns, category_col)
+
+    cache_dir = Path(config.FOOD_CACHE_DIR)
+    key = hashlib.sha256('|'.join([food_reader()] + columns).encode('utf-8')).hexdigest()[:8]
+    suffix = '.parquet' if pa is not None else '.pkl'
+    cache_path = cache_dir / f'food_{file_sha256(path)[:16]}_{key}{suffix}'
+    if cache_path.exists():
+        return pd.read_parquet(cache_path) if suffix == '.parquet' else pd.read_pickle(cache_path)
+
+    food = _read_food_table(path, columns, category_col)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # ワーカーが同じファイルを同時に書いても壊れないよう、一時ファイルから置き換える
+    tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+    if suffix == '.parquet':
+        food.to_parquet(tmp_path, index=False)
+    else:
+        food.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+    return food
+
+
+def clean_food(food: pd.DataFrame, bounds=None):
+    """
+    座標の検証と重複登録の除去（いずれも列単位のベクトル演算）
+    - 座標の欠損・範囲外を除外
+    - config.FOOD_DEDUP_COLUMNS の値がすべて同じ行は重複登録として1件にする
+      （座標以外の列が CSV に無い場合は、同じ地点の別店舗を消さないよう行わない）
+    - 同一座標に config.FOOD_STACK_WARN 件以上重なる地点（ジオコーディングの代表点の疑い）を数える
+    戻り値: (除外後の表, 件数の内訳)
+    """
+    stats = {'read': len(food)}
+    food = food[food_bounds_mask(food, bounds)]
+    stats['invalid'] = stats['read'] - len(food)
+
+    # 座標の組に番号を振る（複素数1つにまとめて1回のハッシュで済ませる）
+    point_id = pd.factorize(food['緯度'].to_numpy() + 1j * food['経度'].to_numpy())[0]
+    point_size = np.bincount(point_id)
+
+    keys = [c for c in config.FOOD_DEDUP_COLUMNS if c in food.columns]
+    duplicated = np.zeros(len(food), dtype=bool)
+    if set(keys) - {'緯度', '経度'}:
+        # 座標が重複判定に含まれる場合、重複しうるのは他の行と座標が同じ行だけ
+        candidates = point_size[point_id] > 1 if {'緯度', '経度'} <= set(keys) else np.ones(len(food), dtype=bool)
+        duplicated[candidates] = food[candidates].duplicated(subset=keys).to_numpy()
+        food = food[~duplicated]
+        point_id = point_id[~duplicated]
+        point_size = np.bincount(point_id, minlength=len(point_size))
+    stats['duplicates'] = int(duplicated.sum())
+
+    stacked = point_size[point_size >= config.FOOD_STACK_WARN]
+    stats['stacked_points'] = len(stacked)
+    stats['stacked_rows'] = int(stacked.sum())
+    stats['kept'] = len(food)
+    return food, stats
+
+
+def load_food(path, bounds=None, use_cache: bool = True):
+    """飲食店CSVを読み込み、座標検証・重複除去を行う。戻り値: (表, 件数の内訳)"""
+    return clean_food(read_food_csv(path, use_cache), bounds)
+
+
+def food_stats_lines(stats: dict) -> list:
+    """件数の内訳の表示用の行"""
+    lines = [f"総飲食店数: {stats['read']:,}",
+             f"座標の欠損・範囲外: {stats['invalid']:,}, 重複登録: {stats['duplicates']:,}",
+             f"有効飲食店数: {stats['kept']:,}"]
+    if stats['stacked_points']:
+        lines.append(f"⚠️ 同一座標に{config.FOOD_STACK_WARN}件以上重なる地点: "
+                     f"{stats['stacked_points']:,}か所（{stats['stacked_rows']:,}件）")
+    return lines
+
+
+def count_buildings(buildings: pd.DataFrame) -> pd.DataFrame:
+    """(mesh_code, usage_ja) ごとの建物数（縦持ち）"""
+    codes = points_to_mesh_codes(buildings['経度'].values, buildings['緯度'].values)
+    return (pd.DataFrame({'mesh_code': codes, 'usage_ja': buildings['usage_ja'].values})
+            .groupby(['mesh_code', 'usage_ja']).size().reset_index(name='count'))
+
+
+def count_food(food: pd.DataFrame) -> pd.DataFrame:
+    """mesh_code ごとの飲食店数"""
+    codes = points_to_mesh_codes(food['経度'].values, food['緯度'].values)
+    return pd.Series(codes).value_counts().rename_axis('mesh_code').reset_index(name='飲食店数')
+
+
+def build_result_table(building_counts: pd.DataFrame, food_counts: pd.DataFrame) -> pd.DataFrame:
+    """
+    縦持ちの集計結果を 1_mesh_analysis.py と同じ列構成の表にする
+    （建物_{用途}, 飲食店数, 建物総数, 中心_経度, 中心_緯度）
+    """
+    building_pivot = building_counts.pivot_table(
+        index='mesh_code', columns='usage_ja', values='count', aggfunc='sum', fill_value=0
+    )
+    building_pivot.columns = ['建物_' + col for col in building_pivot.columns]
+    building_pivot = building_pivot.reset_index()
+
+    food_counts = food_counts.groupby('mesh_code', as_index=False)['飲食店数'].sum()
+    result = building_pivot.merge(food_counts, on='mesh_code', how='outer')
+
+    building_cols = [col for col in result.columns if col.startswith('建物_')]
+    for col in building_cols + ['飲食店数']:
+        result[col] = result[col].fillna(0).astype(int)
+    result['建物総数'] = result[building_cols].sum(axis=1)
+
+    result = result[(result['建物総数'] > 0) | (result['飲食店数'] > 0)]
+    result = result.sort_values('mesh_code').reset_index(drop=True)
+
+    lon, lat = mesh_grid.cell_center(*mesh_grid.decode_mesh_code(result['mesh_code'].values))
+    result['中心_経度'] = lon
+    result['中心_緯度'] = lat
+    return result
+
+
+def compact_counts(df: pd.DataFrame, cols=None) -> pd.DataFrame:
+    """
+    件数列を最小の符号なし整数型（uint16 / uint32）に変換（メモリ節約モード）
+    cols を省略した場合は 建物_*（_比率 を除く）・建物総数・飲食店数
+    """
+    if cols is None:
+        cols = [c for c in df.columns
+                if (c.startswith('建物_') and not c.endswith('_比率')) or c in ('建物総数', '飲食店数')]
+    for col in cols:
+        dtype = np.uint16 if df[col].max() <= np.iinfo(np.uint16).max else np.uint32
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def mesh_polygons(mesh_codes) -> gpd.GeoSeries:
+    """メッシュコードから矩形ポリゴンを作成（EPSG:4326）"""
+    row, col = mesh_grid.decode_mesh_code(mesh_codes)
+    lon0 = 100.0 + col * mesh_grid.CELL_LON_DEG
+    lat0 = row * mesh_grid.CELL_LAT_DEG
+    return gpd.GeoSeries(
+        box(lon0, lat0, lon0 + mesh_grid.CELL_LON_DEG, lat0 + mesh_grid.CELL_LAT_DEG),
+        crs='EPSG:4326'
+    )
+
+
+def save_result_table(result: pd.DataFrame, csv_path, geojson_path):
+    """集計結果を CSV と GeoJSON で保存"""
+    result_gdf = gpd.GeoDataFrame(result, geometry=mesh_polygons(result['mesh_code'].values).values,
+                                  crs='EPSG:4326')
+    result_gdf.to_file(geojson_path, driver='GeoJSON', encoding='utf-8')
+    print(f"   ✅ {geojson_path}")
+
+    result.to_csv(csv_path, index=False, encoding='utf-8')
+    print(f"   ✅ {csv_path}")
+
+
+def load_mesh_codes_from_shapefiles(mesh_dir) -> np.ndarray:
+    """
+    メッシュShapefileの属性表からメッシュコードのみ読み込む（ジオメトリは読まない）
+    1_mesh_analysis.py と同じファイル・行の順（重複は最初の出現のみ）
+    """
+    codes = []
+    for file in Path(mesh_dir).rglob('*.shp'):
+        attrs = gpd.read_file(file, encoding='shift-jis', ignore_geometry=True)
+        for key in ('KEY_CODE', 'MESH_CODE'):
+            if key in attrs.columns:
+                codes.append(attrs[key].astype(np.int64).values)
+                break
+    return pd.unique(np.concatenate(codes)) if codes else np.empty(0, dtype=np.int64)
+
+
+# ==================== map-reduce ====================
+
+def expand_inputs(patterns) -> list:
+    """ファイルパス・glob パターンのリストを実在ファイルのリストに展開"""
+    files = []
+    for pattern in patterns:
+        matched = sorted(glob.glob(str(pattern)))
+        files.extend(matched if matched else [p for p in [str(pattern)] if os.path.exists(p)])
+    return list(dict.fromkeys(files))
+
+
+def municipality_code(path) -> str:
+    """ファイル名から5桁の自治体コードを取り出す（例: fukuoka_40100_... → 40100）"""
+    m = re.search(r'(?<!\d)(\d{5})(?!\d)', Path(path).name)
+    return m.group(1) if m else Path(path).stem
+
+
+def plan_tasks(building_files, food_files, chunk_rows: int) -> list:
+    """
+    map タスクの一覧を作成
+    建物 GeoJSON は地物数を調べて行チャンクに分割、飲食店CSVはファイル単位
+    （pyogrio が無い場合は建物もファイル単位）
+    """
+    try:
+        import pyogrio
+    except ImportError:
+        pyogrio = None
+
+    tasks = []
+    for path in building_files:
+        if pyogrio is None:
+            tasks.append(('building', path, 0, None))
+            continue
+        n_rows = pyogrio.read_info(path)['features']
+        for start in range(0, max(n_rows, 1), chunk_rows):
+            tasks.append(('building', path, start, min(start + chunk_rows, n_rows)))
+    for path in food_files:
+        tasks.append(('food', path, 0, None))
+    return tasks
+
+
+def _spill(counts: pd.DataFrame, kind: str, task_id: int, spill_dir: Path):
+    """部分集計を1次メッシュごとに分割して書き出す（shuffle）"""
+    mesh1 = mesh_grid.first_level_mesh(counts['mesh_code'].values)
+    for code, part in counts.groupby(mesh1):
+        out = spill_dir / kind / str(code)
+        out.mkdir(parents=True, exist_ok=True)
+        part.to_pickle(out / f'{task_id:06d}.pkl')
+
+
+def map_task(task_id: int, task: tuple, spill_dir: Path) -> dict:
+    """
+    map: 入力ファイルの一部を読み込み、メッシュ単位の部分集計を書き出す
+    戻り値は件数の要約のみ（集計本体はディスク経由で reduce に渡す）
+    """
+    kind, path, start, stop = task
+    if kind == 'building':
+        gdf = gpd.read_file(path, rows=slice(start, stop) if stop is not None else None)
+        n_read = len(gdf)
+        buildings = prepare_buildings(gdf)
+        counts = count_buildings(buildings)
+        n_kept = len(buildings)
+    else:
+        food, stats = load_food(path)
+        n_read = stats['read']
+        counts = count_food(food)
+        n_kept = len(food)
+
+    _spill(counts, kind, task_id, spill_dir)
+    return {'kind': kind, 'municipality': municipality_code(path), 'read': n_read, 'kept': n_kept}
+
+
+def reduce_partition(mesh1: str, spill_dir: Path) -> pd.DataFrame:
+    """reduce: 1次メッシュ1つ分の部分集計を合算して結果表にする"""
+    def _load(kind, columns):
+        files = sorted((spill_dir / kind / mesh1).glob('*.pkl'))
+        if not files:
+            return pd.DataFrame(columns=columns)
+        return pd.concat([pd.read_pickle(f) for f in files], ignore_index=True)
+
+    building_counts = _load('building', ['mesh_code', 'usage_ja', 'count'])
+    food_counts = _load('food', ['mesh_code', '飲食店数'])
+    building_counts = building_counts.groupby(['mesh_code', 'usage_ja'], as_index=False)['count'].sum()
+    return build_result_table(building_counts, food_counts)
+
+
+def run_partitioned(building_files, food_files, workers: int = None, chunk_rows: int = None,
+                    spill_dir=None, mesh_codes: np.ndarray = None) -> pd.DataFrame:
+    """
+    分割実行の本体。mesh_codes を渡すとその集合に含まれるメッシュのみ mesh_codes の順に残す
+    （K-means の結果は行の順序に依存するため、1_mesh_analysis.py と同じ行順にする）
+    """
+    workers = workers or config.PARTITION_WORKERS or os.cpu_count() or 1
+    chunk_rows = chunk_rows or config.PARTITION_CHUNK_ROWS
+    spill_dir = Path(spill_dir or config.PARTITION_SPILL_DIR)
+
+    if spill_dir.exists():
+        shutil.rmtree(spill_dir)
+    spill_dir.mkdir(parents=True)
+
+    tasks = plan_tasks(building_files, food_files, chunk_rows)
+    print(f"   map タスク数: {len(tasks):,}（ワーカー {workers}）")
+
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(map_task, i, t, spill_dir) for i, t in enumerate(tasks)]
+        summaries = [f.result() for f in futures]
+    summary = pd.DataFrame(summaries).groupby(['kind', 'municipality'])[['read', 'kept']].sum()
+    print(f"   ✓ map 完了 ({time.time() - start_time:.1f}秒)")
+    print(summary.to_string())
+
+    partitions = sorted({p.name for kind in ('building', 'food')
+                         for p in (spill_dir / kind).glob('*') if p.is_dir()})
+    print(f"\n   reduce パーティション数（1次メッシュ）: {len(partitions):,}")
+
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(reduce_partition, p, spill_dir) for p in partitions]
+        parts = [f.result() for f in futures]
+    print(f"   ✓ reduce 完了 ({time.time() - start_time:.1f}秒)")
+
+    shutil.rmtree(spill_dir, ignore_errors=True)
+
+    result = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=['mesh_code'])
+    # パーティションごとに出現する用途が異なるため、欠けた建物列を0で補う
+    building_cols = sorted(c for c in result.columns if c.startswith('建物_'))
+    result[building_cols] = result[building_cols].fillna(0).astype(int)
+    front = ['mesh_code'] + building_cols + ['飲食店数', '建物総数', '中心_経度', '中心_緯度']
+    result = result[front].sort_values('mesh_code').reset_index(drop=True)
+
+    if mesh_codes is not None and len(mesh_codes):
+        position = pd.Index(mesh_codes).get_indexer(result['mesh_code'])
+        inside = position >= 0
+        result = result[inside].iloc[np.argsort(position[inside], kind='stable')].reset_index(drop=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='メッシュ集計の分割実行（map-reduce）')
+    parser.add_argument('--workers', type=int, default=None, help='ワーカープロセス数')
+    parser.add_argument('--chunk-rows', type=int, default=None, help='建物ファイルの1タスクあたり行数')
+    parser.add_argument('--all-meshes', action='store_true',
+                        help='メッシュShapefileに無いメッシュも出力する')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    print("=" * 70)
+    print("🏗️  250mメッシュ集計（分割実行）")
+    print("=" * 70)
+
+    building_files = expand_inputs(config.PARTITION_BUILDING_FILES)
+    food_files = expand_inputs(config.PARTITION_FOOD_FILES)
+    if not building_files and not food_files:
+        raise FileNotFoundError("❌ 入力ファイルが見つかりません（config.PARTITION_*_FILES を確認してください）")
+    print(f"   建物ファイル: {len(building_files)}件, 飲食店ファイル: {len(food_files)}件")
+
+    mesh_codes = None
+    if not args.all_meshes and Path(config.INPUT_MESH_DIR).exists():
+        mesh_codes = load_mesh_codes_from_shapefiles(config.INPUT_MESH_DIR)
+        if len(mesh_codes):
+            print(f"   メッシュShapefileの範囲に限定: {len(mesh_codes):,} メッシュ")
+
+    result = run_partitioned(building_files, food_files, workers=args.workers,
+                             chunk_rows=args.chunk_rows, mesh_codes=mesh_codes)
+
+    print(f"\n   有効メッシュ数: {len(result):,}")
+    print(f"   総建物数: {result['建物総数'].sum():,}")
+    print(f"   総飲食店数: {result['飲食店数'].sum():,}")
+
+    print("\n💾 結果保存中...")
+    Path(config.OUTPUT_DIR).mkdir(exist_ok=True)
+    save_result_table(result, config.OUTPUT_MESH_RESULT_CSV, config.OUTPUT_MESH_RESULT_GEOJSON)
+
+    print(f"\n✅ 集計完了 ({time.time() - start_time:.1f}秒)")
+    print("\n次のステップ: python 2_cluster_analysis_multi.py")
+
+
+if __name__ == '__main__':
+    main()
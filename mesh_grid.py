@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+地域メッシュコード演算ユーティリティ
+250mメッシュ（5次メッシュ, 10桁）のコードを行・列インデックスに変換し、
+ジオメトリ演算（touches等）を使わずに隣接関係・空間ラグを計算する
+"""
+import numpy as np
+import scipy.sparse as sp
+
+# 250mメッシュの大きさ（度）
+# 1次メッシュ: 緯度40分 × 経度1度 を 320 × 320 分割
+CELL_LAT_DEG = 1.0 / 480.0   # 7.5秒
+CELL_LON_DEG = 1.0 / 320.0   # 11.25秒
+
+# 1次メッシュあたりの250mメッシュ数（行・列とも）
+CELLS_PER_MESH1 = 320
+
+# 距離計算用の地球半径（m）
+EARTH_RADIUS_M = 6371008.8
+
+
+def _as_int_codes(mesh_codes) -> np.ndarray:
+    """メッシュコード（文字列・数値混在可）を int64 配列に変換"""
+    codes = np.asarray(mesh_codes)
+    if codes.dtype.kind in ('U', 'S', 'O'):
+        codes = codes.astype(str).astype(np.int64)
+    return codes.astype(np.int64, copy=False)
+
+
+def decode_mesh_code(mesh_codes):
+    """
+    10桁の250mメッシュコードを (row, col) に変換
+    row: 緯度方向の通し番号（= floor(緯度 × 480)）
+    col: 経度方向の通し番号（= floor((経度 - 100) × 320)）
+    """
+    codes = _as_int_codes(mesh_codes)
+    if codes.size and (codes.min() < 10**9 or codes.max() >= 10**10):
+        raise ValueError("250mメッシュコード（10桁）以外の値が含まれています")
+
+    p = codes // 10**8            # 1次メッシュ 緯度部（2桁）
+    u = codes // 10**6 % 100      # 1次メッシュ 経度部（2桁）
+    q = codes // 10**5 % 10       # 2次メッシュ 緯度
+    v = codes // 10**4 % 10       # 2次メッシュ 経度
+    r = codes // 10**3 % 10       # 3次メッシュ 緯度
+    w = codes // 10**2 % 10       # 3次メッシュ 経度
+    half = codes // 10 % 10 - 1   # 2分の1メッシュ（1:南西 2:南東 3:北西 4:北東）
+    quarter = codes % 10 - 1      # 4分の1メッシュ
+
+    if ((half < 0) | (half > 3) | (quarter < 0) | (quarter > 3)).any():
+        raise ValueError("2分の1・4分の1メッシュの桁は 1〜4 である必要があります")
+
+    row = p * 320 + q * 40 + r * 4 + (half // 2) * 2 + quarter // 2
+    col = u * 320 + v * 40 + w * 4 + (half % 2) * 2 + quarter % 2
+    return row.astype(np.int64), col.astype(np.int64)
+
+
+def encode_mesh_code(row, col) -> np.ndarray:
+    """(row, col) を10桁の250mメッシュコードに変換（decode_mesh_code の逆変換）"""
+    row = np.asarray(row, dtype=np.int64)
+    col = np.asarray(col, dtype=np.int64)
+
+    p, rr = np.divmod(row, 320)
+    u, cc = np.divmod(col, 320)
+    q, rr = np.divmod(rr, 40)
+    v, cc = np.divmod(cc, 40)
+    r, rr = np.divmod(rr, 4)
+    w, cc = np.divmod(cc, 4)
+    half = (rr // 2) * 2 + (cc // 2) + 1
+    quarter = (rr % 2) * 2 + (cc % 2) + 1
+
+    return (p * 10**8 + u * 10**6 + q * 10**5 + v * 10**4 +
+            r * 10**3 + w * 10**2 + half * 10 + quarter)
+
+
+def lonlat_to_cell(lon, lat):
+    """経度・緯度から250mメッシュの (row, col) を計算"""
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    row = np.floor(lat / CELL_LAT_DEG).astype(np.int64)
+    col = np.floor((lon - 100.0) / CELL_LON_DEG).astype(np.int64)
+    return row, col
+
+
+def cell_center(row, col):
+    """(row, col) のメッシュ中心の (経度, 緯度)"""
+    lon = 100.0 + (np.asarray(col, dtype=np.float64) + 0.5) * CELL_LON_DEG
+    lat = (np.asarray(row, dtype=np.float64) + 0.5) * CELL_LAT_DEG
+    return lon, lat
+
+
+def first_level_mesh(mesh_codes) -> np.ndarray:
+    """1次メッシュコード（4桁）を返す"""
+    return _as_int_codes(mesh_codes) // 10**6
+
+
+def project_xy(lon, lat, lat0=None):
+    """
+    経度・緯度を正距円筒図法で平面座標（m）に変換
+    KD-tree 等の距離計算用。lat0 省略時は入力の平均緯度を基準にする
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    if lat0 is None:
+        lat0 = float(np.mean(lat)) if lat.size else 0.0
+    x = np.radians(lon) * EARTH_RADIUS_M * np.cos(np.radians(lat0))
+    y = np.radians(lat) * EARTH_RADIUS_M
+    return x, y
+
+
+def cell_size_m(lat0: float):
+    """基準緯度における250mメッシュの (幅, 高さ) [m]"""
+    width = np.radians(CELL_LON_DEG) * EARTH_RADIUS_M * np.cos(np.radians(lat0))
+    height = np.radians(CELL_LAT_DEG) * EARTH_RADIUS_M
+    return width, height
+
+
+def window_offsets(radius: int, kind: str = 'queen', include_self: bool = False):
+    """
+    近傍窓のオフセット (dr, dc) を返す
+    kind='queen': (2r+1)×(2r+1) の正方窓, kind='rook': マンハッタン距離 r 以内
+    """
+    offsets = []
+    for dr in range(-radius, radius + 1):
+        for dc in range(-radius, radius + 1):
+            if dr == 0 and dc == 0 and not include_self:
+                continue
+            if kind == 'rook' and abs(dr) + abs(dc) > radius:
+                continue
+            offsets.append((dr, dc))
+    return offsets
+
+
+class MeshGridIndex:
+    """
+    (row, col) → 行番号 の検索インデックス
+    キーをソート済み int64 配列で持ち、searchsorted でベクトル検索する
+    """
+
+    def __init__(self, row, col):
+        self.row = np.asarray(row, dtype=np.int64)
+        self.col = np.asarray(col, dtype=np.int64)
+        self._col_min = int(self.col.min()) - 8 if self.col.size else 0
+        self._width = (int(self.col.max()) - self._col_min + 16) if self.col.size else 1
+        keys = self._key(self.row, self.col)
+        self._order = np.argsort(keys, kind='stable')
+        self._sorted = keys[self._order]
+
+    @classmethod
+    def from_mesh_codes(cls, mesh_codes):
+        return cls(*decode_mesh_code(mesh_codes))
+
+    def __len__(self):
+        return int(self.row.size)
+
+    def _key(self, row, col):
+        return row * self._width + (col - self._col_min)
+
+    def lookup(self, row, col) -> np.ndarray:
+        """(row, col) に対応する行番号。存在しない場合は -1"""
+        row = np.asarray(row, dtype=np.int64)
+        col = np.asarray(col, dtype=np.int64)
+        if self._sorted.size == 0:
+            return np.full(row.shape, -1, dtype=np.int64)
+
+        inside = (col >= self._col_min) & (col < self._col_min + self._width)
+        keys = self._key(row, np.where(inside, col, self._col_min))
+        pos = np.minimum(np.searchsorted(self._sorted, keys), self._sorted.size - 1)
+        found = inside & (self._sorted[pos] == keys)
+        return np.where(found, self._order[pos], -1)
+
+
+def build_adjacency(row, col, radius: int = 1, kind: str = 'queen',
+                    include_self: bool = False, decay_m=None, lat0=None,
+                    index: MeshGridIndex = None) -> sp.csr_matrix:
+    """
+    メッシュ行・列から疎な隣接行列を作成
+
+    decay_m を指定すると重みを exp(-距離/decay_m) にする（距離はセル中心間, m）。
+    未指定時は 0/1 の二値重み。
+    """
+    row = np.asarray(row, dtype=np.int64)
+    col = np.asarray(col, dtype=np.int64)
+    n = row.size
+    if index is None:
+        index = MeshGridIndex(row, col)
+
+    if decay_m is not None:
+        if lat0 is None:
+            lat0 = float(np.mean(cell_center(row, col)[1])) if n else 0.0
+        cell_w, cell_h = cell_size_m(lat0)
+
+    src_list, dst_list, w_list = [], [], []
+    src_all = np.arange(n, dtype=np.int64)
+    for dr, dc in window_offsets(radius, kind, include_self):
+        dst = index.lookup(row + dr, col + dc)
+        hit = dst >= 0
+        src_list.append(src_all[hit])
+        dst_list.append(dst[hit])
+        if decay_m is None:
+            w = 1.0
+        else:
+            w = float(np.exp(-np.hypot(dr * cell_h, dc * cell_w) / decay_m))
+        w_list.append(np.full(int(hit.sum()), w))
+
+    if src_list:
+        src = np.concatenate(src_list)
+        dst = np.concatenate(dst_list)
+        data = np.concatenate(w_list)
+    else:
+        src = dst = np.empty(0, dtype=np.int64)
+        data = np.empty(0)
+
+    return sp.csr_matrix((data, (src, dst)), shape=(n, n))
+
+
+def row_standardize(W: sp.spmatrix) -> sp.csr_matrix:
+    """行和が1になるように正規化（近傍のない行は0のまま）"""
+    W = sp.csr_matrix(W, dtype=np.float64)
+    rs = np.asarray(W.sum(axis=1)).ravel()
+    inv = np.divide(1.0, rs, out=np.zeros_like(rs), where=rs > 0)
+    return sp.diags(inv) @ W
+
+
+def spatial_lag(W: sp.spmatrix, values, standardize: bool = True) -> np.ndarray:
+    """空間ラグ W·x（standardize=True なら近傍平均）"""
+    values = np.asarray(values, dtype=np.float64)
+    if standardize:
+        W = row_standardize(W)
+    return np.asarray(W @ values).ravel()
+
+
+def connect_components(W: sp.spmatrix, row, col, k_neighbors: int = 16) -> sp.csr_matrix:
+    """
+    連結でない隣接グラフ（飛び地・離島・市境の空白）を、格子上で最も近いメッシュ同士の辺で1つにつなぐ
+    最大成分以外の各成分から、別成分の最寄りメッシュへ1本ずつ辺を張る操作を連結になるまで繰り返す
+    （各回で成分数は半分以下になる）。追加した辺の重みは1
+
+    成分内部のセル（8近傍がすべて同じ成分）から1歩外側へ進むと別成分に近づくため、最寄りの組は
+    必ず境界セルから求まる。境界セルだけを全体の KD-tree で k_neighbors 近傍検索し、
+    近傍がすべて同じ成分で決着しない成分に限り、その成分の外側の点の KD-tree に k=1 で問い合わせる
+    """
+    from scipy.sparse.csgraph import connected_components
+    from scipy.spatial import cKDTree
+
+    W = sp.csr_matrix(W)
+    n = W.shape[0]
+    row = np.asarray(row, dtype=np.int64)
+    col = np.asarray(col, dtype=np.int64)
+    points = np.column_stack([row, col]).astype(np.float64)
+    tree = cKDTree(points)
+    k = min(k_neighbors, n)
+
+    index = MeshGridIndex(row, col)
+    neighbours = np.column_stack([index.lookup(row + dr, col + dc)
+                                  for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)])
+
+    while True:
+        n_comp, comp = connected_components(W, directed=False)
+        if n_comp <= 1:
+            return W
+        largest = np.argmax(np.bincount(comp))
+        neighbour_comp = np.where(neighbours >= 0, comp[np.maximum(neighbours, 0)], -1)
+        boundary = (neighbour_comp != comp[:, None]).any(axis=1)
+        src = np.flatnonzero(boundary & (comp != largest))
+        src_comp = comp[src]
+
+        dist, idx = tree.query(points[src], k=k)
+        dist, idx = dist.reshape(src.size, -1), idx.reshape(src.size, -1)
+        foreign = comp[idx] != src_comp[:, None]
+        first = np.argmax(foreign, axis=1)
+        found = foreign[np.arange(src.size), first]
+        best_dist = np.where(found, dist[np.arange(src.size), first], np.inf)
+        best_dst = np.where(found, idx[np.arange(src.size), first], -1)
+
+        # 近傍 k 個がすべて自成分の点の最寄りの別成分は k 番目の距離以上。それが成分の最短より近い成分は外側の点で検索し直す
+        comp_best = np.full(n_comp, np.inf)
+        np.minimum.at(comp_best, src_comp, best_dist)
+        unresolved = ~found & (dist[:, -1] < comp_best[src_comp])
+        for c in np.unique(src_comp[unresolved]):
+            outside = np.flatnonzero(comp != c)
+            members = np.flatnonzero(src_comp == c)
+            d, j = cKDTree(points[outside]).query(points[src[members]], k=1)
+            best_dist[members] = d
+            best_dst[members] = outside[j]
+
+        # 成分ごとに最短の1本を採用
+        order = np.lexsort((best_dist, src_comp))
+        first_of_comp = np.r_[True, src_comp[order][1:] != src_comp[order][:-1]]
+        pick = order[first_of_comp]
+        a, b = src[pick], best_dst[pick]
+        bridge = sp.csr_matrix((np.ones(2 * a.size), (np.r_[a, b], np.r_[b, a])), shape=(n, n))
+        W = (W + bridge).tocsr()
+
+
+# 各セルの4辺（左下角 (col, row) からの始点・終点オフセット、隣接セルの方向）
+# x=列, y=行（北向き）で反時計回りに並べるので、外周は反時計回り・穴は時計回りのリングになる
+_CELL_EDGES = [
+    ((0, 0), (1, 0), (-1, 0)),   # 下辺（南隣）
+    ((1, 0), (1, 1), (0, 1)),    # 右辺（東隣）
+    ((1, 1), (0, 1), (1, 0)),    # 上辺（北隣）
+    ((0, 1), (0, 0), (0, -1)),   # 左辺（西隣）
+]
+
+
+def trace_boundaries(row, col, labels, index: MeshGridIndex = None):
+    """
+    同じラベルの隣接セルを融合した境界リングを格子上で追跡する（ジオメトリ演算を使わない）
+    1. 各セルの4辺のうち、隣接セルが無いかラベルが異なる辺だけを残す（同ラベル間の共有辺は打ち消し合う）
+    2. 残った有向辺を終点 = 次の辺の始点でつなぎ、閉じたリングにする
+       1つの頂点から2本出る（対角で接する）場合は左折側を選び、リングを自己接触させない
+    3. 直進する頂点は省く
+    戻り値: [(ラベル, 頂点列 (m+1, 2) [列, 行], 符号付き面積), ...]（面積 > 0 が外周、< 0 が穴）
+    """
+    row = np.asarray(row, dtype=np.int64)
+    col = np.asarray(col, dtype=np.int64)
+    labels = np.asarray(labels)
+    if index is None:
+        index = MeshGridIndex(row, col)
+
+    starts, ends, edge_cells = [], [], []
+    for (sc, sr), (ec, er), (dr, dc) in _CELL_EDGES:
+        nb = index.lookup(row + dr, col + dc)
+        keep = (nb < 0) | (labels[np.maximum(nb, 0)] != labels)
+        cells = np.flatnonzero(keep)
+        starts.append(np.column_stack([col[cells] + sc, row[cells] + sr]))
+        ends.append(np.column_stack([col[cells] + ec, row[cells] + er]))
+        edge_cells.append(cells)
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+    edge_label = labels[np.concatenate(edge_cells)]
+    n_edges = len(starts)
+    if n_edges == 0:
+        return []
+
+    # 頂点をラベル込みの整数キーにして、始点キーでソートした表から後続の辺を探す
+    _, label_id = np.unique(edge_label, return_inverse=True)
+    c0, r0 = starts.min(axis=0) - 1
+    width = int(max(starts[:, 0].max(), ends[:, 0].max()) - c0 + 2)
+    height = int(max(starts[:, 1].max(), ends[:, 1].max()) - r0 + 2)
+
+    def vertex_key(v):
+        return (label_id * height + (v[:, 1] - r0)) * width + (v[:, 0] - c0)
+
+    start_key = vertex_key(starts)
+    end_key = vertex_key(ends)
+    order = np.argsort(start_key, kind='stable')
+    sorted_keys = start_key[order]
+    first = np.searchsorted(sorted_keys, end_key, side='left')
+    count = np.searchsorted(sorted_keys, end_key, side='right') - first
+    nxt = order[np.minimum(first, n_edges - 1)]
+
+    # 後続候補が2本ある頂点: 進行方向に対して左折する辺を選ぶ
+    direction = ends - starts
+    ambiguous = np.flatnonzero(count == 2)
+    if ambiguous.size:
+        cand_a = order[first[ambiguous]]
+        cand_b = order[first[ambiguous] + 1]
+        d_in = direction[ambiguous]
+        d_a = direction[cand_a]
+        cross_a = d_in[:, 0] * d_a[:, 1] - d_in[:, 1] * d_a[:, 0]
+        nxt[ambiguous] = np.where(cross_a > 0, cand_a, cand_b)
+
+    rings = []
+    visited = np.zeros(n_edges, dtype=bool)
+    for start in range(n_edges):
+        if visited[start]:
+            continue
+        # 閉路を辿りながら、同じ頂点に戻ったところで単純リングとして切り出す
+        # （対角の接点を経由してつながった領域では外周と穴が1点で接するため、ここで分かれる）
+        stack, seen = [], {}
+        e = start
+        while not visited[e]:
+            visited[e] = True
+            key = start_key[e]
+            if key in seen:
+                pos = seen[key]
+                loop = stack[pos:]
+                del stack[pos:]
+                for edge in loop:
+                    del seen[start_key[edge]]
+                rings.append(_compress_ring(np.asarray(loop), starts, direction, edge_label))
+            seen[key] = len(stack)
+            stack.append(e)
+            e = nxt[e]
+        rings.append(_compress_ring(np.asarray(stack), starts, direction, edge_label))
+    return rings
+
+
+def _compress_ring(ring: np.ndarray, starts: np.ndarray, direction: np.ndarray, edge_label: np.ndarray):
+    """向きが変わる頂点（直前の辺と方向が異なる辺の始点）だけを残したリングと符号付き面積"""
+    d = direction[ring]
+    turn = np.any(d != np.roll(d, 1, axis=0), axis=1)
+    pts = starts[ring[turn]]
+    pts = np.vstack([pts, pts[:1]])
+    area = 0.5 * float(np.sum(pts[:-1, 0] * pts[1:, 1] - pts[1:, 0] * pts[:-1, 1]))
+    return edge_label[ring[0]], pts, area
+
+
+def dissolve_by_label(mesh_codes, labels):
+    """
+    ラベルごとにメッシュを融合した (Multi)Polygon（EPSG:4326 の経度・緯度）
+    trace_boundaries の外周リングに、それを含む最小の外周へ穴を割り当てて組み立てる
+    戻り値: {ラベル: shapely ジオメトリ}
+    """
+    import shapely
+    from shapely.geometry import MultiPolygon, Polygon
+
+    row, col = decode_mesh_code(mesh_codes)
+    labels = np.asarray(labels)
+    rings = trace_boundaries(row, col, labels)
+
+    def to_lonlat(pts):
+        return np.column_stack([100.0 + pts[:, 0] * CELL_LON_DEG, pts[:, 1] * CELL_LAT_DEG])
+
+    result = {}
+    for label in np.unique(labels):
+        shells = [(pts, area) for lab, pts, area in rings if lab == label and area > 0]
+        holes = [pts for lab, pts, area in rings if lab == label and area < 0]
+        shell_polys = [Polygon(pts) for pts, _ in shells]
+        shell_holes = [[] for _ in shells]
+        if holes:
+            tree = shapely.STRtree(shell_polys)
+            areas = np.array([area for _, area in shells])
+            for pts in holes:
+                # 穴の辺の中点は外周の内部にあり、外周の境界には乗らない
+                probe = shapely.Point((pts[0] + pts[1]) / 2.0)
+                candidates = tree.query(probe, predicate='within')
+                if candidates.size:
+                    shell_holes[candidates[np.argmin(areas[candidates])]].append(to_lonlat(pts))
+        polygons = [Polygon(to_lonlat(pts), h) for (pts, _), h in zip(shells, shell_holes)]
+        result[label] = polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+    return result
@@ -3,11 +3,23 @@ Mapbox可視化用データ準備スクリプト
 k=4〜9 の各クラスター結果を web_data/ へ変換
 """
 
+import gzip
 import json
 import geopandas as gpd
 import pandas as pd
 from pathlib import Path
 
+import cluster_naming
+import mesh_grid
+from config import NAMING_RATIO_METHOD  # クラスタ命名の用途比率の集計方法（2_cluster_analysis_multi.py と共通）
+from config import WEB_PRECOMPRESS_SUFFIXES, WEB_GZIP_LEVEL, WEB_BROTLI_QUALITY
+
+# brotli は任意（無い場合は gzip 版のみ作成）
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # ディレクトリ設定
 BASE_DIR = Path(__file__).parent
 OUTPUT_DIR = BASE_DIR / 'output'
@@ -24,11 +36,36 @@ USAGE_NAMES = [
     '業務施設', '商業系複合施設', '店舗等併用住宅', '店舗等併用共同住宅', '宿泊施設'
 ]
 
+# メッシュ別の追加属性（各分析ステージの出力CSV。OUTPUT_DIR からの相対パス）
+# mesh_code で結合して GeoJSON のプロパティに含める。{k} はクラスター数に置換される
+MESH_ATTRIBUTE_FILES = [
+    'restaurant_kde.csv',
+    'station_accessibility.csv',
+    'restaurant_categories.csv',
+    'k{k:02d}/cluster_stability.csv',
+]
+
+
+def load_mesh_attributes(k: int):
+    """存在する追加属性CSVを読み込み、mesh_code をキーに1つの表にまとめる"""
+    merged = None
+    for template in MESH_ATTRIBUTE_FILES:
+        path = OUTPUT_DIR / template.format(k=k)
+        if not path.exists():
+            continue
+        attr = pd.read_csv(path, encoding='utf-8-sig')
+        attr['mesh_code'] = attr['mesh_code'].astype(str)
+        print(f"   追加属性: {path.name} ({len(attr.columns) - 1}列)")
+        merged = attr if merged is None else merged.merge(attr, on='mesh_code', how='outer')
+    return merged
+
 
-def simplify_geometry(input_geojson: Path, output_geojson: Path, tolerance=0.0001):
+def simplify_geometry(input_geojson: Path, output_geojson: Path, tolerance=0.0001,
+                      attributes: pd.DataFrame = None):
     """
     GeoJSON の幾何形状を簡略化してファイルサイズを削減
     Mapbox向けに EPSG:4326 に揃えてから書き出す
+    attributes を渡すと mesh_code で結合してプロパティに追加する
     """
     print(f"   簡略化処理: {input_geojson.name} → {output_geojson.name}")
 
@@ -43,6 +80,15 @@ def simplify_geometry(input_geojson: Path, output_geojson: Path, tolerance=0.000
     # geometry簡略化（ポリゴン想定）
     gdf["geometry"] = gdf["geometry"].simplify(tolerance, preserve_topology=True)
 
+    if attributes is not None and 'mesh_code' in gdf.columns:
+        new_cols = [c for c in attributes.columns if c != 'mesh_code' and c not in gdf.columns]
+        gdf['mesh_code'] = gdf['mesh_code'].astype(str)
+        gdf = gdf.merge(attributes[['mesh_code'] + new_cols], on='mesh_code', how='left')
+        # ファイルサイズ抑制のため浮動小数は丸める
+        for col in new_cols:
+            if pd.api.types.is_float_dtype(gdf[col]):
+                gdf[col] = gdf[col].round(3)
+
     gdf.to_file(output_geojson, driver="GeoJSON")
 
     original_size = input_geojson.stat().st_size / 1024 / 1024
@@ -54,6 +100,29 @@ def simplify_geometry(input_geojson: Path, output_geojson: Path, tolerance=0.000
         print(f"   元ファイル: {original_size:.2f} MB → 簡略化後: {simplified_size:.2f} MB")
 
 
+def export_cluster_outlines(csv_file: Path, output_geojson: Path):
+    """
+    クラスタごとに融合した輪郭ポリゴン（低ズーム用）を出力
+    メッシュコードの格子上で境界辺を追跡するため、セル数が多くてもポリゴンの union を計算しない
+    """
+    df = pd.read_csv(csv_file, encoding='utf-8-sig', usecols=['mesh_code', 'cluster', 'cluster_name'])
+    outlines = mesh_grid.dissolve_by_label(df['mesh_code'].values, df['cluster'].values)
+
+    names = df.drop_duplicates('cluster').set_index('cluster')['cluster_name']
+    sizes = df['cluster'].value_counts()
+    clusters = sorted(outlines)
+    gdf = gpd.GeoDataFrame({
+        'cluster': [int(c) for c in clusters],
+        'cluster_name': [names[c] for c in clusters],
+        'メッシュ数': [int(sizes[c]) for c in clusters],
+    }, geometry=[outlines[c] for c in clusters], crs='EPSG:4326')
+    gdf.to_file(output_geojson, driver='GeoJSON', COORDINATE_PRECISION=6)
+
+    n_parts = sum(len(getattr(g, 'geoms', [g])) for g in gdf.geometry)
+    print(f"   ✓ 輪郭: {output_geojson.name} ({len(gdf)}クラスタ, {n_parts:,}ポリゴン, "
+          f"{output_geojson.stat().st_size / 1024 / 1024:.2f} MB)")
+
+
 def _calc_usage_ratios_from_counts(cluster_data: pd.DataFrame) -> dict:
     """
     cluster_data（同一clusterのメッシュ行集合）から、
@@ -74,77 +143,6 @@ def _calc_usage_ratios_from_counts(cluster_data: pd.DataFrame) -> dict:
     return ratios
 
 
-def get_cluster_name_and_color(cluster_data: pd.DataFrame):
-    """
-    改良版命名:
-    - 宿泊施設地域を追加
-    - 住宅（住宅+共同住宅）の合算判定を追加
-    - 平均建物数が極小かつ飲食突出は「要確認」を追加
-    """
-    # 例外：建物がほぼ無い（or整合性が怪しい）
-    avg_buildings = float(cluster_data['建物総数'].mean()) if len(cluster_data) else 0.0
-    avg_restaurants = float(cluster_data['飲食店数'].mean()) if len(cluster_data) else 0.0
-
-    if avg_buildings < 1:
-        if avg_restaurants > 50:
-            return "要確認（建物0/飲食突出）", "#c0392b"  # 濃い赤
-        return "低密度地域", "#95a5a6"  # グレー
-
-    ratios = _calc_usage_ratios_from_counts(cluster_data)
-
-    商業比率 = ratios.get('商業施設', 0)
-    共同住宅比率 = ratios.get('共同住宅', 0)
-    住宅比率 = ratios.get('住宅', 0)
-    店舗等併用共同住宅比率 = ratios.get('店舗等併用共同住宅', 0)
-    店舗等併用住宅比率 = ratios.get('店舗等併用住宅', 0)
-    商業系複合施設比率 = ratios.get('商業系複合施設', 0)
-    業務施設比率 = ratios.get('業務施設', 0)
-    文教厚生施設比率 = ratios.get('文教厚生施設', 0)
-    官公庁施設比率 = ratios.get('官公庁施設', 0)
-    宿泊施設比率 = ratios.get('宿泊施設', 0)
-
-    # 1) 単独支配（用途が明確なものを優先）
-    if 商業系複合施設比率 >= 0.6:
-        return "複合商業地域", "#ffd54f"
-    if 宿泊施設比率 >= 0.5:
-        return "宿泊施設地域", "#e91e63"
-    if 文教厚生施設比率 >= 0.5:
-        return "文教施設地域", "#3498db"
-    if 官公庁施設比率 >= 0.5:
-        return "官公庁施設地域", "#9b59b6"
-    if 業務施設比率 >= 0.4:
-        return "業務地域", "#e74c3c"
-
-    # 2) 商業（飲食の強さで分ける）
-    if 商業比率 > 0.5 and avg_restaurants > 100:
-        return "超高密度商業地域", "#f39c12"
-    if 商業比率 > 0.5:
-        return "商業集積地域", "#f1c40f"
-    if 商業比率 > 0.1:
-        return "商業混在地域", "#f4d03f"
-
-    # 3) 住宅系：住宅+共同住宅の合算で拾う（クラスタ5対策）
-    res_sum = 住宅比率 + 共同住宅比率
-    if res_sum >= 0.6:
-        if 住宅比率 >= 0.6:
-            return "戸建住宅地域", "#27ae60"
-        if 共同住宅比率 >= 0.4:
-            return "集合住宅地域", "#7dcea0"
-        return "住宅混合地域（戸建＋集合）", "#58d68d"  # 中間の緑
-
-    # 4) 併用住宅
-    if 店舗等併用共同住宅比率 >= 0.2:
-        return "店舗併用集合住宅地域", "#aed581"
-    if 店舗等併用住宅比率 >= 0.2:
-        return "店舗併用住宅地域", "#c5e1a5"
-
-    # 5) 低密度
-    if float(cluster_data['建物総数'].sum()) / max(len(cluster_data), 1) < 50:
-        return "低密度地域", "#95a5a6"
-
-    return "混合地域", "#e67e22"
-
-
 def extract_cluster_config(csv_file: Path, output_json: Path, k: int):
     """CSV からクラスター統計情報を抽出して JSON 化"""
     print(f"   統計情報抽出: {csv_file.name} → {output_json.name}")
@@ -157,11 +155,14 @@ def extract_cluster_config(csv_file: Path, output_json: Path, k: int):
         print(f"   利用可能な列: {list(df.columns)}")
         return
 
+    # 命名はルール表（cluster_naming）で全クラスタを一括評価
+    named = cluster_naming.name_clusters(df, cluster_col, NAMING_RATIO_METHOD)
+
     cluster_stats = []
     for cluster_id in sorted(df[cluster_col].unique()):
         cluster_data = df[df[cluster_col] == cluster_id]
 
-        cluster_name, cluster_color = get_cluster_name_and_color(cluster_data)
+        cluster_name, cluster_color = named[int(cluster_id)]
 
         building_types = {}
         for u in USAGE_NAMES:
@@ -201,6 +202,31 @@ def extract_cluster_config(csv_file: Path, output_json: Path, k: int):
     print()
 
 
+def precompress_web_data(web_dir: Path = WEB_DATA_DIR):
+    """
+    web_data/ の GeoJSON/JSON ごとに .gz（と brotli があれば .br）を作成
+    serve_web.py が Accept-Encoding に応じてそのまま返す。元ファイルより新しい圧縮版は作り直さない
+    """
+    encoders = {'.gz': lambda raw: gzip.compress(raw, compresslevel=WEB_GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        encoders['.br'] = lambda raw: brotli.compress(raw, quality=WEB_BROTLI_QUALITY)
+    else:
+        print("   brotli が無いため .br は作成しません（pip install brotli）")
+
+    for path in sorted(web_dir.iterdir()):
+        if path.suffix not in WEB_PRECOMPRESS_SUFFIXES or not path.is_file():
+            continue
+        raw = None
+        for ext, encode in encoders.items():
+            target = path.with_name(path.name + ext)
+            if target.exists() and target.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+                continue
+            raw = raw if raw is not None else path.read_bytes()
+            data = encode(raw)
+            target.write_bytes(data)
+            print(f"   圧縮: {target.name} ({len(raw) / 1e6:.2f}MB → {len(data) / 1e6:.2f}MB)")
+
+
 def main():
     """メイン処理: k=4〜9 の全データを変換"""
     print("=" * 60)
@@ -221,20 +247,25 @@ def main():
             print(f"   スキップ: {input_geojson} が見つかりません\n")
             continue
 
-        simplify_geometry(input_geojson, output_geojson)
+        simplify_geometry(input_geojson, output_geojson, attributes=load_mesh_attributes(k))
 
         if input_csv.exists():
             extract_cluster_config(input_csv, output_json, k)
+            export_cluster_outlines(input_csv, WEB_DATA_DIR / f'cluster_outlines_k{k}.geojson')
         else:
             print(f"   統計情報スキップ: {input_csv} が見つかりません\n")
 
+    print("--- 事前圧縮（gzip / brotli） ---")
+    precompress_web_data()
+    print()
+
     print("=" * 60)
     print("データ準備完了")
     print("=" * 60)
     print(f"\n出力先: {WEB_DATA_DIR}")
     print("\n次のステップ:")
     print("1) index.html の mapbox.accessToken を設定")
-    print("2) ローカルで動作確認: python -m http.server 8000")
+    print("2) ローカルで動作確認: python serve_web.py")
     print("3) ブラウザで http://localhost:8000 を開く\n")
 
 
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+プレビュー（層化抽出による近似実行）
+建物・飲食店の点をメッシュコードの計算だけでメッシュに割り当て（空間結合はしない）、
+1次メッシュ × 密度（点の数）の分位階級で層化したメッシュの標本を取る。
+標本メッシュの点だけを mesh_aggregation の集計関数で集計し、特徴量・標準化・K-means も標本だけで学習する。
+- 件数の合計とクラスタ別メッシュ数を標本から層化推定し、95%信頼区間を付ける
+- ステップ1の集計表があれば推定値を実際の合計と、ステップ2の結果があればクラスタを ARI と一致率で比べる
+- --assign-all を付けると残りのメッシュも同じ方法で集計し、学習したモデルで割り当てる
+ステップ1の空間結合も図・GeoJSON も不要なので、閾値や配色を変えたときの確認に数秒で使える
+
+使い方:
+    python preview.py [--k 4,6] [--fraction 0.1] [--assign-all]
+    python 2_cluster_analysis_multi.py --preview [--fraction 0.1]
+"""
+import argparse
+import importlib
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.metrics import adjusted_rand_score
+from sklearn.preprocessing import StandardScaler
+
+import cluster_model
+import cluster_naming
+import mesh_aggregation
+import mesh_grid
+from cluster_stability import match_labels
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+Z_95 = 1.96
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+# ==================== 層化抽出・推定 ====================
+
+def strata_of(mesh_codes, density, n_bins: int = None) -> np.ndarray:
+    """層番号（1次メッシュ × 密度の分位階級）"""
+    n_bins = n_bins or config.PREVIEW_DENSITY_BINS
+    density = np.asarray(density, dtype=np.float64)
+    edges = np.unique(np.quantile(density, np.linspace(0, 1, n_bins + 1)[1:-1])) if len(density) else []
+    density_bin = np.searchsorted(edges, density, side='right')
+    keys = mesh_grid.first_level_mesh(mesh_codes) * (n_bins + 1) + density_bin
+    return pd.factorize(keys)[0]
+
+
+def stratified_sample(strata: np.ndarray, fraction: float, min_per_stratum: int = None,
+                      seed: int = None) -> np.ndarray:
+    """層ごとに比例配分で非復元抽出した標本のマスク（各層 min_per_stratum 件以上）"""
+    min_per_stratum = config.PREVIEW_MIN_PER_STRATUM if min_per_stratum is None else min_per_stratum
+    rng = np.random.default_rng(config.RANDOM_STATE if seed is None else seed)
+    sizes = np.bincount(strata)
+    take = np.minimum(sizes, np.maximum(np.round(sizes * fraction).astype(np.int64), min_per_stratum))
+
+    # 層内で乱数順に並べ、先頭 take 件を選ぶ
+    order = np.lexsort((rng.random(len(strata)), strata))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.empty(len(strata), dtype=np.int64)
+    rank[order] = np.arange(len(strata)) - starts[strata[order]]
+    return rank < take[strata]
+
+
+def estimate_totals(values: pd.DataFrame, strata: np.ndarray, stratum_sizes: np.ndarray) -> pd.DataFrame:
+    """
+    標本の値（values, strata は標本メッシュのみ）から母集団の合計を層化推定し、95%信頼区間を付ける
+    合計 = Σ_h N_h ȳ_h, 分散 = Σ_h N_h² (1 - n_h/N_h) s_h² / n_h
+    """
+    N = np.asarray(stratum_sizes, dtype=np.float64)
+    n_strata = len(N)
+    n = np.bincount(strata, minlength=n_strata).astype(np.float64)
+    rows = []
+    for col in values.columns:
+        y = values[col].to_numpy(dtype=np.float64)
+        total_h = np.bincount(strata, weights=y, minlength=n_strata)
+        mean_h = np.divide(total_h, n, out=np.zeros(n_strata), where=n > 0)
+        sq_h = np.bincount(strata, weights=(y - mean_h[strata]) ** 2, minlength=n_strata)
+        var_h = np.divide(sq_h, n - 1, out=np.zeros(n_strata), where=n > 1)
+        estimate = float((N * mean_h).sum())
+        fpc = np.divide(n, N, out=np.ones(n_strata), where=N > 0)
+        variance = float((N ** 2 * (1 - fpc) * np.divide(var_h, n, out=np.zeros(n_strata), where=n > 0)).sum())
+        se = variance ** 0.5
+        rows.append({'項目': col, '推定値': estimate, '標準誤差': se,
+                     '下限95%': estimate - Z_95 * se, '上限95%': estimate + Z_95 * se})
+    return pd.DataFrame(rows)
+
+
+def compare_actual_totals(totals: pd.DataFrame) -> pd.DataFrame:
+    """ステップ1の集計表があれば、推定値と実際の合計を比べる列を加える"""
+    if not Path(config.OUTPUT_MESH_RESULT_CSV).exists():
+        return totals
+    actual = pd.read_csv(config.OUTPUT_MESH_RESULT_CSV, encoding='utf-8-sig',
+                         usecols=lambda c: c in set(totals['項目']))
+    totals = totals.copy()
+    totals['実際の値'] = totals['項目'].map(actual.sum()).astype(np.float64)
+    totals['相対誤差'] = (totals['推定値'] - totals['実際の値']) / totals['実際の値'].where(totals['実際の値'] != 0)
+    totals['区間内'] = (totals['推定値'] - totals['実際の値']).abs() <= Z_95 * totals['標準誤差'] + 1e-9
+    return totals
+
+
+# ==================== 点の読み込み・標本の集計 ====================
+
+def load_points():
+    """
+    建物・飲食店の点を読み込み、メッシュコードを付ける（config.PARTITION_*_FILES）
+    メッシュShapefileがあればその範囲のメッシュに限定する（ステップ1と同じ対象）
+    """
+    building_files = mesh_aggregation.expand_inputs(config.PARTITION_BUILDING_FILES)
+    food_files = mesh_aggregation.expand_inputs(config.PARTITION_FOOD_FILES)
+    if not building_files and not food_files:
+        raise FileNotFoundError("❌ 入力ファイルが見つかりません（config.PARTITION_*_FILES を確認してください）")
+
+    columns = ['経度', '緯度', 'usage_ja']
+    buildings = pd.concat([mesh_aggregation.read_building_points(p) for p in building_files]
+                          or [pd.DataFrame(columns=columns)], ignore_index=True)
+    food = pd.concat([mesh_aggregation.load_food(p)[0][['経度', '緯度']] for p in food_files]
+                     or [pd.DataFrame(columns=['経度', '緯度'])], ignore_index=True)
+    buildings['mesh_code'] = mesh_aggregation.points_to_mesh_codes(buildings['経度'].values, buildings['緯度'].values)
+    food['mesh_code'] = mesh_aggregation.points_to_mesh_codes(food['経度'].values, food['緯度'].values)
+
+    if Path(config.INPUT_MESH_DIR).exists():
+        universe = mesh_aggregation.load_mesh_codes_from_shapefiles(config.INPUT_MESH_DIR)
+        if len(universe):
+            buildings = buildings[buildings['mesh_code'].isin(universe)]
+            food = food[food['mesh_code'].isin(universe)]
+    return buildings.reset_index(drop=True), food.reset_index(drop=True)
+
+
+def aggregate_meshes(buildings: pd.DataFrame, food: pd.DataFrame, mesh_codes: np.ndarray) -> pd.DataFrame:
+    """指定メッシュの点だけを mesh_aggregation の集計関数で集計（ステップ1と同じ列構成）"""
+    b = buildings[buildings['mesh_code'].isin(mesh_codes)]
+    f = food[food['mesh_code'].isin(mesh_codes)]
+    result = mesh_aggregation.build_result_table(mesh_aggregation.count_buildings(b),
+                                                 mesh_aggregation.count_food(f))
+    # 標本に現れない用途も0の列として持つ（特徴量の列を本実行と揃える）
+    for usage in buildings['usage_ja'].dropna().unique():
+        if f'建物_{usage}' not in result.columns:
+            result[f'建物_{usage}'] = 0
+    building_cols = sorted(c for c in result.columns if c.startswith('建物_'))
+    return result[['mesh_code'] + building_cols + ['飲食店数', '建物総数', '中心_経度', '中心_緯度']]
+
+
+# ==================== プレビュー ====================
+
+def fit_on_sample(X: np.ndarray, sampled: np.ndarray, n_clusters: int):
+    """標本で標準化と K-means を学習し、X の全行を割り当てる"""
+    scaler = StandardScaler().fit(X[sampled])
+    kmeans = KMeans(n_clusters=n_clusters, random_state=config.RANDOM_STATE,
+                    n_init=config.PREVIEW_N_INIT).fit(scaler.transform(X[sampled]))
+    return kmeans.predict(scaler.transform(X))
+
+
+def compare_full_run(mesh_codes: np.ndarray, labels: np.ndarray, n_clusters: int):
+    """本実行の結果と比べる（ARI, 対応付け後の一致率）。結果が無ければ None"""
+    csv_path = cluster_model.model_dir(n_clusters) / 'mesh_with_clusters.csv'
+    if not csv_path.exists():
+        return None
+    full = pd.read_csv(csv_path, encoding='utf-8-sig', usecols=['mesh_code', 'cluster'])
+    full_labels = pd.Series(full['cluster'].values, index=full['mesh_code'].values).reindex(mesh_codes)
+    common = full_labels.notna().to_numpy()
+    reference = full_labels.to_numpy()[common].astype(np.int64)
+    matched, _, _ = match_labels(reference, labels[common], n_clusters)
+    return {
+        'ARI': float(adjusted_rand_score(reference, labels[common])),
+        '一致率': float((matched == reference).mean()),
+        '比較メッシュ数': int(common.sum()),
+    }
+
+
+def run_preview(k_list, fraction: float = None, assign_all: bool = False) -> dict:
+    """プレビューを実行し、合計の推定表と k ごとのクラスタ別メッシュ数の推定・比較結果を返す"""
+    fraction = fraction or config.PREVIEW_SAMPLE_FRACTION
+    stage2 = importlib.import_module('2_cluster_analysis_multi')
+    if config.CLUSTER_METHOD != 'kmeans':
+        print(f"  ⚠️ プレビューは K-means で行います（CLUSTER_METHOD={config.CLUSTER_METHOD}）")
+    if config.SPATIAL_LAG_ENABLED and not assign_all:
+        raise ValueError("標本だけでは近傍メッシュを集計しないため、空間ラグ特徴量を使う場合は --assign-all を指定してください")
+
+    print_section("1. 点の読み込み（メッシュコードの計算のみ）")
+    start_time = time.time()
+    buildings, food = load_points()
+    # 母集団: 点が1つ以上あるメッシュ（ステップ1の集計表の行と同じ）。密度 = 点の数
+    population, density = np.unique(np.concatenate([buildings['mesh_code'].to_numpy(np.int64),
+                                                    food['mesh_code'].to_numpy(np.int64)]), return_counts=True)
+    print(f"  ✓ 建物 {len(buildings):,}件, 飲食店 {len(food):,}件, メッシュ {len(population):,} "
+          f"({time.time() - start_time:.1f}秒)")
+
+    print_section(f"2. 層化抽出・標本の集計（1次メッシュ × 密度{config.PREVIEW_DENSITY_BINS}階級, 抽出率 {fraction:.0%}）")
+    start_time = time.time()
+    strata = strata_of(population, density)
+    sampled = stratified_sample(strata, fraction)
+    stratum_sizes = np.bincount(strata)
+    table = aggregate_meshes(buildings, food, population if assign_all else population[sampled])
+    pos = np.searchsorted(population, table['mesh_code'].to_numpy(np.int64))
+    in_sample = sampled[pos]
+    table_strata = strata[pos]
+    print(f"  ✓ 層数: {len(stratum_sizes):,}, 標本: {in_sample.sum():,}メッシュ"
+          f"（集計: {len(table):,}メッシュ, {time.time() - start_time:.2f}秒）")
+
+    count_cols = ['建物総数', '飲食店数'] + [c for c in table.columns if c.startswith('建物_') and c != '建物総数']
+    totals = compare_actual_totals(
+        estimate_totals(table.loc[in_sample, count_cols], table_strata[in_sample], stratum_sizes))
+    print("\n  件数の合計（標本からの推定 ±95%信頼区間）:")
+    for rec in totals.head(2).to_dict('records'):
+        line = f"    {rec['項目']}: {rec['推定値']:,.0f} [{rec['下限95%']:,.0f}, {rec['上限95%']:,.0f}]"
+        if '実際の値' in rec:
+            line += f" 実際 {rec['実際の値']:,.0f}（誤差 {rec['相対誤差']:+.2%}）"
+        print(line)
+
+    table, feature_cols = stage2.create_features(table)
+    mesh_codes = table['mesh_code'].to_numpy(dtype=np.int64)
+    X = table[feature_cols].fillna(0).to_numpy(dtype=np.float64)
+
+    results = {'totals': totals, 'k': {}}
+    shares_all = []
+    for k in k_list:
+        print_section(f"3. クラスタリング（k={k}）")
+        calc_start = time.time()
+        labels = fit_on_sample(X, in_sample, k)
+        elapsed = time.time() - calc_start
+
+        names = cluster_naming.name_clusters(table.assign(cluster=labels), 'cluster', config.NAMING_RATIO_METHOD)
+        onehot = pd.DataFrame({f'クラスタ{c}': (labels[in_sample] == c).astype(np.float64) for c in range(k)})
+        shares = estimate_totals(onehot, table_strata[in_sample], stratum_sizes)
+        shares.insert(1, 'cluster_name', [names.get(c, ('', ''))[0] for c in range(k)])
+        if assign_all:
+            shares['割り当て'] = np.bincount(labels, minlength=k)
+        comparison = compare_full_run(mesh_codes, labels, k)
+
+        print(f"  ✓ 標本で学習{'・全メッシュに割り当て' if assign_all else ''} ({elapsed:.2f}秒)")
+        for rec in shares.to_dict('records'):
+            line = (f"    {rec['項目']} {rec['cluster_name']}: 推定 {rec['推定値']:,.0f} ± "
+                    f"{Z_95 * rec['標準誤差']:,.0f}メッシュ")
+            if assign_all:
+                line += f"（割り当て {rec['割り当て']:,}）"
+            print(line)
+        if comparison:
+            print(f"  本実行との比較: ARI {comparison['ARI']:.3f}, 一致率 {comparison['一致率']:.1%} "
+                  f"（{comparison['比較メッシュ数']:,}メッシュ）")
+        else:
+            print("  本実行の結果が無いため比較は省略します")
+
+        out_dir = Path(config.PREVIEW_DIR)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        labels_path = out_dir / f'k{k:02d}_clusters.csv'
+        pd.DataFrame({
+            'mesh_code': mesh_codes, 'cluster': labels,
+            'cluster_name': [names[c][0] for c in labels], '標本': in_sample,
+        }).to_csv(labels_path, index=False, encoding='utf-8-sig')
+        print(f"  ✓ {labels_path}")
+        results['k'][k] = {'shares': shares, 'comparison': comparison, 'seconds': elapsed}
+        shares_all.append(shares.assign(k=k))
+
+    out_dir = Path(config.PREVIEW_DIR)
+    summary_path = out_dir / 'preview_summary.csv'
+    rows = [{'k': k, '学習秒': r['seconds'], **(r['comparison'] or {})} for k, r in results['k'].items()]
+    pd.DataFrame(rows).to_csv(summary_path, index=False, encoding='utf-8-sig', float_format='%.4f')
+    totals.to_csv(out_dir / 'preview_totals.csv', index=False, encoding='utf-8-sig', float_format='%.4f')
+    if shares_all:
+        pd.concat(shares_all, ignore_index=True).to_csv(out_dir / 'preview_cluster_shares.csv', index=False,
+                                                        encoding='utf-8-sig', float_format='%.4f')
+    print(f"\n  ✓ {summary_path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='層化抽出による近似プレビュー')
+    parser.add_argument('--k', default=None, help='対象の k（カンマ区切り。省略時はステップ2の K_LIST）')
+    parser.add_argument('--fraction', type=float, default=None, help='抽出率（省略時は config.PREVIEW_SAMPLE_FRACTION）')
+    parser.add_argument('--assign-all', action='store_true',
+                        help='標本以外のメッシュも集計し、標本で学習したモデルで割り当てる')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    print("=" * 60)
+    print("プレビュー（層化抽出による近似実行）")
+    print("=" * 60)
+
+    try:
+        k_list = ([int(k) for k in args.k.split(',')] if args.k
+                  else importlib.import_module('2_cluster_analysis_multi').K_LIST)
+        run_preview(k_list, args.fraction, args.assign_all)
+        print(f"\n✅ 完了 ({time.time() - start_time:.1f}秒)")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
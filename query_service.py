@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+メッシュ分析結果のローカル問い合わせサービス（オフライン動作）
+ステップ1・2の出力を一度だけメモリに読み込み、メッシュコードの格子インデックスと
+KD-tree を使って範囲（bbox）・半径・メッシュコード・クラスタ条件の集計に答える。
+直近の応答は LRU キャッシュに保持する
+
+使い方:
+    python query_service.py serve [--port 8001]
+    python query_service.py query --bbox 130.38,33.58,130.42,33.60 --k 6
+    python query_service.py query --station 博多 --radius 800 --k 6 --cluster 2
+    python query_service.py query --mesh 5030332211,5030332212
+    python query_service.py similar --mesh 5030332211 --k 6 --top 10
+    python query_service.py --db output/mesh_analysis.gpkg serve
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+import mesh_grid
+from similar_meshes import SimilarMeshIndex, parse_list
+from station_accessibility import load_stations, station_mask
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+# 問い合わせパラメータ（この順で正規化してキャッシュキーにする）
+QUERY_KEYS = ('bbox', 'lon', 'lat', 'radius', 'station', 'mesh', 'k', 'cluster', 'cluster_name', 'include')
+SIMILAR_KEYS = ('mesh', 'k', 'top', 'cluster', 'region', 'bbox', 'same_cluster')
+
+
+class MeshStore:
+    """メッシュ集計結果とクラスタラベルをメモリ常駐の配列として保持"""
+
+    def __init__(self, mesh_df: pd.DataFrame, labels: dict, names: dict, stations: pd.DataFrame = None):
+        self.df = mesh_df.reset_index(drop=True)
+        self.mesh_code = self.df['mesh_code'].to_numpy(dtype=np.int64)
+        self.row, self.col = mesh_grid.decode_mesh_code(self.mesh_code)
+        self.grid = mesh_grid.MeshGridIndex(self.row, self.col)
+
+        # bbox 検索用: 行番号でソートした並び
+        self.row_order = np.argsort(self.row, kind='stable')
+        self.row_sorted = self.row[self.row_order]
+
+        # 半径検索用: メッシュ中心の平面座標
+        lon, lat = mesh_grid.cell_center(self.row, self.col)
+        self.lat0 = float(np.mean(lat)) if len(lat) else 0.0
+        self.tree = cKDTree(np.column_stack(mesh_grid.project_xy(lon, lat, self.lat0)))
+
+        self.value_cols = [c for c in self.df.columns
+                           if c.startswith('建物_') and not c.endswith('_比率')] + ['建物総数', '飲食店数']
+        self.values = self.df[self.value_cols].to_numpy(dtype=np.float64)
+
+        self.labels = labels        # k → クラスタ番号配列（-1 は該当なし）
+        self.names = names          # k → {クラスタ番号: 名前}
+        self.stations = stations
+
+    @classmethod
+    def from_outputs(cls, output_dir=None):
+        """ステップ1・2の出力ファイルから読み込む"""
+        output_dir = Path(output_dir or config.OUTPUT_DIR)
+        mesh_df = pd.read_csv(output_dir / Path(config.OUTPUT_MESH_RESULT_CSV).name, encoding='utf-8-sig')
+        index = mesh_grid.MeshGridIndex.from_mesh_codes(mesh_df['mesh_code'].values)
+
+        labels, names = {}, {}
+        for csv_path in sorted(output_dir.glob('k[0-9][0-9]/mesh_with_clusters.csv')):
+            k = int(csv_path.parent.name[1:])
+            kdf = pd.read_csv(csv_path, encoding='utf-8-sig', usecols=['mesh_code', 'cluster', 'cluster_name'])
+            pos = index.lookup(*mesh_grid.decode_mesh_code(kdf['mesh_code'].values))
+            arr = np.full(len(mesh_df), -1, dtype=np.int16)
+            arr[pos[pos >= 0]] = kdf['cluster'].to_numpy()[pos >= 0]
+            labels[k] = arr
+            names[k] = dict(kdf.drop_duplicates('cluster')[['cluster', 'cluster_name']].itertuples(index=False))
+
+        stations = load_stations() if Path(config.STATIONS_GEOJSON).exists() else None
+        return cls(mesh_df, labels, names, stations)
+
+    @classmethod
+    def from_database(cls, path=None):
+        """export_geopackage.py で作成した GeoPackage から読み込む（テキストの全走査を行わない）"""
+        path = Path(path or config.GEOPACKAGE_PATH)
+        if not path.exists():
+            raise FileNotFoundError(f"GeoPackage が見つかりません: {path}\n先に export_geopackage.py を実行してください")
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            mesh_cols = [r[1] for r in conn.execute('PRAGMA table_info(mesh)') if r[1] not in ('fid', 'geom')]
+            quoted = ', '.join(f'"{c}"' for c in mesh_cols)
+            mesh_df = pd.read_sql_query(f'SELECT {quoted} FROM mesh ORDER BY fid', conn)
+            index = mesh_grid.MeshGridIndex.from_mesh_codes(mesh_df['mesh_code'].values)
+
+            has_labels = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mesh_cluster'").fetchone()
+            labels, names = {}, {}
+            ks = [r[0] for r in conn.execute('SELECT DISTINCT k FROM mesh_cluster ORDER BY k')] if has_labels else []
+            for k in ks:
+                # idx_mesh_cluster_k_cluster により k 単位で取り出す
+                kdf = pd.read_sql_query(
+                    'SELECT mesh_code, cluster, cluster_name FROM mesh_cluster WHERE k = ?', conn, params=(k,))
+                pos = index.lookup(*mesh_grid.decode_mesh_code(kdf['mesh_code'].values))
+                arr = np.full(len(mesh_df), -1, dtype=np.int16)
+                arr[pos[pos >= 0]] = kdf['cluster'].to_numpy()[pos >= 0]
+                labels[int(k)] = arr
+                names[int(k)] = dict(kdf.drop_duplicates('cluster')[['cluster', 'cluster_name']].itertuples(index=False))
+        finally:
+            conn.close()
+
+        stations = load_stations() if Path(config.STATIONS_GEOJSON).exists() else None
+        return cls(mesh_df, labels, names, stations)
+
+    # ---------- 空間条件 ----------
+
+    def select_bbox(self, min_lon, min_lat, max_lon, max_lat) -> np.ndarray:
+        """
+        範囲と重なるメッシュ（四隅を含むメッシュの行・列番号の範囲。端のメッシュは一部だけ重なっていても含む）
+        行番号でソートした配列を二分探索して行範囲を絞る
+        """
+        r0, c0 = mesh_grid.lonlat_to_cell(min_lon, min_lat)
+        r1, c1 = mesh_grid.lonlat_to_cell(max_lon, max_lat)
+        lo = np.searchsorted(self.row_sorted, int(r0), side='left')
+        hi = np.searchsorted(self.row_sorted, int(r1), side='right')
+        candidates = self.row_order[lo:hi]
+        col = self.col[candidates]
+        return np.sort(candidates[(col >= c0) & (col <= c1)])
+
+    def select_radius(self, lon, lat, radius_m) -> np.ndarray:
+        """中心から半径内にメッシュ中心があるメッシュ"""
+        x, y = mesh_grid.project_xy(np.array([lon]), np.array([lat]), self.lat0)
+        return np.sort(np.asarray(self.tree.query_ball_point([x[0], y[0]], r=radius_m), dtype=np.int64))
+
+    def select_mesh(self, codes) -> np.ndarray:
+        """メッシュコード指定"""
+        pos = self.grid.lookup(*mesh_grid.decode_mesh_code(codes))
+        return np.sort(pos[pos >= 0])
+
+    def station_location(self, name):
+        """駅名または駅コードの位置（同名の駅が離れて複数ある場合は駅コードで指定させる）"""
+        if self.stations is None:
+            raise ValueError("駅データが読み込まれていません")
+        hit = self.stations[station_mask(self.stations, name)]
+        if hit.empty:
+            raise ValueError(f"駅が見つかりません: {name}")
+        if len(hit) > 1:
+            raise ValueError(f"同名の駅が複数あります。駅コードで指定してください: {hit['駅コード'].tolist()}")
+        return float(hit['経度'].iloc[0]), float(hit['緯度'].iloc[0])
+
+
+class QueryService:
+    """問い合わせの解釈・実行と LRU キャッシュ"""
+
+    def __init__(self, store: MeshStore, cache_size: int = None):
+        self.store = store
+        self._cached = lru_cache(maxsize=cache_size or config.QUERY_CACHE_SIZE)(self._execute)
+        self._similar_indexes = {}  # k → SimilarMeshIndex（初回の問い合わせで読み込む）
+
+    @staticmethod
+    def normalize(params: dict, keys=QUERY_KEYS) -> tuple:
+        """パラメータをキャッシュキー用のタプルに正規化"""
+        items = []
+        for key in keys:
+            value = params.get(key)
+            if isinstance(value, list):
+                value = value[0] if value else None
+            if value not in (None, ''):
+                items.append((key, str(value).strip()))
+        return tuple(items)
+
+    def query(self, params: dict) -> dict:
+        start_time = time.perf_counter()
+        key = self.normalize(params)
+        hits_before = self._cached.cache_info().hits
+        response = dict(self._cached(key))
+        response['cached'] = self._cached.cache_info().hits > hits_before
+        response['elapsed_ms'] = round((time.perf_counter() - start_time) * 1000, 3)
+        return response
+
+    def similar(self, params: dict) -> dict:
+        """類似メッシュ検索（ステップ2で保存した標準化特徴量を使用）"""
+        start_time = time.perf_counter()
+        p = dict(self.normalize(params, SIMILAR_KEYS))
+        if 'mesh' not in p:
+            raise ValueError("mesh を指定してください")
+        k = int(p.get('k', config.N_CLUSTERS))
+        if k not in self._similar_indexes:
+            self._similar_indexes[k] = SimilarMeshIndex.load(k)
+        index = self._similar_indexes[k]
+
+        result = index.query_meshes(
+            parse_list(p['mesh']), int(p.get('top', config.SIMILAR_TOP_N)),
+            cluster=parse_list(p.get('cluster')), region=parse_list(p.get('region')),
+            bbox=parse_list(p.get('bbox'), float),
+            same_cluster=p.get('same_cluster', '').lower() in ('1', 'true', 'yes'),
+        )
+        return {
+            'query': p,
+            'results': result.to_dict(orient='records'),
+            'elapsed_ms': round((time.perf_counter() - start_time) * 1000, 3),
+        }
+
+    def cache_info(self) -> dict:
+        return self._cached.cache_info()._asdict()
+
+    @staticmethod
+    def validate(p: dict):
+        """条件が足りない問い合わせは全メッシュを返さずにエラーにする"""
+        if 'radius' in p and 'station' not in p and not ('lon' in p and 'lat' in p):
+            raise ValueError("radius には station または lon・lat を指定してください")
+        if ('station' in p or 'lon' in p or 'lat' in p) and 'radius' not in p:
+            raise ValueError("station・lon・lat には radius（m）を指定してください")
+        if ('cluster' in p or 'cluster_name' in p) and 'k' not in p:
+            raise ValueError("cluster・cluster_name には k を指定してください")
+
+    def _execute(self, key: tuple) -> dict:
+        store = self.store
+        p = dict(key)
+        self.validate(p)
+
+        # 空間条件（指定が無ければ全メッシュ）
+        if 'mesh' in p:
+            idx = store.select_mesh([int(c) for c in p['mesh'].split(',')])
+        elif 'bbox' in p:
+            min_lon, min_lat, max_lon, max_lat = map(float, p['bbox'].split(','))
+            idx = store.select_bbox(min_lon, min_lat, max_lon, max_lat)
+        elif 'radius' in p:
+            if 'station' in p:
+                lon, lat = store.station_location(p['station'])
+            else:
+                lon, lat = float(p['lon']), float(p['lat'])
+            idx = store.select_radius(lon, lat, float(p['radius']))
+        else:
+            idx = np.arange(len(store.mesh_code))
+
+        # クラスタ条件
+        k = int(p['k']) if 'k' in p else None
+        if k is not None and k not in store.labels:
+            raise ValueError(f"k={k} のクラスタ結果がありません（利用可能: {sorted(store.labels)}）")
+        if k is not None and ('cluster' in p or 'cluster_name' in p):
+            if 'cluster' in p:
+                wanted = [int(c) for c in p['cluster'].split(',')]
+            else:
+                wanted = [cid for cid, name in store.names[k].items() if name == p['cluster_name']]
+            idx = idx[np.isin(store.labels[k][idx], wanted)]
+
+        totals = store.values[idx].sum(axis=0)
+        response = {
+            'query': p,
+            'mesh_count': int(idx.size),
+            'totals': {col: int(v) for col, v in zip(store.value_cols, totals)},
+        }
+
+        if k is not None:
+            lab = store.labels[k][idx]
+            lab = lab[lab >= 0]
+            ids, counts = np.unique(lab, return_counts=True)
+            response['clusters'] = [
+                {'id': int(i), 'name': store.names[k].get(int(i), ''), 'count': int(c)}
+                for i, c in zip(ids, counts)
+            ]
+
+        if p.get('include') == 'meshes':
+            limit = config.QUERY_MAX_MESHES
+            rows = store.df.iloc[idx[:limit]]
+            records = rows[['mesh_code'] + store.value_cols].to_dict(orient='records')
+            if k is not None:
+                for rec, lab in zip(records, store.labels[k][idx[:limit]]):
+                    rec['cluster'] = int(lab)
+            response['meshes'] = records
+            response['truncated'] = bool(idx.size > limit)
+
+        return response
+
+
+def make_handler(service: QueryService):
+    """HTTPハンドラを作成（GET /query, /mesh/<code>, /similar, /cache）"""
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False, default=int).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                if url.path == '/query':
+                    self._send_json(200, service.query(parse_qs(url.query)))
+                elif url.path.startswith('/mesh/'):
+                    params = parse_qs(url.query)
+                    params['mesh'] = url.path.split('/', 2)[2]
+                    params['include'] = 'meshes'
+                    self._send_json(200, service.query(params))
+                elif url.path == '/similar':
+                    self._send_json(200, service.similar(parse_qs(url.query)))
+                elif url.path == '/cache':
+                    self._send_json(200, service.cache_info())
+                else:
+                    self._send_json(404, {'error': f'不明なパス: {url.path}'})
+            except (ValueError, KeyError, FileNotFoundError) as e:
+                self._send_json(400, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            print(f"  {self.address_string()} {format % args}")
+
+    return QueryHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='メッシュ分析結果のローカル問い合わせサービス')
+    parser.add_argument('--db', help='GeoPackage から読み込む（例: output/mesh_analysis.gpkg。省略時は CSV 出力から）')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help='HTTPサーバーを起動')
+    serve.add_argument('--host', default=config.QUERY_HOST)
+    serve.add_argument('--port', type=int, default=config.QUERY_PORT)
+
+    q = sub.add_parser('query', help='1回だけ問い合わせて結果を表示')
+    for key in QUERY_KEYS:
+        q.add_argument(f'--{key.replace("_", "-")}', dest=key)
+
+    sim = sub.add_parser('similar', help='類似メッシュを1回だけ検索して表示')
+    for key in SIMILAR_KEYS:
+        sim.add_argument(f'--{key.replace("_", "-")}', dest=key)
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+    store = MeshStore.from_database(args.db) if args.db else MeshStore.from_outputs()
+    service = QueryService(store)
+    print(f"✓ 読み込み完了: {len(store.mesh_code):,}メッシュ, k={sorted(store.labels)} "
+          f"({time.time() - start_time:.1f}秒)", file=sys.stderr)
+
+    if args.command == 'query':
+        params = {key: getattr(args, key) for key in QUERY_KEYS}
+        print(json.dumps(service.query(params), ensure_ascii=False, indent=2, default=int))
+        return
+    if args.command == 'similar':
+        params = {key: getattr(args, key) for key in SIMILAR_KEYS}
+        print(json.dumps(service.similar(params), ensure_ascii=False, indent=2, default=int))
+        return
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"🚀 http://{args.host}:{args.port}/query?bbox=minlon,minlat,maxlon,maxlat&k=6", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n停止しました", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
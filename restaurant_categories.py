@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+飲食店の業種別集計スクリプト
+許可データの業種列からメッシュ × 業種の件数を疎行列（CSR）で作り、
+TF-IDF で重み付けしたうえで NMF により少数の「業種構成」成分に圧縮する。
+- 業種構成_1..n: クラスタリング用の追加特徴量（OPTIONAL_FEATURE_SETS['restaurant_categories']）
+- 主要業種・上位業種の件数: 地図のポップアップ用属性
+件数の少ない業種は「その他」にまとめ、語彙が大きくても密行列を作らない
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.decomposition import NMF
+from sklearn.feature_extraction.text import TfidfTransformer
+
+import mesh_aggregation
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+OTHER_CATEGORY = 'その他'
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+def find_category_column(path) -> str:
+    """config.RESTAURANT_CATEGORY_COLUMNS のうち CSV に最初に見つかった列名"""
+    header = pd.read_csv(path, encoding='utf-8-sig', nrows=0).columns
+    for col in config.RESTAURANT_CATEGORY_COLUMNS:
+        if col in header:
+            return col
+    raise ValueError(f"業種列が見つかりません（候補: {config.RESTAURANT_CATEGORY_COLUMNS}, 列: {list(header)}）")
+
+
+def load_food_categories():
+    """飲食店CSVから経度・緯度・業種を読み込む（業種は category 型。mesh_aggregation.load_food）"""
+    print_section("1. 飲食店データ読み込み")
+
+    if not Path(config.INPUT_FOOD_FILE).exists():
+        raise FileNotFoundError(f"❌ {config.INPUT_FOOD_FILE} が見つかりません")
+
+    category_col = find_category_column(config.INPUT_FOOD_FILE)
+    food, stats = mesh_aggregation.load_food(config.INPUT_FOOD_FILE)
+    for line in mesh_aggregation.food_stats_lines(stats):
+        print(f"  {line}")
+
+    # 業種が空欄の店舗は「その他」（CSV に既に「その他」がある場合はそのカテゴリを使う）
+    category = food[category_col]
+    if OTHER_CATEGORY not in category.cat.categories:
+        category = category.cat.add_categories([OTHER_CATEGORY])
+    category = category.fillna(OTHER_CATEGORY)
+    print(f"  業種列: {category_col}, 業種数: {category.nunique():,}")
+    return food['経度'].values, food['緯度'].values, category
+
+
+def build_category_matrix(lon: np.ndarray, lat: np.ndarray, category: pd.Series, min_count: int = None):
+    """
+    メッシュ × 業種の件数行列（CSR）
+    出現件数が min_count 未満の業種は「その他」列にまとめる
+    戻り値: (行列, メッシュコード, 業種名)
+    """
+    print_section("2. メッシュ × 業種の疎行列")
+    if min_count is None:
+        min_count = config.CATEGORY_MIN_COUNT
+
+    mesh_codes = mesh_aggregation.points_to_mesh_codes(lon, lat)
+    mesh_ids, row = np.unique(mesh_codes, return_inverse=True)
+
+    # 業種の出現件数で稀な業種を「その他」に寄せる
+    cat_codes = category.cat.codes.to_numpy()
+    totals = np.bincount(cat_codes, minlength=len(category.cat.categories))
+    names = np.asarray(category.cat.categories, dtype=object)
+    keep = (totals >= min_count) & (names != OTHER_CATEGORY)
+    kept_names = names[keep]
+    order = np.argsort(-totals[keep], kind='stable')
+    remap = np.full(len(names), len(kept_names), dtype=np.int64)
+    remap[np.flatnonzero(keep)[order]] = np.arange(len(kept_names))
+    col = remap[cat_codes]
+    vocabulary = list(kept_names[order])
+    if (~keep & (totals > 0)).any():
+        vocabulary.append(OTHER_CATEGORY)
+
+    matrix = sp.csr_matrix(
+        (np.ones(len(row), dtype=np.float32), (row, col)),
+        shape=(len(mesh_ids), len(vocabulary))
+    )
+    matrix.sum_duplicates()
+    density = matrix.nnz / max(matrix.shape[0] * matrix.shape[1], 1)
+    print(f"  ✓ {matrix.shape[0]:,}メッシュ × {matrix.shape[1]:,}業種, 非ゼロ {matrix.nnz:,} ({density:.1%})")
+    merged = int((~keep & (totals > 0)).sum())
+    if merged:
+        print(f"  稀な業種 {merged:,}種（{min_count}件未満）を「{OTHER_CATEGORY}」に集約")
+    return matrix, mesh_ids, vocabulary
+
+
+def category_components(matrix: sp.csr_matrix, vocabulary: list, n_components: int = None):
+    """
+    TF-IDF（業種の出現メッシュ数で重み付け）+ NMF で業種構成成分に圧縮
+    疎行列のまま計算する。戻り値: (メッシュ × 成分, 成分 × 業種)
+    """
+    print_section("3. 業種構成の抽出（TF-IDF + NMF）")
+    if n_components is None:
+        n_components = config.CATEGORY_NMF_COMPONENTS
+    n_components = min(n_components, *matrix.shape)
+
+    tfidf = TfidfTransformer(sublinear_tf=True).fit_transform(matrix)
+    nmf = NMF(n_components=n_components, init='nndsvda', random_state=config.RANDOM_STATE, max_iter=500)
+    weights = nmf.fit_transform(tfidf).astype(np.float32)
+    components = nmf.components_
+
+    # メッシュごとに成分の重みを合計1に正規化（業種構成比として解釈できるように）
+    row_sum = weights.sum(axis=1, keepdims=True)
+    weights = np.divide(weights, row_sum, out=np.zeros_like(weights), where=row_sum > 0)
+
+    for i, comp in enumerate(components):
+        top = np.argsort(-comp)[:3]
+        print(f"  業種構成_{i + 1}: " + ', '.join(vocabulary[j] for j in top))
+    return weights, components
+
+
+def category_attributes(matrix: sp.csr_matrix, vocabulary: list, top_n: int = None) -> pd.DataFrame:
+    """地図用の属性: 主要業種・業種数・件数上位 top_n 業種の件数"""
+    if top_n is None:
+        top_n = config.CATEGORY_TOP_N
+
+    attrs = pd.DataFrame(index=np.arange(matrix.shape[0]))
+    top = np.asarray(matrix.argmax(axis=1)).ravel()
+    attrs['主要業種'] = np.asarray(vocabulary, dtype=object)[top]
+    attrs['主要業種_件数'] = np.asarray(matrix.max(axis=1).todense()).ravel().astype(np.int32)
+    attrs['業種数'] = np.diff(matrix.indptr).astype(np.int32)
+
+    # 上位業種の列だけを密にする（その他は除く）
+    popular = [j for j in np.argsort(-np.asarray(matrix.sum(axis=0)).ravel(), kind='stable')
+               if vocabulary[j] != OTHER_CATEGORY][:top_n]
+    dense = matrix[:, popular].toarray().astype(np.int32)
+    for i, j in enumerate(popular):
+        attrs[f'飲食_{vocabulary[j]}'] = dense[:, i]
+    return attrs
+
+
+def save_category_matrix(path, matrix: sp.csr_matrix, mesh_ids: np.ndarray, vocabulary: list):
+    """疎行列を CSR の構成配列・メッシュコード・業種名と一緒に1ファイルへ保存"""
+    np.savez_compressed(
+        path,
+        data=matrix.data, indices=matrix.indices, indptr=matrix.indptr, shape=np.array(matrix.shape),
+        mesh_code=mesh_ids, categories=np.asarray(vocabulary, dtype=str)
+    )
+
+
+def load_category_matrix(path=None):
+    """save_category_matrix の逆。戻り値: (CSR行列, メッシュコード, 業種名)"""
+    with np.load(path or config.RESTAURANT_CATEGORY_MATRIX) as data:
+        matrix = sp.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+        return matrix, data['mesh_code'], [str(c) for c in data['categories']]
+
+
+def save_results(matrix, mesh_ids, vocabulary, weights, attrs):
+    """メッシュ別属性CSVと疎行列を保存"""
+    print_section("4. 結果の保存")
+    Path(config.OUTPUT_DIR).mkdir(exist_ok=True)
+
+    save_category_matrix(config.RESTAURANT_CATEGORY_MATRIX, matrix, mesh_ids, vocabulary)
+    print(f"  ✓ {config.RESTAURANT_CATEGORY_MATRIX}")
+
+    df = pd.DataFrame({'mesh_code': mesh_ids})
+    for i in range(weights.shape[1]):
+        df[f'業種構成_{i + 1}'] = weights[:, i]
+    df = pd.concat([df, attrs], axis=1)
+
+    # ステージ1の集計対象メッシュがあればそれに合わせる（飲食店の無いメッシュは0）
+    if Path(config.OUTPUT_MESH_RESULT_CSV).exists():
+        mesh_codes = pd.read_csv(config.OUTPUT_MESH_RESULT_CSV, usecols=['mesh_code'])['mesh_code']
+        df = pd.DataFrame({'mesh_code': mesh_codes.values}).merge(df, on='mesh_code', how='left')
+        weight_cols = [c for c in df.columns if c.startswith('業種構成_')]
+        count_cols = [c for c in attrs.columns if c != '主要業種']
+        df[weight_cols] = df[weight_cols].fillna(0)
+        df[count_cols] = df[count_cols].fillna(0).astype(np.int32)
+
+    df.to_csv(config.RESTAURANT_CATEGORY_CSV, index=False, encoding='utf-8-sig', float_format='%.4f')
+    print(f"  ✓ {config.RESTAURANT_CATEGORY_CSV} ({len(df):,}メッシュ)")
+
+
+def main():
+    start_time = time.time()
+
+    print("=" * 60)
+    print("飲食店の業種別集計")
+    print(f"NMF成分数: {config.CATEGORY_NMF_COMPONENTS}, 稀な業種の閾値: {config.CATEGORY_MIN_COUNT}件")
+    print("=" * 60)
+
+    try:
+        lon, lat, category = load_food_categories()
+        matrix, mesh_ids, vocabulary = build_category_matrix(lon, lat, category)
+        weights, _ = category_components(matrix, vocabulary)
+        attrs = category_attributes(matrix, vocabulary)
+        save_results(matrix, mesh_ids, vocabulary, weights, attrs)
+
+        elapsed = time.time() - start_time
+        print_section("処理完了")
+        print(f"  総処理時間: {elapsed:.1f}秒")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
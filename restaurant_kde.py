@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+飲食店カーネル密度推定スクリプト
+飲食店の点データを250mメッシュ格子にビニングし、FFT畳み込みで
+複数帯域幅のガウスカーネル密度面（件/km²）を作成する
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.signal import fftconvolve
+
+import mesh_aggregation
+import mesh_grid
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+def load_food_points():
+    """飲食店CSVを読み込み、有効な経度・緯度を返す"""
+    print_section("1. 飲食店データ読み込み")
+
+    if not Path(config.INPUT_FOOD_FILE).exists():
+        raise FileNotFoundError(f"❌ {config.INPUT_FOOD_FILE} が見つかりません")
+
+    food, stats = mesh_aggregation.load_food(config.INPUT_FOOD_FILE)
+    for line in mesh_aggregation.food_stats_lines(stats):
+        print(f"  {line}")
+
+    return food['経度'].values, food['緯度'].values
+
+
+def gaussian_kernel(bandwidth_m: float, lat0: float, truncate: float = None) -> np.ndarray:
+    """
+    250mメッシュ格子上のガウスカーネル（件/km² に換算済み）
+    セルの幅と高さが異なるため、行・列方向で別々に m 換算する
+    """
+    if truncate is None:
+        truncate = config.KDE_TRUNCATE
+    cell_w, cell_h = mesh_grid.cell_size_m(lat0)
+    half_r = int(np.ceil(truncate * bandwidth_m / cell_h))
+    half_c = int(np.ceil(truncate * bandwidth_m / cell_w))
+
+    dy = np.arange(-half_r, half_r + 1)[:, None] * cell_h
+    dx = np.arange(-half_c, half_c + 1)[None, :] * cell_w
+    kernel = np.exp(-0.5 * (dx ** 2 + dy ** 2) / bandwidth_m ** 2)
+    kernel /= 2.0 * np.pi * bandwidth_m ** 2   # 1/m²
+    return kernel * 1e6                       # 1/km²
+
+
+def bin_points(row: np.ndarray, col: np.ndarray, pad: int):
+    """点を格子にビニングした件数グリッドと、その原点 (row, col) を返す"""
+    row0 = int(row.min()) - pad
+    col0 = int(col.min()) - pad
+    height = int(row.max()) - row0 + 1 + pad
+    width = int(col.max()) - col0 + 1 + pad
+
+    flat = (row - row0) * width + (col - col0)
+    counts = np.bincount(flat, minlength=height * width).reshape(height, width)
+    return counts.astype(np.float32), row0, col0
+
+
+def compute_kde(lon: np.ndarray, lat: np.ndarray):
+    """複数帯域幅の密度面を計算"""
+    print_section("2. カーネル密度計算（ビニング + FFT畳み込み）")
+
+    lat0 = float(np.mean(lat))
+    row, col = mesh_grid.lonlat_to_cell(lon, lat)
+
+    kernels = {bw: gaussian_kernel(bw, lat0) for bw in config.KDE_BANDWIDTHS_M}
+    pad = max(max(k.shape) // 2 for k in kernels.values()) + 1
+
+    counts, row0, col0 = bin_points(row, col, pad)
+    print(f"  格子サイズ: {counts.shape[0]:,} × {counts.shape[1]:,} セル")
+
+    surfaces = {}
+    for bw, kernel in kernels.items():
+        start_time = time.time()
+        surface = fftconvolve(counts, kernel, mode='same')
+        # FFT の丸め誤差で生じる微小な負値を除去
+        surfaces[bw] = np.clip(surface, 0, None).astype(np.float32)
+        elapsed = time.time() - start_time
+        print(f"  ✓ 帯域幅 {bw}m: カーネル {kernel.shape[0]}×{kernel.shape[1]} ({elapsed:.2f}秒)")
+
+    return surfaces, counts, row0, col0
+
+
+def sample_surfaces(surfaces: dict, row0: int, col0: int, mesh_codes) -> pd.DataFrame:
+    """メッシュコードごとに密度面の値を取り出す"""
+    row, col = mesh_grid.decode_mesh_code(mesh_codes)
+    first = next(iter(surfaces.values()))
+    r = row - row0
+    c = col - col0
+    inside = (r >= 0) & (r < first.shape[0]) & (c >= 0) & (c < first.shape[1])
+    r = np.where(inside, r, 0)
+    c = np.where(inside, c, 0)
+
+    df = pd.DataFrame({'mesh_code': np.asarray(mesh_codes)})
+    for bw, surface in surfaces.items():
+        df[f'飲食店KDE_{bw}m'] = np.where(inside, surface[r, c], 0.0)
+    return df
+
+
+def save_results(surfaces: dict, counts: np.ndarray, row0: int, col0: int):
+    """メッシュ別属性CSVと圧縮ラスタを保存"""
+    print_section("3. 結果の保存")
+
+    Path(config.OUTPUT_DIR).mkdir(exist_ok=True)
+
+    # ラスタ: 行・列原点と帯域幅ごとの float32 配列
+    np.savez_compressed(
+        config.RESTAURANT_KDE_RASTER,
+        row0=row0, col0=col0,
+        bandwidths_m=np.array(list(surfaces.keys())),
+        counts=counts,
+        **{f'kde_{bw}m': s for bw, s in surfaces.items()}
+    )
+    print(f"  ✓ {config.RESTAURANT_KDE_RASTER}")
+
+    # メッシュ別属性: ステージ1の集計対象メッシュがあればそれに合わせる
+    if Path(config.OUTPUT_MESH_RESULT_CSV).exists():
+        mesh_codes = pd.read_csv(config.OUTPUT_MESH_RESULT_CSV, usecols=['mesh_code'])['mesh_code'].values
+    else:
+        first = next(iter(surfaces.values()))
+        rr, cc = np.nonzero(first > 0)
+        mesh_codes = mesh_grid.encode_mesh_code(rr + row0, cc + col0)
+
+    kde_df = sample_surfaces(surfaces, row0, col0, mesh_codes)
+    kde_df.to_csv(config.RESTAURANT_KDE_CSV, index=False, encoding='utf-8-sig', float_format='%.4f')
+    print(f"  ✓ {config.RESTAURANT_KDE_CSV} ({len(kde_df):,}メッシュ)")
+
+
+def main():
+    start_time = time.time()
+
+    print("=" * 60)
+    print("飲食店カーネル密度推定")
+    print(f"帯域幅: {config.KDE_BANDWIDTHS_M} m")
+    print("=" * 60)
+
+    try:
+        lon, lat = load_food_points()
+        surfaces, counts, row0, col0 = compute_kde(lon, lat)
+        save_results(surfaces, counts, row0, col0)
+
+        elapsed = time.time() - start_time
+        print_section("処理完了")
+        print(f"  総処理時間: {elapsed:.1f}秒")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+What-if シナリオ分析（飲食店・建物の増減、駅の乗降客数の変更・新駅・廃駅）
+ステップ1の集計表とステップ2の保存済みモデルを一度だけ読み込み、シナリオごとに
+- 件数が変わるメッシュと、駅の変更で最寄駅の組が変わるメッシュを求め
+- その周辺の窓だけで件数特徴量・空間ラグ・飲食店KDE・駅アクセス指標を再計算し
+- 保存済みモデルでクラスタを再予測して、影響を受けたメッシュの差分を返す
+パイプライン全体は再実行しない。比較の基準は保存済みモデルによる現状の予測
+
+シナリオファイル（JSON）の例:
+    {"name": "博多駅前出店",
+     "events": [
+        {"type": "restaurant", "lon": 130.42, "lat": 33.59, "count": 30},
+        {"type": "building", "usage": "商業施設", "mesh_code": 5130243311, "count": -2},
+        {"type": "station", "name": "博多", "ridership_factor": 2.0},
+        {"type": "station", "name": "新駅", "lon": 130.40, "lat": 33.58, "ridership": 20000},
+        {"type": "station", "name": "廃止駅", "remove": true}]}
+    count が負の場合は閉店・除却（メッシュの件数を下回る分は0で止める）
+
+使い方:
+    python scenario.py scenario.json [--k 6 --k 8] [--output changes.csv]
+"""
+import argparse
+import importlib
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+import cluster_model
+import mesh_grid
+from restaurant_kde import gaussian_kernel, sample_surfaces
+from snapshots import cluster_names
+from station_accessibility import compute_accessibility, load_stations, station_mask
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+def available_k() -> list:
+    """保存済みモデルがある k の一覧"""
+    return sorted(int(p.parent.name[1:]) for p in Path(config.OUTPUT_DIR).glob(f'k??/{cluster_model.MODEL_FILE}'))
+
+
+def dilate(index: mesh_grid.MeshGridIndex, row, col, radius: int) -> np.ndarray:
+    """(row, col) から radius セル以内（正方窓）にある既存メッシュの行番号"""
+    if radius < 0 or len(row) == 0:
+        return np.empty(0, dtype=np.int64)
+    found = [index.lookup(row + dr, col + dc)
+             for dr, dc in mesh_grid.window_offsets(radius, 'queen', include_self=True)]
+    found = np.concatenate(found)
+    return np.unique(found[found >= 0])
+
+
+class ScenarioEngine:
+    """
+    ステップ1の集計表・特徴量・保存済みモデルをメモリに保持し、シナリオを差分で評価する
+    特徴量はステップ2と同じ関数（add_count_features / attach_optional_features / compute_spatial_lags）で作る
+    """
+
+    def __init__(self, k_list=None):
+        stage2 = importlib.import_module('2_cluster_analysis_multi')
+        self.stage2 = stage2
+
+        if not Path(config.OUTPUT_MESH_RESULT_CSV).exists():
+            raise FileNotFoundError(
+                f"集計結果が見つかりません: {config.OUTPUT_MESH_RESULT_CSV}\n"
+                "先に 1_mesh_analysis.py を実行してください"
+            )
+        raw = pd.read_csv(config.OUTPUT_MESH_RESULT_CSV, encoding='utf-8-sig')
+        self.building_cols = [c for c in raw.columns if c.startswith('建物_')]
+        for col in self.building_cols + ['飲食店数', '建物総数']:
+            raw[col] = raw[col].astype(np.int64)
+
+        self.mesh_code = raw['mesh_code'].to_numpy(dtype=np.int64)
+        self.row, self.col = mesh_grid.decode_mesh_code(self.mesh_code)
+        self.index = mesh_grid.MeshGridIndex(self.row, self.col)
+        # 距離減衰の基準緯度は全メッシュで固定（ステップ2の全体計算と同じ値）
+        self.lat0 = float(np.mean(mesh_grid.cell_center(self.row, self.col)[1]))
+
+        # ステップ2と同じ手順で現状の特徴量を作成
+        df = raw.copy()
+        stage2.add_count_features(df)
+        df, optional_cols = stage2.attach_optional_features(df)
+        if config.SPATIAL_LAG_ENABLED:
+            stage2.compute_spatial_lags(df, lat0=self.lat0)
+        self.df = df.reset_index(drop=True)
+        # 追加特徴量の元の列（log1p 付きのセットは _log を外した列）
+        self.optional_raw = [c[:-len('_log')] if c.endswith('_log') and c[:-len('_log')] in df.columns else c
+                             for c in optional_cols]
+        self.optional_log = [c for c in optional_cols if c not in self.optional_raw]
+        self.window = max(list(config.SPATIAL_LAG_RADII) + [config.SPATIAL_DECAY_RADIUS]) \
+            if config.SPATIAL_LAG_ENABLED else 0
+
+        self.models, self.baseline, self.names = {}, {}, {}
+        for k in (k_list or available_k()):
+            model = cluster_model.load_model(k)
+            missing = [c for c in model['feature_cols'] if c not in self.df.columns]
+            if missing:
+                raise ValueError(f"k={k} のモデルの特徴量を作成できません: {missing}")
+            self.models[k] = model
+            self.baseline[k] = cluster_model.predict(model, self._matrix(self.df, model))
+            self.names[k] = cluster_names(k, self.df, pd.Series(self.baseline[k], index=self.mesh_code))
+        if not self.models:
+            raise FileNotFoundError("保存済みモデルがありません。先に 2_cluster_analysis_multi.py を実行してください")
+
+        self._init_kde()
+        self._init_stations()
+
+    # ==================== 初期化 ====================
+
+    def _init_kde(self):
+        """飲食店KDEが特徴量にある場合、帯域幅ごとのカーネルと現状のラスタを用意"""
+        self.kde = {}
+        bandwidths = [bw for bw in config.KDE_BANDWIDTHS_M if f'飲食店KDE_{bw}m' in self.optional_raw]
+        if not bandwidths:
+            return
+        self.kde_surfaces, self.kde_origin = None, (0, 0)
+        lat0 = self.lat0
+        if Path(config.RESTAURANT_KDE_RASTER).exists():
+            with np.load(config.RESTAURANT_KDE_RASTER) as raster:
+                counts = raster['counts']
+                self.kde_origin = (int(raster['row0']), int(raster['col0']))
+                self.kde_surfaces = {bw: raster[f'kde_{bw}m'] for bw in bandwidths if f'kde_{bw}m' in raster.files}
+            # restaurant_kde.py はカーネルの m 換算に飲食店の平均緯度を使う（件数グリッドから復元）
+            rows = np.arange(counts.shape[0]) + self.kde_origin[0] + 0.5
+            if counts.sum() > 0:
+                lat0 = float((counts.sum(axis=1) * rows).sum() / counts.sum() * mesh_grid.CELL_LAT_DEG)
+        self.kde = {bw: gaussian_kernel(bw, lat0) for bw in bandwidths}
+
+    def _init_stations(self):
+        """駅アクセス指標が特徴量にある場合、現状の駅と各メッシュの近傍駅の組を用意"""
+        self.stations = None
+        if '駅アクセス指標' not in self.optional_raw:
+            return
+        self.stations = load_stations()
+        self.station_lat0 = float(np.mean(self.stations['緯度']))
+
+        k_grav = min(max(config.STATION_GRAVITY_K, config.STATION_NEAREST_K), len(self.stations))
+        sx, sy = mesh_grid.project_xy(self.stations['経度'].values, self.stations['緯度'].values, self.station_lat0)
+        self.mesh_xy = np.column_stack(mesh_grid.project_xy(
+            self.df['中心_経度'].values, self.df['中心_緯度'].values, self.station_lat0))
+        dist, idx = cKDTree(np.column_stack([sx, sy])).query(self.mesh_xy, k=k_grav)
+        self.station_idx = idx.reshape(len(self.mesh_xy), -1).astype(np.int32)
+        # 駅数が近傍駅数以下なら、どの駅の追加もすべてのメッシュの近傍駅の組を変える
+        self.kth_dist = (dist.reshape(len(self.mesh_xy), -1)[:, -1]
+                         if len(self.stations) > k_grav else np.full(len(self.mesh_xy), np.inf))
+
+    def _matrix(self, df: pd.DataFrame, model: dict) -> np.ndarray:
+        return df[model['feature_cols']].fillna(0).to_numpy(dtype=np.float64)
+
+    # ==================== シナリオの解釈 ====================
+
+    def _count_deltas(self, events):
+        """件数の増減を (row, col, 列) ごとに合算した表"""
+        records = []
+        for event in events:
+            kind = event.get('type')
+            if kind not in ('restaurant', 'building'):
+                continue
+            if 'mesh_code' in event:
+                row, col = mesh_grid.decode_mesh_code([event['mesh_code']])
+            else:
+                row, col = mesh_grid.lonlat_to_cell([event['lon']], [event['lat']])
+            if kind == 'restaurant':
+                column = '飲食店数'
+            else:
+                usage = str(event['usage'])
+                column = '建物_' + config.TARGET_USAGES.get(usage, usage)
+                if column not in self.building_cols:
+                    raise ValueError(f"建物用途が集計表にありません: {usage}")
+            records.append((int(row[0]), int(col[0]), column, int(event.get('count', 1))))
+        deltas = pd.DataFrame(records, columns=['row', 'col', 'column', 'delta'])
+        return deltas.groupby(['row', 'col', 'column'], as_index=False)['delta'].sum()
+
+    def _station_edits(self, events):
+        """駅の変更を反映した駅表と、近傍駅の組・乗降客数が変わる既存メッシュの行番号"""
+        station_events = [e for e in events if e.get('type') == 'station']
+        if not station_events:
+            return None, np.empty(0, dtype=np.int64)
+        if self.stations is None:
+            raise ValueError("駅アクセス指標が特徴量に含まれていないため、駅のシナリオは評価できません")
+
+        stations = self.stations.copy()
+        affected = np.zeros(len(self.df), dtype=bool)
+
+        def rows_using(name):
+            ids = np.flatnonzero(station_mask(self.stations, name))
+            affected[np.isin(self.station_idx, ids).any(axis=1)] = True
+
+        def rows_near(lon, lat):
+            x, y = mesh_grid.project_xy([lon], [lat], self.station_lat0)
+            d = np.hypot(self.mesh_xy[:, 0] - x[0], self.mesh_xy[:, 1] - y[0])
+            affected[d < self.kth_dist] = True
+
+        for event in station_events:
+            name = event['name']
+            hit = station_mask(stations, name)
+            if event.get('remove'):
+                if not hit.any():
+                    raise ValueError(f"駅が見つかりません: {name}")
+                rows_using(name)
+                stations = stations[~hit]
+                continue
+            if not hit.any():
+                if 'lon' not in event or 'lat' not in event:
+                    raise ValueError(f"駅が見つかりません（新駅には lon, lat が必要です）: {name}")
+                stations = pd.concat([stations, pd.DataFrame([{
+                    '駅名': name, '駅コード': '', '経度': float(event['lon']), '緯度': float(event['lat']),
+                    '乗降客数': 0.0}])], ignore_index=True)
+                hit = station_mask(stations, name)
+            else:
+                rows_using(name)
+            if hit.sum() > 1 and ('lon' in event or 'ridership' in event):
+                raise ValueError(f"同名の駅が複数あります。駅コードで指定してください: "
+                                 f"{stations.loc[hit, '駅コード'].tolist()}")
+            if 'lon' in event and 'lat' in event:
+                stations.loc[hit, ['経度', '緯度']] = [float(event['lon']), float(event['lat'])]
+            if 'ridership' in event:
+                stations.loc[hit, '乗降客数'] = float(event['ridership'])
+            elif 'ridership_factor' in event:
+                stations.loc[hit, '乗降客数'] *= float(event['ridership_factor'])
+            for lon, lat in zip(stations.loc[hit, '経度'], stations.loc[hit, '緯度']):
+                rows_near(float(lon), float(lat))
+
+        return stations.reset_index(drop=True), np.flatnonzero(affected)
+
+    # ==================== 評価 ====================
+
+    def evaluate(self, events) -> pd.DataFrame:
+        """
+        シナリオを評価し、特徴量が変わり得るメッシュごとの前後の件数とクラスタを返す
+        （新規メッシュは cluster_前 = -1、件数が0になり消えるメッシュは cluster_後 = -1）
+        """
+        deltas = self._count_deltas(events)
+        stations, station_rows = self._station_edits(events)
+
+        # 件数が変わるセル（既存メッシュは行番号、新規メッシュは -1）
+        cells = deltas[['row', 'col']].drop_duplicates().to_numpy(dtype=np.int64)
+        cell_pos = self.index.lookup(cells[:, 0], cells[:, 1])
+
+        # 自メッシュの特徴量が変わるセル: 件数の変化 + KDE の窓 + 近傍駅の組の変化
+        changed_r, changed_c = [cells[:, 0]], [cells[:, 1]]
+        food = deltas[deltas['column'] == '飲食店数']
+        if self.kde and len(food):
+            half = max(max(k.shape) // 2 for k in self.kde.values())
+            kde_pos = dilate(self.index, food['row'].values, food['col'].values, half)
+            changed_r.append(self.row[kde_pos])
+            changed_c.append(self.col[kde_pos])
+        changed_r.append(self.row[station_rows])
+        changed_c.append(self.col[station_rows])
+        changed_r, changed_c = np.concatenate(changed_r), np.concatenate(changed_c)
+
+        # 空間ラグが変わるメッシュ（影響範囲）と、その計算に必要な周辺メッシュ
+        affected_pos = dilate(self.index, changed_r, changed_c, self.window)
+        context_pos = np.union1d(affected_pos, dilate(self.index, self.row[affected_pos], self.col[affected_pos],
+                                                      self.window))
+        new_cells = cells[cell_pos < 0]
+
+        local = self._local_frame(context_pos, new_cells)
+        before = local[['mesh_code', '飲食店数', '建物総数']].copy()
+        self._apply_counts(local, deltas)
+        if self.kde and len(food):
+            self._apply_kde(local, deltas[deltas['column'] == '飲食店数'])
+        if stations is not None or len(new_cells):
+            self._apply_stations(local, stations, station_rows, context_pos)
+
+        # 件数が0になったメッシュはステップ1の出力に含まれないので除く
+        kept = (local['建物総数'] > 0) | (local['飲食店数'] > 0)
+        removed = local.loc[~kept, 'mesh_code'].to_numpy()
+        local = local[kept].reset_index(drop=True)
+        self._local_features(local)
+
+        affected_codes = np.concatenate([self.mesh_code[affected_pos], new_cells_codes(new_cells)])
+        result = before[before['mesh_code'].isin(affected_codes)].rename(
+            columns={'飲食店数': '飲食店数_前', '建物総数': '建物総数_前'}).reset_index(drop=True)
+        after = local.set_index('mesh_code').reindex(result['mesh_code'].values)
+        result['飲食店数_後'] = after['飲食店数'].fillna(0).astype(np.int64).values
+        result['建物総数_後'] = after['建物総数'].fillna(0).astype(np.int64).values
+        is_new = ~np.isin(result['mesh_code'].values, self.mesh_code)
+        is_removed = np.isin(result['mesh_code'].values, removed)
+
+        pos = self.index.lookup(*mesh_grid.decode_mesh_code(result['mesh_code'].values))
+        present = ~is_removed
+        changed_any = np.zeros(len(result), dtype=bool)
+        for k, model in self.models.items():
+            cluster_before = np.where(pos >= 0, self.baseline[k][np.maximum(pos, 0)], -1)
+            cluster_after = np.full(len(result), -1, dtype=np.int64)
+            if present.any():
+                cluster_after[present] = cluster_model.predict(model, self._matrix(after[present], model))
+            result[f'cluster_前_k{k}'] = cluster_before
+            result[f'cluster_後_k{k}'] = cluster_after
+            result[f'cluster_name_後_k{k}'] = [self.names[k].get(c, '消滅' if c < 0 else f'クラスタ{c}')
+                                              for c in cluster_after]
+            changed_any |= cluster_before != cluster_after
+
+        result.insert(1, '区分', np.where(is_new, '新規', np.where(is_removed, '消滅', '既存')))
+        result['クラスタ変化'] = changed_any
+        return result.sort_values(['クラスタ変化', 'mesh_code'], ascending=[False, True]).reset_index(drop=True)
+
+    def _local_frame(self, context_pos: np.ndarray, new_cells: np.ndarray) -> pd.DataFrame:
+        """影響範囲と周辺メッシュの件数・追加特徴量の元の列（新規メッシュは件数0で追加）"""
+        columns = ['mesh_code', '中心_経度', '中心_緯度'] + self.building_cols + ['飲食店数', '建物総数'] \
+            + self.optional_raw
+        local = self.df.iloc[context_pos][columns]
+        if len(new_cells):
+            codes = new_cells_codes(new_cells)
+            lon, lat = mesh_grid.cell_center(new_cells[:, 0], new_cells[:, 1])
+            added = pd.DataFrame({'mesh_code': codes, '中心_経度': lon, '中心_緯度': lat})
+            for col in self.building_cols + ['飲食店数', '建物総数']:
+                added[col] = 0
+            for col in self.optional_raw:
+                added[col] = 0.0
+            # 新規メッシュの KDE は現状のラスタから取る（アクセス指標は _apply_stations で計算）
+            if self.kde and self.kde_surfaces:
+                sampled = sample_surfaces(self.kde_surfaces, *self.kde_origin, codes)
+                for col in sampled.columns.drop('mesh_code'):
+                    added[col] = sampled[col].values
+            local = pd.concat([local, added], ignore_index=True)
+        return local.reset_index(drop=True)
+
+    def _apply_counts(self, local: pd.DataFrame, deltas: pd.DataFrame):
+        """件数の増減を反映（0未満にはしない）し、飲食店の実際の増減を deltas に書き戻す"""
+        row_of = pd.Series(np.arange(len(local)), index=local['mesh_code'].values)
+        codes = mesh_grid.encode_mesh_code(deltas['row'].values, deltas['col'].values)
+        rows = row_of.reindex(codes).to_numpy()
+        effective = np.zeros(len(deltas), dtype=np.int64)
+        for i, (column, delta) in enumerate(zip(deltas['column'], deltas['delta'])):
+            current = int(local.at[rows[i], column])
+            updated = max(current + int(delta), 0)
+            local.at[rows[i], column] = updated
+            effective[i] = updated - current
+        deltas['delta'] = effective
+        local['建物総数'] = local[self.building_cols].sum(axis=1)
+
+    def _apply_kde(self, local: pd.DataFrame, food: pd.DataFrame):
+        """飲食店の増減をカーネルとして各帯域幅の密度に足し込む（ビニング + 畳み込みと同じ値）"""
+        food = food[food['delta'] != 0]
+        if food.empty:
+            return
+        row, col = mesh_grid.decode_mesh_code(local['mesh_code'].values)
+        index = mesh_grid.MeshGridIndex(row, col)
+        for bw, kernel in self.kde.items():
+            values = local[f'飲食店KDE_{bw}m'].to_numpy(dtype=np.float64)
+            hr, hc = kernel.shape[0] // 2, kernel.shape[1] // 2
+            dr, dc = np.meshgrid(np.arange(-hr, hr + 1), np.arange(-hc, hc + 1), indexing='ij')
+            for r, c, d in food[['row', 'col', 'delta']].itertuples(index=False):
+                pos = index.lookup(r + dr.ravel(), c + dc.ravel())
+                hit = pos >= 0
+                np.add.at(values, pos[hit], d * kernel.ravel()[hit])
+            local[f'飲食店KDE_{bw}m'] = np.clip(values, 0, None)
+
+    def _apply_stations(self, local: pd.DataFrame, stations: pd.DataFrame, station_rows: np.ndarray,
+                        context_pos: np.ndarray):
+        """近傍駅の組・乗降客数が変わるメッシュと新規メッシュの駅アクセス指標を再計算"""
+        if self.stations is None:
+            return
+        stations = self.stations if stations is None else stations
+        target = np.isin(local['mesh_code'].values, self.mesh_code[station_rows])
+        target |= ~np.isin(local['mesh_code'].values, self.mesh_code)
+        if not target.any():
+            return
+        access = compute_accessibility(local.loc[target, '中心_経度'].values, local.loc[target, '中心_緯度'].values,
+                                       stations, lat0=self.station_lat0)
+        for col in access.columns:
+            if col in local.columns:
+                local.loc[target, col] = access[col].values
+
+    def _local_features(self, local: pd.DataFrame):
+        """窓内のメッシュについてステップ2と同じ特徴量を計算（空間ラグは全体と同じ基準緯度）"""
+        self.stage2.add_count_features(local)
+        for col in self.optional_log:
+            local[col] = np.log1p(local[col[:-len('_log')]])
+        if config.SPATIAL_LAG_ENABLED:
+            self.stage2.compute_spatial_lags(local, lat0=self.lat0)
+
+
+def new_cells_codes(cells: np.ndarray) -> np.ndarray:
+    """(row, col) の配列をメッシュコードに変換"""
+    if len(cells) == 0:
+        return np.empty(0, dtype=np.int64)
+    return mesh_grid.encode_mesh_code(cells[:, 0], cells[:, 1])
+
+
+def summarize(result: pd.DataFrame, engine: ScenarioEngine):
+    """シナリオ結果の要約を表示"""
+    counts = result['区分'].value_counts()
+    print(f"  影響範囲: {len(result):,}メッシュ（新規 {counts.get('新規', 0):,}, 消滅 {counts.get('消滅', 0):,}）")
+    print(f"  飲食店数の増減: {int(result['飲食店数_後'].sum() - result['飲食店数_前'].sum()):+,}")
+    print(f"  建物総数の増減: {int(result['建物総数_後'].sum() - result['建物総数_前'].sum()):+,}")
+    for k in engine.models:
+        before, after = result[f'cluster_前_k{k}'], result[f'cluster_後_k{k}']
+        moved = result[before != after]
+        print(f"\n  k={k}: クラスタが変わるメッシュ {len(moved):,}")
+        transitions = moved.groupby([f'cluster_前_k{k}', f'cluster_後_k{k}']).size().sort_values(ascending=False)
+        for (b, a), n in transitions.head(5).items():
+            name_b = engine.names[k].get(b, '新規') if b >= 0 else '新規'
+            name_a = engine.names[k].get(a, '消滅') if a >= 0 else '消滅'
+            print(f"    {name_b} → {name_a}: {n:,}メッシュ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='What-if シナリオ分析（差分再計算）')
+    parser.add_argument('scenario', help='シナリオ JSON ファイル')
+    parser.add_argument('--k', type=int, action='append', help='評価する k（複数指定可。省略時は保存済みの全 k）')
+    parser.add_argument('--output', default=None, help='差分CSVの出力先（省略時は output/scenarios/{名前}.csv）')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    print("=" * 60)
+    print("What-if シナリオ分析")
+    print("=" * 60)
+
+    try:
+        scenario = json.loads(Path(args.scenario).read_text(encoding='utf-8'))
+        name = scenario.get('name', Path(args.scenario).stem)
+
+        print_section("1. 現状の特徴量とモデルの読み込み")
+        engine = ScenarioEngine(args.k)
+        print(f"  ✓ メッシュ数: {len(engine.df):,}")
+        print(f"  ✓ 対象k: {list(engine.models)}")
+
+        print_section(f"2. シナリオの評価: {name}（{len(scenario['events'])}件の変更）")
+        eval_start = time.time()
+        result = engine.evaluate(scenario['events'])
+        print(f"  ✓ 評価完了 ({time.time() - eval_start:.3f}秒)")
+        summarize(result, engine)
+
+        output = Path(args.output) if args.output else Path(config.SCENARIO_DIR) / f'{name}.csv'
+        output.parent.mkdir(parents=True, exist_ok=True)
+        result.to_csv(output, index=False, encoding='utf-8-sig')
+        print(f"\n  ✓ {output}")
+
+        print(f"\n✅ 完了 ({time.time() - start_time:.1f}秒)")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Web可視化用の静的ファイルサーバー（python -m http.server の代替）
+- prepare_web_data.py が作った .br / .gz を Accept-Encoding に応じてそのまま返す
+- 内容の SHA-256 から強い ETag を付け、If-None-Match / If-Modified-Since に 304 で応答
+- Range リクエスト（単一範囲）に 206 で応答、If-Range にも対応
+- 既定では web_data/ も HTML/JS/CSS も毎回 ETag で再検証（config.SERVE_DATA_MAX_AGE > 0 で web_data/ に max-age）
+- スレッドごとに接続を処理し、HTTP/1.1 keep-alive で複数クライアントを同時に扱う
+
+使い方:
+    python serve_web.py [--host 127.0.0.1] [--port 8000]
+"""
+import argparse
+import email.utils
+import hashlib
+import mimetypes
+import os
+import sys
+import threading
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+BASE_DIR = Path(__file__).parent
+DATA_PREFIX = '/web_data/'
+
+# 事前圧縮版の拡張子（優先順）
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+mimetypes.add_type('application/geo+json', '.geojson')
+mimetypes.add_type('application/javascript', '.js')
+
+
+class ETagCache:
+    """(パス, サイズ, 更新時刻) → ETag。ファイルが変わらない限りハッシュを再計算しない"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def get(self, path: Path, stat: os.stat_result) -> str:
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            etag = self._cache.get(key)
+        if etag is None:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            etag = f'"{digest.hexdigest()[:32]}"'
+            with self._lock:
+                self._cache[key] = etag
+        return etag
+
+
+def accepted_encodings(header: str) -> set:
+    """Accept-Encoding から q>0 の符号化方式を取り出す"""
+    accepted = set()
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def parse_range(header: str, size: int):
+    """
+    単一の bytes 範囲を (開始, 終了) で返す（終了を含む）
+    対象外・複数範囲は None（全体を返す）、満たせない範囲は ValueError
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start_text, _, end_text = header[6:].strip().partition('-')
+    try:
+        if start_text == '':
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError
+            return max(size - length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise ValueError(f'bytes */{size}')
+    return start, min(end, size - 1)
+
+
+def make_handler(directory: Path, etags: ETagCache, data_max_age: int):
+    """静的ファイルハンドラを作成"""
+
+    class StaticHandler(SimpleHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(directory), **kwargs)
+
+        def do_GET(self):
+            self._serve(send_body=True)
+
+        def do_HEAD(self):
+            self._serve(send_body=False)
+
+        def _send_empty(self, status, headers=()):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def _resolve(self):
+            """要求パスを実ファイルに解決（ディレクトリは index.html）"""
+            url_path = urlparse(self.path).path
+            path = Path(self.translate_path(url_path))
+            if path.is_dir():
+                if not url_path.endswith('/'):
+                    self._send_empty(HTTPStatus.MOVED_PERMANENTLY, [('Location', url_path + '/')])
+                    return None, url_path
+                path = path / 'index.html'
+            return path, url_path
+
+        def _select_variant(self, path: Path):
+            """Accept-Encoding に合う事前圧縮版（元ファイルより新しいもの）を選ぶ"""
+            accepted = accepted_encodings(self.headers.get('Accept-Encoding'))
+            source_mtime = path.stat().st_mtime_ns
+            for encoding, ext in ENCODINGS:
+                variant = path.with_name(path.name + ext)
+                if encoding in accepted and variant.is_file() and variant.stat().st_mtime_ns >= source_mtime:
+                    return variant, encoding
+            return path, None
+
+        def _has_variants(self, path: Path) -> bool:
+            return any(path.with_name(path.name + ext).is_file() for _, ext in ENCODINGS)
+
+        def _not_modified(self, etag: str, mtime: float) -> bool:
+            if_none_match = self.headers.get('If-None-Match')
+            if if_none_match is not None:
+                tags = [t.strip() for t in if_none_match.split(',')]
+                return '*' in tags or etag in tags or f'W/{etag}' in tags
+            if_modified_since = self.headers.get('If-Modified-Since')
+            if if_modified_since:
+                try:
+                    since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+                except (TypeError, ValueError):
+                    return False
+                return int(mtime) <= since
+            return False
+
+        def _serve(self, send_body: bool):
+            path, url_path = self._resolve()
+            if path is None:
+                return
+            if not path.is_file():
+                self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+                return
+
+            served, encoding = self._select_variant(path)
+            stat = served.stat()
+            etag = etags.get(served, stat)
+            content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json',
+                                                                     'application/geo+json'):
+                content_type += '; charset=utf-8'
+
+            headers = [
+                ('ETag', etag),
+                ('Last-Modified', self.date_time_string(stat.st_mtime)),
+                ('Accept-Ranges', 'bytes'),
+                ('Cache-Control', f'public, max-age={data_max_age}'
+                 if data_max_age > 0 and url_path.startswith(DATA_PREFIX) else 'no-cache'),
+            ]
+            if encoding or self._has_variants(path):
+                headers.append(('Vary', 'Accept-Encoding'))
+
+            if self._not_modified(etag, stat.st_mtime):
+                self._send_empty(HTTPStatus.NOT_MODIFIED, headers)
+                return
+
+            size = stat.st_size
+            byte_range = None
+            if_range = self.headers.get('If-Range')
+            if if_range is None or if_range.strip() == etag:
+                try:
+                    byte_range = parse_range(self.headers.get('Range'), size)
+                except ValueError as e:
+                    self._send_empty(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, headers + [('Content-Range', str(e))])
+                    return
+
+            start, end = byte_range if byte_range else (0, size - 1)
+            length = max(end - start + 1, 0)
+            self.send_response(HTTPStatus.PARTIAL_CONTENT if byte_range else HTTPStatus.OK)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header('Content-Type', content_type)
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-Length', str(length))
+            self.end_headers()
+
+            if send_body and length:
+                with open(served, 'rb') as f:
+                    f.seek(start)
+                    self._copy(f, length)
+
+        def _copy(self, f, length: int):
+            remaining = length
+            while remaining > 0:
+                block = f.read(min(remaining, 1 << 16))
+                if not block:
+                    break
+                self.wfile.write(block)
+                remaining -= len(block)
+
+        def log_message(self, format, *args):
+            print(f"  {self.address_string()} {format % args}")
+
+    return StaticHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Web可視化用の静的ファイルサーバー（事前圧縮・ETag・Range対応）')
+    parser.add_argument('--host', default=config.SERVE_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVE_PORT)
+    parser.add_argument('--directory', default=str(BASE_DIR), help='公開するディレクトリ')
+    args = parser.parse_args()
+
+    directory = Path(args.directory).resolve()
+    server = ThreadingHTTPServer((args.host, args.port),
+                                 make_handler(directory, ETagCache(), config.SERVE_DATA_MAX_AGE))
+    server.daemon_threads = True
+    print(f"🚀 http://{args.host}:{args.port}/ （{directory}）", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n停止しました", file=sys.stderr)
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+類似メッシュ検索
+ステップ2で保存した標準化済み特徴量（float32）上で、指定メッシュに近いメッシュを上位N件返す。
+候補をブロックに分けた行列積 |q|² + |x|² - 2q·x による厳密な最近傍探索で、
+数千件の問い合わせメッシュもまとめて処理できる。クラスタ・1次メッシュ・範囲で候補を絞り込める
+
+使い方:
+    python similar_meshes.py --k 6 --mesh 5030332211 --top 10
+    python similar_meshes.py --k 6 --mesh 5030332211,5030332212 --same-cluster
+    python similar_meshes.py --k 6 --mesh-file stores.csv --region 5030 --output similar.csv
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import cluster_model
+import mesh_grid
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+
+class SimilarMeshIndex:
+    """標準化済み特徴量ベクトルの最近傍インデックス"""
+
+    def __init__(self, mesh_code, X, sq_norm=None, cluster=None, feature_cols=None):
+        self.mesh_code = np.asarray(mesh_code, dtype=np.int64)
+        self.X = np.ascontiguousarray(X, dtype=np.float32)
+        self.sq_norm = (np.asarray(sq_norm, dtype=np.float32) if sq_norm is not None
+                        else np.einsum('ij,ij->i', self.X, self.X))
+        self.cluster = np.asarray(cluster) if cluster is not None else None
+        self.feature_cols = list(feature_cols) if feature_cols is not None else None
+
+        self.row, self.col = mesh_grid.decode_mesh_code(self.mesh_code)
+        self.grid = mesh_grid.MeshGridIndex(self.row, self.col)
+
+    @classmethod
+    def load(cls, k: int):
+        """output/kXX/feature_matrix.npz から読み込む"""
+        data = cluster_model.load_feature_matrix(k)
+        return cls(data['mesh_code'], data['X'], data['sq_norm'], data['cluster'], data['feature_cols'])
+
+    def __len__(self):
+        return len(self.mesh_code)
+
+    def positions(self, codes) -> np.ndarray:
+        """メッシュコード → 行位置（存在しないコードはエラー）"""
+        codes = np.asarray(codes, dtype=np.int64)
+        pos = self.grid.lookup(*mesh_grid.decode_mesh_code(codes))
+        if (pos < 0).any():
+            missing = codes[pos < 0][:10].tolist()
+            raise ValueError(f"メッシュが見つかりません: {missing}")
+        return pos
+
+    def candidate_mask(self, cluster=None, region=None, bbox=None) -> np.ndarray:
+        """
+        候補メッシュの絞り込み
+        cluster: クラスタ番号のリスト
+        region : 1次メッシュコード（4桁）のリスト
+        bbox   : (min_lon, min_lat, max_lon, max_lat)
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if cluster is not None:
+            if self.cluster is None:
+                raise ValueError("クラスタ番号が保存されていません")
+            mask &= np.isin(self.cluster, list(cluster))
+        if region is not None:
+            mask &= np.isin(mesh_grid.first_level_mesh(self.mesh_code), [int(r) for r in region])
+        if bbox is not None:
+            r0, c0 = mesh_grid.lonlat_to_cell(bbox[0], bbox[1])
+            r1, c1 = mesh_grid.lonlat_to_cell(bbox[2], bbox[3])
+            mask &= (self.row >= r0) & (self.row <= r1) & (self.col >= c0) & (self.col <= c1)
+        return mask
+
+    def search(self, Q, top_n: int, candidates: np.ndarray = None, exclude: np.ndarray = None,
+               query_block: int = None, candidate_block: int = None):
+        """
+        ベクトル Q（n×d）の最近傍を top_n 件返す → (位置, ユークリッド距離) いずれも n×top_n
+        candidates: 候補の行位置（None は全メッシュ）
+        exclude   : 問い合わせごとに除外する行位置（自分自身など。-1 は除外なし）
+        候補が top_n 件に満たない箇所は位置 -1・距離 inf で埋める
+        """
+        Q = np.ascontiguousarray(Q, dtype=np.float32).reshape(-1, self.X.shape[1])
+        cand = np.arange(len(self)) if candidates is None else np.asarray(candidates, dtype=np.int64)
+        query_block = query_block or config.SIMILAR_QUERY_BLOCK
+        candidate_block = candidate_block or config.SIMILAR_CANDIDATE_BLOCK
+
+        n_q = len(Q)
+        best_idx = np.full((n_q, top_n), -1, dtype=np.int64)
+        best_d2 = np.full((n_q, top_n), np.inf, dtype=np.float32)
+        q_norm = np.einsum('ij,ij->i', Q, Q)
+        # 距離のブロックは1つの float32 バッファを使い回し、その場で計算する
+        buffer = np.empty((min(query_block, n_q), min(candidate_block, len(cand))), dtype=np.float32)
+
+        for qs in range(0, n_q, query_block):
+            qe = min(qs + query_block, n_q)
+            Qb = Q[qs:qe]
+            run_idx = best_idx[qs:qe]
+            run_d2 = best_d2[qs:qe]
+            rows = np.arange(qe - qs)[:, None]
+
+            for cs in range(0, len(cand), candidate_block):
+                ce = min(cs + candidate_block, len(cand))
+                cb = cand[cs:ce]
+                Xc = self.X[cs:ce] if candidates is None else self.X[cb]
+                d2 = buffer[:qe - qs, :ce - cs]
+                np.matmul(Qb, Xc.T, out=d2)
+                d2 *= -2.0
+                d2 += q_norm[qs:qe, None]
+                d2 += self.sq_norm[cb][None, :]
+                if exclude is not None:
+                    # 問い合わせごとの除外位置をブロック内の列番号に変換
+                    order = np.argsort(cb, kind='stable')
+                    ex = exclude[qs:qe]
+                    loc = np.minimum(np.searchsorted(cb[order], ex), len(cb) - 1)
+                    hit = (cb[order][loc] == ex) & (ex >= 0)
+                    d2[np.flatnonzero(hit), order[loc[hit]]] = np.inf
+
+                # ブロック内の上位N件だけを取り出し、これまでの上位N件と合わせて選び直す
+                if d2.shape[1] > top_n:
+                    part = np.argpartition(d2, top_n - 1, axis=1)[:, :top_n]
+                else:
+                    part = np.broadcast_to(np.arange(d2.shape[1]), d2.shape)
+                merged_d2 = np.concatenate([run_d2, d2[rows, part]], axis=1)
+                merged_idx = np.concatenate([run_idx, cb[part]], axis=1)
+                keep = np.argpartition(merged_d2, top_n - 1, axis=1)[:, :top_n]
+                run_d2 = merged_d2[rows, keep]
+                run_idx = merged_idx[rows, keep]
+
+            order = np.argsort(run_d2, axis=1, kind='stable')
+            best_d2[qs:qe] = run_d2[rows, order]
+            best_idx[qs:qe] = run_idx[rows, order]
+
+        best_idx[~np.isfinite(best_d2)] = -1
+        return best_idx, np.sqrt(np.maximum(best_d2, 0.0))
+
+    def query_meshes(self, codes, top_n: int = None, cluster=None, region=None, bbox=None,
+                     same_cluster: bool = False) -> pd.DataFrame:
+        """
+        メッシュコードで問い合わせ、類似メッシュの一覧（長形式）を返す
+        same_cluster=True の場合は問い合わせメッシュと同じクラスタから探す（自分自身は除外）
+        """
+        top_n = top_n or config.SIMILAR_TOP_N
+        pos = self.positions(codes)
+        mask = self.candidate_mask(cluster, region, bbox)
+
+        idx = np.full((len(pos), top_n), -1, dtype=np.int64)
+        dist = np.full((len(pos), top_n), np.inf)
+        if same_cluster:
+            if self.cluster is None:
+                raise ValueError("クラスタ番号が保存されていません")
+            groups = []
+            for c in np.unique(self.cluster[pos]):
+                q_ids = np.flatnonzero(self.cluster[pos] == c)
+                groups.append((q_ids, mask & (self.cluster == c)))
+        else:
+            groups = [(np.arange(len(pos)), mask)]
+
+        for q_ids, cand_mask in groups:
+            q_pos = pos[q_ids]
+            idx[q_ids], dist[q_ids] = self.search(self.X[q_pos], top_n, np.flatnonzero(cand_mask), exclude=q_pos)
+
+        valid = idx >= 0
+        q_rows, ranks = np.nonzero(valid)
+        hit = idx[valid]
+        result = pd.DataFrame({
+            'query_mesh_code': self.mesh_code[pos][q_rows],
+            'rank': ranks + 1,
+            'mesh_code': self.mesh_code[hit],
+            'distance': dist[valid].round(4),
+        })
+        if self.cluster is not None:
+            result['query_cluster'] = self.cluster[pos][q_rows]
+            result['cluster'] = self.cluster[hit]
+        return result
+
+
+def parse_list(text, cast=int):
+    """カンマ区切りの文字列をリストに変換（空なら None）"""
+    return [cast(v) for v in text.split(',')] if text else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='標準化特徴量空間での類似メッシュ検索')
+    parser.add_argument('--k', type=int, default=config.N_CLUSTERS, help='使うモデルのクラスタ数')
+    parser.add_argument('--mesh', help='問い合わせメッシュコード（カンマ区切り）')
+    parser.add_argument('--mesh-file', help='問い合わせメッシュ一覧のCSV（mesh_code 列）')
+    parser.add_argument('--top', type=int, default=config.SIMILAR_TOP_N, help='返す件数')
+    parser.add_argument('--cluster', help='候補のクラスタ番号（カンマ区切り）')
+    parser.add_argument('--region', help='候補の1次メッシュコード（カンマ区切り）')
+    parser.add_argument('--bbox', help='候補の範囲 minlon,minlat,maxlon,maxlat')
+    parser.add_argument('--same-cluster', action='store_true', help='問い合わせメッシュと同じクラスタから探す')
+    parser.add_argument('--output', help='結果CSVの出力先（省略時は表示のみ）')
+    args = parser.parse_args()
+
+    try:
+        codes = parse_list(args.mesh) or []
+        if args.mesh_file:
+            codes += pd.read_csv(args.mesh_file, encoding='utf-8-sig')['mesh_code'].astype(np.int64).tolist()
+        if not codes:
+            raise ValueError("--mesh または --mesh-file を指定してください")
+
+        start_time = time.time()
+        index = SimilarMeshIndex.load(args.k)
+        print(f"✓ 読み込み: {len(index):,}メッシュ × {index.X.shape[1]}特徴量 (k={args.k}, "
+              f"{time.time() - start_time:.2f}秒)", file=sys.stderr)
+
+        start_time = time.perf_counter()
+        result = index.query_meshes(
+            codes, args.top,
+            cluster=parse_list(args.cluster),
+            region=parse_list(args.region),
+            bbox=parse_list(args.bbox, float),
+            same_cluster=args.same_cluster,
+        )
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        print(f"✓ 検索: {len(codes):,}件 × 上位{args.top} ({elapsed_ms:.1f}ms)", file=sys.stderr)
+
+        if args.output:
+            result.to_csv(args.output, index=False, encoding='utf-8-sig')
+            print(f"✓ {args.output}", file=sys.stderr)
+        else:
+            print(result.to_string(index=False))
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+出店候補地の選定（最大カバー − 競合）
+候補（メッシュ中心または駅）ごとに半径内のメッシュを商圏とし、
+    目的関数 = 選んだ商圏のいずれかに含まれるメッシュの需要の合計 − λ × 各商圏内の既存飲食店数の合計
+を最大にする K 箇所を選ぶ。需要は建物用途別の件数と駅乗降客数の重み付き和（config.SITE_*）。
+商圏は KD-tree で作った疎なカバー行列（候補 × メッシュ）で持ち、目的関数が劣モジュラであることを
+使った遅延評価の貪欲法（lazy greedy）で選ぶため、数千候補・数百箇所でも数秒で終わる
+
+使い方:
+    python site_selection.py --sites 20                         # 全メッシュを候補に半径 config.SITE_RADIUS_M
+    python site_selection.py --sites 50 --radius 800 --k 6 --cluster 2,5
+    python site_selection.py --candidates stations --sites 10   # 駅を候補に、乗降客数に応じた半径
+    python site_selection.py --candidate-file candidates.csv --sites 100
+"""
+import argparse
+import heapq
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+
+import mesh_grid
+from similar_meshes import parse_list
+from station_accessibility import load_stations
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+# ==================== 需要・競合 ====================
+
+def station_ridership_by_mesh(mesh_df: pd.DataFrame, stations: pd.DataFrame) -> np.ndarray:
+    """駅の乗降客数を駅が位置するメッシュに集計（集計表に無いメッシュの駅は数えない）"""
+    ridership = np.zeros(len(mesh_df))
+    if stations is None or stations.empty:
+        return ridership
+    index = mesh_grid.MeshGridIndex.from_mesh_codes(mesh_df['mesh_code'].values)
+    pos = index.lookup(*mesh_grid.lonlat_to_cell(stations['経度'].values, stations['緯度'].values))
+    np.add.at(ridership, pos[pos >= 0], stations['乗降客数'].values[pos >= 0])
+    return ridership
+
+
+def demand_scores(mesh_df: pd.DataFrame, stations: pd.DataFrame = None, weights: dict = None,
+                  ridership_weight: float = None) -> np.ndarray:
+    """メッシュ別の需要 = Σ 重み × 建物用途別件数 + 重み × 乗降客数（config.SITE_DEMAND_WEIGHTS）"""
+    weights = config.SITE_DEMAND_WEIGHTS if weights is None else weights
+    ridership_weight = config.SITE_RIDERSHIP_WEIGHT if ridership_weight is None else ridership_weight
+    score = np.zeros(len(mesh_df))
+    for col, w in weights.items():
+        if col in mesh_df.columns:
+            score += w * mesh_df[col].to_numpy(dtype=np.float64)
+    if ridership_weight:
+        score += ridership_weight * station_ridership_by_mesh(mesh_df, stations)
+    return score
+
+
+def catchment_radius(ridership) -> np.ndarray:
+    """乗降客数に応じた駅の商圏半径（m）。js/app.js の RADIUS_RULES と同じ区分"""
+    ridership = np.asarray(ridership, dtype=np.float64)
+    radius = np.full(ridership.shape, float(config.SITE_RADIUS_RULES[-1][1]))
+    for upper, r in reversed(config.SITE_RADIUS_RULES):
+        radius[ridership < upper] = r
+    return radius
+
+
+def coverage_matrix(cand_lon, cand_lat, mesh_lon, mesh_lat, radius_m, lat0: float = None) -> sp.csr_matrix:
+    """候補 × メッシュの疎なカバー行列（メッシュ中心が候補から radius_m 以内なら1）"""
+    if lat0 is None:
+        lat0 = float(np.mean(mesh_lat))
+    tree = cKDTree(np.column_stack(mesh_grid.project_xy(mesh_lon, mesh_lat, lat0)))
+    points = np.column_stack(mesh_grid.project_xy(cand_lon, cand_lat, lat0))
+    radius = np.broadcast_to(np.asarray(radius_m, dtype=np.float64), (len(points),))
+    hits = tree.query_ball_point(points, r=radius, return_sorted=False)
+
+    lengths = np.fromiter((len(h) for h in hits), dtype=np.int64, count=len(hits))
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    indices = np.fromiter((j for h in hits for j in h), dtype=np.int64, count=int(indptr[-1]))
+    data = np.ones(len(indices), dtype=np.float64)
+    return sp.csr_matrix((data, indices, indptr), shape=(len(points), len(mesh_lon)))
+
+
+# ==================== 遅延評価の貪欲法 ====================
+
+def lazy_greedy(coverage: sp.csr_matrix, demand: np.ndarray, penalty: np.ndarray, n_sites: int):
+    """
+    目的関数 f(S) = Σ_{j ∈ ∪C(i)} demand_j − Σ_{i∈S} penalty_i を貪欲に最大化
+    カバー部分は劣モジュラなので、各候補の増分は選ぶほど小さくなる。前回計算した増分を上界として
+    ヒープに積み、先頭の候補だけ増分を計算し直す（計算し直した値が次の上界以上ならそれを採用）
+    増分が正の候補が無くなった時点で打ち切る
+    戻り値: 選んだ候補の行番号、各回の増分、各回の新規カバー需要
+    """
+    coverage = sp.csr_matrix(coverage)
+    indptr, indices = coverage.indptr, coverage.indices
+    covered = np.zeros(coverage.shape[1], dtype=bool)
+
+    def gain_of(i):
+        cells = indices[indptr[i]:indptr[i + 1]]
+        return float(demand[cells[~covered[cells]]].sum())
+
+    upper = np.asarray(coverage @ demand).ravel() - penalty
+    heap = [(-u, i) for i, u in enumerate(upper)]
+    heapq.heapify(heap)
+
+    selected, gains, covered_gains = [], [], []
+    while heap and len(selected) < n_sites:
+        _, i = heapq.heappop(heap)
+        covered_demand = gain_of(i)
+        gain = covered_demand - penalty[i]
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+        if gain <= 0:
+            break
+        selected.append(i)
+        gains.append(gain)
+        covered_gains.append(covered_demand)
+        covered[indices[indptr[i]:indptr[i + 1]]] = True
+    return np.asarray(selected, dtype=np.int64), np.asarray(gains), np.asarray(covered_gains)
+
+
+# ==================== 候補 ====================
+
+def mesh_candidates(mesh_df: pd.DataFrame, radius_m: float, k: int = None, clusters=None,
+                    codes=None) -> pd.DataFrame:
+    """メッシュ中心を候補にする（k・クラスタ、メッシュコード一覧で絞り込み）"""
+    cand = mesh_df[['mesh_code', '中心_経度', '中心_緯度']].rename(columns={'中心_経度': '経度', '中心_緯度': '緯度'})
+    if codes is not None:
+        cand = cand[cand['mesh_code'].isin(np.asarray(codes, dtype=np.int64))]
+    if clusters:
+        csv_path = Path(config.OUTPUT_DIR) / f'k{k:02d}' / 'mesh_with_clusters.csv'
+        if not csv_path.exists():
+            raise FileNotFoundError(f"クラスタ結果が見つかりません: {csv_path}\n先に 2_cluster_analysis_multi.py を実行してください")
+        labels = pd.read_csv(csv_path, encoding='utf-8-sig', usecols=['mesh_code', 'cluster'])
+        keep = labels.loc[labels['cluster'].isin(clusters), 'mesh_code']
+        cand = cand[cand['mesh_code'].isin(keep)]
+    cand = cand.reset_index(drop=True)
+    cand.insert(0, '候補', cand['mesh_code'].astype(str))
+    cand['商圏半径m'] = float(radius_m)
+    return cand
+
+
+def station_candidates(stations: pd.DataFrame, radius_m: float = None) -> pd.DataFrame:
+    """駅を候補にする（半径の指定が無ければ乗降客数に応じた半径）"""
+    cand = stations[['駅名', '駅コード', '経度', '緯度', '乗降客数']].rename(columns={'駅名': '候補'}).reset_index(drop=True)
+    cand['商圏半径m'] = float(radius_m) if radius_m else catchment_radius(cand['乗降客数'].values)
+    return cand
+
+
+def select_sites(mesh_df: pd.DataFrame, candidates: pd.DataFrame, n_sites: int, demand: np.ndarray = None,
+                 competition_weight: float = None, stations: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    候補から n_sites 箇所を選ぶ
+    demand を渡すとその配列（メッシュ順）を需要として使う（独自の採点関数を使う場合）
+    """
+    competition_weight = config.SITE_COMPETITION_WEIGHT if competition_weight is None else competition_weight
+    if demand is None:
+        demand = demand_scores(mesh_df, stations)
+    restaurants = mesh_df['飲食店数'].to_numpy(dtype=np.float64)
+
+    coverage = coverage_matrix(candidates['経度'].values, candidates['緯度'].values,
+                               mesh_df['中心_経度'].values, mesh_df['中心_緯度'].values,
+                               candidates['商圏半径m'].values)
+    competitors = np.asarray(coverage @ restaurants).ravel()
+    catchment_demand = np.asarray(coverage @ demand).ravel()
+    selected, gains, covered = lazy_greedy(coverage, demand, competition_weight * competitors, n_sites)
+
+    result = candidates.iloc[selected].reset_index(drop=True)
+    result.insert(0, '順位', np.arange(1, len(selected) + 1))
+    result['商圏メッシュ数'] = np.diff(coverage.indptr)[selected]
+    result['商圏需要'] = catchment_demand[selected]
+    result['新規カバー需要'] = covered
+    result['競合飲食店数'] = competitors[selected].astype(np.int64)
+    result['増分スコア'] = gains
+    result['累積スコア'] = np.cumsum(gains)
+    return result
+
+
+def save_sites(result: pd.DataFrame, out_dir: Path, name: str):
+    """選定結果を CSV と GeoJSON（点）で保存"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    csv_path = out_dir / f'{name}.csv'
+    result.to_csv(csv_path, index=False, encoding='utf-8-sig', float_format='%.3f')
+    print(f"  ✓ {csv_path}")
+
+    features = []
+    for rec in result.to_dict('records'):
+        props = {key: (value.item() if isinstance(value, np.generic) else value)
+                 for key, value in rec.items() if key not in ('経度', '緯度')}
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [round(rec['経度'], 6), round(rec['緯度'], 6)]},
+            'properties': props,
+        })
+    geojson_path = out_dir / f'{name}.geojson'
+    with open(geojson_path, 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f, ensure_ascii=False)
+    print(f"  ✓ {geojson_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='出店候補地の選定（最大カバー − 競合、遅延評価の貪欲法）')
+    parser.add_argument('--sites', type=int, default=config.SITE_COUNT, help='選ぶ箇所数 K')
+    parser.add_argument('--candidates', choices=['meshes', 'stations'], default='meshes')
+    parser.add_argument('--candidate-file', default=None, help='候補メッシュの CSV（mesh_code 列）')
+    parser.add_argument('--radius', type=float, default=None,
+                        help='商圏半径（m）。省略時はメッシュ候補は config.SITE_RADIUS_M、駅候補は乗降客数に応じた半径')
+    parser.add_argument('--k', type=int, default=config.N_CLUSTERS, help='--cluster で使う k')
+    parser.add_argument('--cluster', default=None, help='候補メッシュをクラスタで絞り込む（例: 2,5）')
+    parser.add_argument('--competition-weight', type=float, default=None, help='競合飲食店1件あたりの減点 λ')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    print("=" * 60)
+    print("出店候補地の選定")
+    print("=" * 60)
+
+    try:
+        print_section("1. データ読み込み")
+        if not Path(config.OUTPUT_MESH_RESULT_CSV).exists():
+            raise FileNotFoundError(
+                f"集計結果が見つかりません: {config.OUTPUT_MESH_RESULT_CSV}\n"
+                "先に 1_mesh_analysis.py を実行してください"
+            )
+        mesh_df = pd.read_csv(config.OUTPUT_MESH_RESULT_CSV, encoding='utf-8-sig')
+        stations = load_stations() if Path(config.STATIONS_GEOJSON).exists() else None
+        print(f"  ✓ メッシュ数: {len(mesh_df):,}")
+        if stations is not None:
+            print(f"  ✓ 駅数: {len(stations):,}")
+
+        if args.candidates == 'stations':
+            if stations is None:
+                raise FileNotFoundError(f"駅データが見つかりません: {config.STATIONS_GEOJSON}")
+            candidates = station_candidates(stations, args.radius)
+        else:
+            codes = None
+            if args.candidate_file:
+                codes = pd.read_csv(args.candidate_file, encoding='utf-8-sig')['mesh_code'].values
+            candidates = mesh_candidates(mesh_df, args.radius or config.SITE_RADIUS_M, args.k,
+                                         parse_list(args.cluster), codes)
+        if candidates.empty:
+            raise ValueError("候補がありません")
+        print(f"  ✓ 候補数: {len(candidates):,}（{args.candidates}）")
+
+        print_section(f"2. 選定（K={args.sites}）")
+        calc_start = time.time()
+        result = select_sites(mesh_df, candidates, args.sites, competition_weight=args.competition_weight,
+                              stations=stations)
+        print(f"  ✓ {len(result):,}箇所を選定 ({time.time() - calc_start:.2f}秒)")
+        if len(result) < args.sites:
+            print(f"  ⚠️ 増分スコアが正の候補が {len(result)} 箇所しかありません")
+        if len(result):
+            print(f"  累積スコア: {result['累積スコア'].iloc[-1]:,.1f}")
+            print(result.head(10)[['順位', '候補', '新規カバー需要', '競合飲食店数', '増分スコア']]
+                  .to_string(index=False))
+
+        print_section("3. 結果の保存")
+        save_sites(result, Path(config.SITE_OUTPUT_DIR), f'sites_{args.candidates}_{args.sites}')
+
+        print(f"\n✅ 完了 ({time.time() - start_time:.1f}秒)")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+空間的自己相関分析スクリプト
+飲食店数・飲食店密度について大域的 Moran's I と局所 LISA を計算し、
+有意なホットスポット／コールドスポットを web_data/ へ出力する
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+import mesh_grid
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+# LISA区分（esda と同じ番号付け）
+LISA_CLASSES = {
+    0: '有意差なし',
+    1: 'HH（ホットスポット）',
+    2: 'LH（低-高）',
+    3: 'LL（コールドスポット）',
+    4: 'HL（高-低）',
+}
+
+# 1チャンクで展開する並べ替え要素数の上限（メモリ使用量の目安）
+PERMUTATION_CHUNK_ELEMENTS = 4_000_000
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+def load_mesh_table():
+    """ステップ1の結果を読み込み、分析対象の変数を用意"""
+    print_section("1. データ読み込み")
+
+    if not Path(config.OUTPUT_MESH_RESULT_CSV).exists():
+        raise FileNotFoundError(
+            f"集計結果が見つかりません: {config.OUTPUT_MESH_RESULT_CSV}\n"
+            "先に 1_mesh_analysis.py を実行してください"
+        )
+
+    df = pd.read_csv(config.OUTPUT_MESH_RESULT_CSV, encoding='utf-8-sig')
+    if '飲食店密度' not in df.columns:
+        df['飲食店密度'] = df['飲食店数'] / (df['建物総数'] + 1e-6)
+
+    print(f"  ✓ メッシュ数: {len(df):,}")
+    return df
+
+
+def build_weights(mesh_codes):
+    """メッシュコードから queen 隣接（自身を除く3×3）の行標準化重みを作成"""
+    row, col = mesh_grid.decode_mesh_code(mesh_codes)
+    W = mesh_grid.build_adjacency(row, col, radius=1, kind='queen')
+    cardinality = np.diff(W.indptr)
+    return mesh_grid.row_standardize(W), cardinality
+
+
+def _pseudo_p(observed, simulated_ge, simulated_le, permutations):
+    """片側の擬似 p 値（観測値の符号側に折り返す）"""
+    larger = np.where(observed >= 0, simulated_ge, simulated_le)
+    return (larger + 1.0) / (permutations + 1.0)
+
+
+def moran_global(z: np.ndarray, W, permutations: int, rng: np.random.Generator):
+    """
+    大域的 Moran's I と並べ替え検定
+    z は平均0に中心化済みの値、W は行標準化済み重み
+    """
+    n = z.size
+    s0 = W.sum()
+    denom = float(z @ z)
+    I = n / s0 * float(z @ (W @ z)) / denom
+    expected = -1.0 / (n - 1)
+
+    # 並べ替えをまとめて行列化し、疎行列積1回で評価
+    batch = max(1, PERMUTATION_CHUNK_ELEMENTS // max(n, 1))
+    sims = []
+    for start in range(0, permutations, batch):
+        size = min(batch, permutations - start)
+        Z = np.column_stack([rng.permutation(z) for _ in range(size)])
+        sims.append(n / s0 * np.einsum('ij,ij->j', Z, W @ Z) / denom)
+    sims = np.concatenate(sims) if sims else np.empty(0)
+
+    if I >= expected:
+        larger = int((sims >= I).sum())
+    else:
+        larger = int((sims <= I).sum())
+    p_sim = (larger + 1.0) / (permutations + 1.0)
+    z_sim = (I - sims.mean()) / sims.std() if sims.size and sims.std() > 0 else np.nan
+
+    return {'I': I, 'EI': expected, 'p_sim': p_sim, 'z_sim': float(z_sim)}
+
+
+def lisa(z: np.ndarray, W, cardinality: np.ndarray, permutations: int,
+         rng: np.random.Generator):
+    """
+    局所 Moran's I（LISA）と条件付き並べ替え検定
+
+    メッシュ i の値を固定し、残り n-1 個から近傍数 k_i 個を非復元抽出して
+    空間ラグを作り直す。乱数インデックス表 (並べ替え回数 × 最大近傍数) を全メッシュで共有し、
+    i 以上のインデックスを1つずらすことで自分自身を除外する（esda と同じ方式）。
+    近傍数が同じメッシュをまとめ、(チャンク × 並べ替え × k) の配列で一括計算する。
+    """
+    n = z.size
+    m2 = float(z @ z) / n
+    lag = np.asarray(W @ z).ravel()
+    local_I = z * lag / m2
+
+    max_k = int(cardinality.max()) if n else 0
+    rids = np.empty((permutations, max_k), dtype=np.int64)
+    for p in range(permutations):
+        rids[p] = rng.choice(n - 1, size=max_k, replace=False)
+
+    n_ge = np.zeros(n)
+    n_le = np.zeros(n)
+    for k in np.unique(cardinality):
+        if k == 0:
+            continue
+        members = np.flatnonzero(cardinality == k)
+        base = rids[None, :, :k]
+        chunk = max(1, PERMUTATION_CHUNK_ELEMENTS // (permutations * int(k)))
+        for start in range(0, members.size, chunk):
+            idx_i = members[start:start + chunk]
+            idx = base + (base >= idx_i[:, None, None])
+            I_perm = z[idx_i, None] * z[idx].mean(axis=2) / m2   # (チャンク, 並べ替え)
+            n_ge[idx_i] = (I_perm >= local_I[idx_i, None]).sum(axis=1)
+            n_le[idx_i] = (I_perm <= local_I[idx_i, None]).sum(axis=1)
+
+    # 観測値が期待値（≒0）より大きければ上側、小さければ下側で数える
+    p_sim = _pseudo_p(local_I, n_ge, n_le, permutations)
+    p_sim[cardinality == 0] = np.nan
+
+    return local_I, lag, p_sim
+
+
+def classify_lisa(z: np.ndarray, lag: np.ndarray, p_sim: np.ndarray, alpha: float):
+    """象限（HH/LH/LL/HL）と有意性から LISA 区分を決定"""
+    quadrant = np.select(
+        [(z > 0) & (lag > 0), (z <= 0) & (lag > 0), (z <= 0) & (lag <= 0), (z > 0) & (lag <= 0)],
+        [1, 2, 3, 4],
+        default=0
+    )
+    significant = np.nan_to_num(p_sim, nan=1.0) <= alpha
+    return np.where(significant, quadrant, 0)
+
+
+def run_analysis(df: pd.DataFrame):
+    """各変数について Moran's I と LISA を計算"""
+    print_section("2. 空間重み行列の作成")
+    start_time = time.time()
+    W, cardinality = build_weights(df['mesh_code'].values)
+    print(f"  ✓ 非ゼロ要素数: {W.nnz:,} ({time.time() - start_time:.1f}秒)")
+    print(f"  ✓ 孤立メッシュ（近傍なし）: {int((cardinality == 0).sum()):,}")
+
+    rng = np.random.default_rng(config.RANDOM_STATE)
+    permutations = config.LISA_PERMUTATIONS
+
+    lisa_df = pd.DataFrame({'mesh_code': df['mesh_code'].values})
+    global_results = {}
+
+    for var in config.LISA_VARIABLES:
+        print_section(f"3. {var} の空間的自己相関（並べ替え {permutations}回）")
+        start_time = time.time()
+
+        x = df[var].fillna(0).values.astype(np.float64)
+        z = x - x.mean()
+        if not np.any(z):
+            print("  ⚠️ 値が一定のためスキップします")
+            continue
+
+        g = moran_global(z, W, permutations, rng)
+        global_results[var] = g
+        print(f"  Moran's I = {g['I']:.4f} (E[I] = {g['EI']:.5f}, p = {g['p_sim']:.4f}, z = {g['z_sim']:.2f})")
+
+        local_I, lag, p_sim = lisa(z, W, cardinality, permutations, rng)
+        classes = classify_lisa(z, lag, p_sim, config.LISA_SIGNIFICANCE)
+
+        lisa_df[f'{var}_LISA_I'] = local_I
+        lisa_df[f'{var}_LISA_p'] = p_sim
+        lisa_df[f'{var}_LISA区分'] = classes
+        lisa_df[f'{var}_LISA区分名'] = pd.Series(classes).map(LISA_CLASSES).values
+
+        elapsed = time.time() - start_time
+        print(f"  ✓ LISA計算完了 ({elapsed:.1f}秒)")
+        for code, name in LISA_CLASSES.items():
+            print(f"    {name}: {int((classes == code).sum()):,}メッシュ")
+
+    return lisa_df, global_results
+
+
+def save_results(lisa_df: pd.DataFrame, global_results: dict):
+    """結果を output/ と web_data/ に保存"""
+    print_section("4. 結果の保存")
+
+    out_dir = Path(config.LISA_OUTPUT_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    csv_path = out_dir / 'lisa_results.csv'
+    lisa_df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+    print(f"  ✓ {csv_path}")
+
+    json_path = out_dir / 'moran_global.json'
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(global_results, f, ensure_ascii=False, indent=2)
+    print(f"  ✓ {json_path}")
+
+    # 地図レイヤー用: いずれかの変数で有意なメッシュのみ出力
+    class_cols = [c for c in lisa_df.columns if c.endswith('_LISA区分')]
+    if not class_cols:
+        return
+    significant = lisa_df[(lisa_df[class_cols] > 0).any(axis=1)]
+
+    mesh_gdf = gpd.read_file(config.OUTPUT_MESH_RESULT_GEOJSON)[['mesh_code', 'geometry']]
+    mesh_gdf['mesh_code'] = mesh_gdf['mesh_code'].astype(np.int64)
+    keep_cols = ['mesh_code'] + [c for c in significant.columns if c.endswith(('_LISA区分', '_LISA区分名', '_LISA_p'))]
+    hotspot_gdf = mesh_gdf.merge(significant[keep_cols], on='mesh_code', how='inner')
+
+    web_dir = Path(config.WEB_DATA_DIR)
+    web_dir.mkdir(exist_ok=True)
+    geojson_path = web_dir / 'lisa_hotspots.geojson'
+    hotspot_gdf.to_crs(epsg=4326).to_file(geojson_path, driver='GeoJSON')
+    print(f"  ✓ {geojson_path} ({len(hotspot_gdf):,}メッシュ)")
+
+
+def main():
+    start_time = time.time()
+
+    print("=" * 60)
+    print("空間的自己相関分析（Moran's I / LISA）")
+    print("=" * 60)
+
+    try:
+        df = load_mesh_table()
+        lisa_df, global_results = run_analysis(df)
+        save_results(lisa_df, global_results)
+
+        elapsed = time.time() - start_time
+        print_section("処理完了")
+        print(f"  総処理時間: {elapsed:.1f}秒")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
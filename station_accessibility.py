@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+駅アクセシビリティ計算スクリプト
+各メッシュ中心から最寄 k 駅までの距離と、乗降客数で重み付けした
+重力モデルのアクセシビリティ指標を KD-tree で計算する
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+import mesh_grid
+
+# 設定ファイルのインポート
+try:
+    import config
+except ImportError:
+    print("❌ config.py が見つかりません")
+    sys.exit(1)
+
+
+def print_section(title):
+    """セクションタイトルを表示"""
+    print(f"\n{'=' * 60}")
+    print(f"{title}")
+    print('=' * 60)
+
+
+def load_stations(path=None, ridership_col=None, merge_distance_m=None) -> pd.DataFrame:
+    """
+    stations.geojson を読み込み、同じ駅を1点へまとめる
+    - 駅コードが同じ地物（ホーム形状が分かれた駅）は1駅。乗降客数は最大値（片方が0の重複地物があるため）
+    - 駅名が同じで merge_distance_m 未満の駅（路線・事業者違いの乗換駅）は1点にまとめ、乗降客数は合計
+    - 位置: ホーム形状（MultiLineString）の頂点平均（まとめた駅はその平均）
+    同名でも離れた駅（日田彦山線と小倉線の志井など）は別の駅として残す。
+    駅コード列はまとめた駅コードのカンマ区切り
+    """
+    path = Path(path or config.STATIONS_GEOJSON)
+    ridership_col = ridership_col or config.STATION_RIDERSHIP_COLUMN
+    if merge_distance_m is None:
+        merge_distance_m = config.STATION_MERGE_DISTANCE_M
+
+    with open(path, encoding='utf-8') as f:
+        features = json.load(f)['features']
+
+    records = []
+    for feat in features:
+        props = feat['properties']
+        geom = feat['geometry']
+        coords = geom['coordinates']
+        if geom['type'] == 'MultiLineString':
+            coords = [pt for line in coords for pt in line]
+        elif geom['type'] == 'Point':
+            coords = [coords]
+        xy = np.asarray(coords, dtype=np.float64)
+        records.append({
+            '駅名': props.get('駅名'),
+            '駅コード': str(props.get('駅コード') or f'#{len(records)}'),
+            '経度': xy[:, 0].mean(),
+            '緯度': xy[:, 1].mean(),
+            '乗降客数': float(props.get(ridership_col) or 0.0),
+        })
+
+    stations = pd.DataFrame(records).groupby(['駅名', '駅コード'], as_index=False).agg(
+        経度=('経度', 'mean'), 緯度=('緯度', 'mean'), 乗降客数=('乗降客数', 'max')
+    )
+
+    # 同名で近い駅の組を連結成分にまとめる
+    x, y = mesh_grid.project_xy(stations['経度'].values, stations['緯度'].values,
+                                float(np.mean(stations['緯度'])))
+    pairs = cKDTree(np.column_stack([x, y])).query_pairs(r=merge_distance_m, output_type='ndarray')
+    names = stations['駅名'].to_numpy()
+    pairs = pairs[names[pairs[:, 0]] == names[pairs[:, 1]]]
+    n = len(stations)
+    graph = sp.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, group = connected_components(graph, directed=False)
+
+    stations = stations.groupby(group, sort=False).agg(
+        駅名=('駅名', 'first'), 駅コード=('駅コード', ','.join),
+        経度=('経度', 'mean'), 緯度=('緯度', 'mean'), 乗降客数=('乗降客数', 'sum')
+    )
+    return stations.sort_values(['駅名', '駅コード']).reset_index(drop=True)
+
+
+def station_mask(stations: pd.DataFrame, key: str) -> np.ndarray:
+    """駅名または駅コードに一致する駅（同名の離れた駅はすべて一致する）"""
+    key = str(key)
+    codes = stations['駅コード'].fillna('').astype(str).str.split(',')
+    return ((stations['駅名'] == key) | codes.apply(lambda c: key in c)).to_numpy()
+
+
+def compute_accessibility(lon: np.ndarray, lat: np.ndarray, stations: pd.DataFrame,
+                          lat0: float = None) -> pd.DataFrame:
+    """
+    メッシュ中心（経度・緯度）ごとの最寄駅距離と重力モデル指標を計算
+    駅・メッシュとも同じ基準緯度で平面座標（m）に変換してから KD-tree で検索する
+    """
+    if lat0 is None:
+        lat0 = float(np.mean(stations['緯度']))
+    sx, sy = mesh_grid.project_xy(stations['経度'].values, stations['緯度'].values, lat0)
+    mx, my = mesh_grid.project_xy(lon, lat, lat0)
+    tree = cKDTree(np.column_stack([sx, sy]))
+    points = np.column_stack([mx, my])
+
+    n_stations = len(stations)
+    k_near = min(config.STATION_NEAREST_K, n_stations)
+    k_grav = min(max(config.STATION_GRAVITY_K, k_near), n_stations)
+
+    dist, idx = tree.query(points, k=k_grav)
+    dist = dist.reshape(len(points), -1)
+    idx = idx.reshape(len(points), -1)
+
+    result = pd.DataFrame(index=np.arange(len(points)))
+    for i in range(k_near):
+        result[f'最寄駅{i + 1}_距離m'] = dist[:, i]
+    result['最寄駅名'] = stations['駅名'].values[idx[:, 0]]
+
+    ridership = stations['乗降客数'].values[idx]
+    result['駅アクセス指標'] = (ridership * np.exp(-dist / config.STATION_GRAVITY_DECAY_M)).sum(axis=1)
+    return result
+
+
+def main():
+    start_time = time.time()
+
+    print("=" * 60)
+    print("駅アクセシビリティ計算")
+    print("=" * 60)
+
+    try:
+        print_section("1. データ読み込み")
+        if not Path(config.OUTPUT_MESH_RESULT_CSV).exists():
+            raise FileNotFoundError(
+                f"集計結果が見つかりません: {config.OUTPUT_MESH_RESULT_CSV}\n"
+                "先に 1_mesh_analysis.py を実行してください"
+            )
+        mesh_df = pd.read_csv(config.OUTPUT_MESH_RESULT_CSV, encoding='utf-8-sig',
+                              usecols=['mesh_code', '中心_経度', '中心_緯度'])
+        stations = load_stations()
+        print(f"  ✓ メッシュ数: {len(mesh_df):,}")
+        print(f"  ✓ 駅数（同名駅を統合）: {len(stations):,}")
+        print(f"  ✓ 乗降客数の列: {config.STATION_RIDERSHIP_COLUMN}")
+
+        print_section("2. 最寄駅距離・アクセシビリティ指標")
+        calc_start = time.time()
+        access_df = compute_accessibility(mesh_df['中心_経度'].values, mesh_df['中心_緯度'].values, stations)
+        access_df.insert(0, 'mesh_code', mesh_df['mesh_code'].values)
+        print(f"  ✓ 計算完了 ({time.time() - calc_start:.2f}秒)")
+        print(f"  最寄駅距離（中央値）: {access_df['最寄駅1_距離m'].median():,.0f} m")
+
+        print_section("3. 結果の保存")
+        access_df.to_csv(config.STATION_ACCESSIBILITY_CSV, index=False, encoding='utf-8-sig',
+                         float_format='%.1f')
+        print(f"  ✓ {config.STATION_ACCESSIBILITY_CSV}")
+
+        elapsed = time.time() - start_time
+        print_section("処理完了")
+        print(f"  総処理時間: {elapsed:.1f}秒")
+
+    except Exception as e:
+        print(f"\n❌ エラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
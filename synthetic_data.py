@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成データ生成（ベンチマーク・検証用）
+実データと同じ形式の入力一式を作る:
+    data/mesh_shapefiles/synthetic/mesh.shp     250mメッシュ（KEY_CODE）
+    data/building_centroid_all.geojson          建物重心点（usage, cx, cy）
+    data/fukuoka_40100_food_business_all.csv    飲食店（緯度・経度・業種、重複行を含む）
+
+使い方:
+    python synthetic_data.py /tmp/bench --buildings 200000
+"""
+import argparse
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely import box
+
+import mesh_grid
+
+# 生成する建物用途コードと出現比率（'461' は集計対象外の用途）
+USAGE_CODES = ['421', '412', '411', '402', '422', '401', '404', '413', '414', '403', '461']
+USAGE_WEIGHTS = [0.01, 0.2, 0.5, 0.08, 0.03, 0.06, 0.01, 0.03, 0.02, 0.01, 0.05]
+
+FOOD_CATEGORIES = ['飲食店営業（一般食堂）', '喫茶店営業', '飲食店営業（居酒屋）', '飲食店営業（ラーメン）', '菓子製造業']
+
+# 生成範囲の南西端（福岡市付近）
+ORIGIN_LON = 130.30
+ORIGIN_LAT = 33.55
+
+
+def generate(out_dir, n_buildings: int = 200000, rows: int = 60, cols: int = 80,
+             n_centers: int = 12, food_ratio: int = 20, n_duplicates: int = 50, seed: int = 0):
+    """
+    out_dir/data に合成入力を書き出す
+    建物・飲食店は n_centers 個の中心の周りに正規分布で集積させる
+    """
+    rng = np.random.default_rng(seed)
+    data_dir = Path(out_dir) / 'data'
+    (data_dir / 'mesh_shapefiles' / 'synthetic').mkdir(parents=True, exist_ok=True)
+
+    # メッシュ（rows × cols の格子）
+    r0, c0 = mesh_grid.lonlat_to_cell(ORIGIN_LON, ORIGIN_LAT)
+    rr, cc = np.meshgrid(np.arange(r0, r0 + rows), np.arange(c0, c0 + cols), indexing='ij')
+    rr, cc = rr.ravel(), cc.ravel()
+    codes = mesh_grid.encode_mesh_code(rr, cc)
+    min_x = 100.0 + cc * mesh_grid.CELL_LON_DEG
+    min_y = rr * mesh_grid.CELL_LAT_DEG
+    mesh = gpd.GeoDataFrame(
+        {'KEY_CODE': codes.astype(str)},
+        geometry=box(min_x, min_y, min_x + mesh_grid.CELL_LON_DEG, min_y + mesh_grid.CELL_LAT_DEG),
+        crs='EPSG:4326'
+    )
+    mesh.to_file(data_dir / 'mesh_shapefiles' / 'synthetic' / 'mesh.shp')
+
+    lon0, lat0 = 100.0 + c0 * mesh_grid.CELL_LON_DEG, r0 * mesh_grid.CELL_LAT_DEG
+    lon1, lat1 = lon0 + cols * mesh_grid.CELL_LON_DEG, lat0 + rows * mesh_grid.CELL_LAT_DEG
+    centers = rng.uniform([lon0, lat0], [lon1, lat1], size=(n_centers, 2))
+
+    # 建物
+    pts = centers[rng.integers(0, n_centers, n_buildings)] + rng.normal(0, 0.02, (n_buildings, 2))
+    inside = (pts[:, 0] > lon0) & (pts[:, 0] < lon1) & (pts[:, 1] > lat0) & (pts[:, 1] < lat1)
+    pts = pts[inside]
+    weights = np.asarray(USAGE_WEIGHTS) / np.sum(USAGE_WEIGHTS)
+    buildings = pd.DataFrame({
+        'usage': rng.choice(USAGE_CODES, len(pts), p=weights),
+        'cx': pts[:, 0],
+        'cy': pts[:, 1],
+    })
+    gpd.GeoDataFrame(buildings, geometry=gpd.points_from_xy(buildings['cx'], buildings['cy']),
+                     crs='EPSG:4326').to_file(data_dir / 'building_centroid_all.geojson', driver='GeoJSON')
+
+    # 飲食店（一部の中心に集中させ、末尾に重複行を加える）
+    n_food = n_buildings // food_ratio
+    fp = centers[rng.integers(0, min(4, n_centers), n_food)] + rng.normal(0, 0.01, (n_food, 2))
+    food = pd.DataFrame({
+        '営業者名': [f'店{i}' for i in range(n_food)],
+        '業種': rng.choice(FOOD_CATEGORIES, n_food),
+        '住所': '福岡市',
+        '緯度': fp[:, 1],
+        '経度': fp[:, 0],
+    })
+    food = pd.concat([food, food.iloc[:n_duplicates]], ignore_index=True)
+    food.to_csv(data_dir / 'fukuoka_40100_food_business_all.csv', index=False, encoding='utf-8-sig')
+
+    return {'meshes': len(codes), 'buildings': len(buildings), 'food': len(food)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成入力データの生成')
+    parser.add_argument('out_dir', help='出力先（この下に data/ を作る）')
+    parser.add_argument('--buildings', type=int, default=200000, help='生成する建物数（範囲外は除く）')
+    parser.add_argument('--rows', type=int, default=60, help='メッシュ格子の行数')
+    parser.add_argument('--cols', type=int, default=80, help='メッシュ格子の列数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    counts = generate(args.out_dir, args.buildings, args.rows, args.cols, seed=args.seed)
+    print(f"✓ メッシュ: {counts['meshes']:,}, 建物: {counts['buildings']:,}, 飲食店: {counts['food']:,}")
+
+
+if __name__ == '__main__':
+    main()